@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Бенчмарки MediaProcessor на синтетических файлах
+
+Корпус генерируется ffmpeg (lavfi) с фиксированными параметрами, поэтому
+прогоны на разных коммитах сравнимы. Каждый замер выполняется в отдельном
+процессе: пиковая память (RSS) одного замера не влияет на другой.
+
+Примеры:
+    python benchmarks/run_benchmarks.py                    # быстрый профиль
+    python benchmarks/run_benchmarks.py --profile full     # до 60 минут медиа
+    python benchmarks/run_benchmarks.py --compare old.json new.json
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import subprocess
+import multiprocessing
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+from ffmpeg_tools import FFMPEG_BINARY, spawned_count  # noqa: E402
+
+CORPUS_DIR = os.path.join(BENCH_DIR, '.corpus')
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+
+# Синтетическая "речь": тон с плавающей частотой и паузами (для нарезки по тишине)
+SPEECH_EXPR = "0.6*sin(2*PI*(180+40*sin(2*PI*3*t))*t)*gt(sin(2*PI*0.4*t),-0.3)"
+
+# Файлы корпуса: имя -> (тип, длительность в сек, разрешение, наличие звука, генератор звука)
+CORPUS = {
+    'tone_5s': ('audio', 5, None, True, 'tone'),
+    'speech_30s': ('audio', 30, None, True, 'speech'),
+    'speech_2m': ('audio', 120, None, True, 'speech'),
+    'speech_10m': ('audio', 600, None, True, 'speech'),
+    'speech_60m': ('audio', 3600, None, True, 'speech'),
+    'video_240p_5s': ('video', 5, '320x240', True, 'speech'),
+    'video_360p_30s': ('video', 30, '640x360', True, 'speech'),
+    'video_720p_2m': ('video', 120, '1280x720', True, 'speech'),
+    'video_1080p_1m': ('video', 60, '1920x1080', True, 'speech'),
+    'video_360p_10m': ('video', 600, '640x360', True, 'speech'),
+    'video_360p_60m': ('video', 3600, '640x360', True, 'speech'),
+    'video_720p_noaudio_30s': ('video', 30, '1280x720', False, None),
+}
+
+PROFILES = {
+    'quick': ['tone_5s', 'speech_30s', 'speech_2m', 'video_240p_5s', 'video_360p_30s',
+              'video_720p_2m', 'video_720p_noaudio_30s'],
+    'full': list(CORPUS),
+}
+
+# Операции: имя -> (метод MediaProcessor, типы файлов)
+OPERATIONS = {
+    'extract_audio_from_video': ('video',),
+    'convert_audio_to_text': ('audio', 'video'),
+    'compress_video_for_user': ('video',),
+    'compress_video_for_processing': ('video',),
+    # Текст и сжатое видео из одного запуска ffmpeg (MediaGraph)
+    'video_to_text_and_compress': ('video',),
+}
+
+
+def audio_source(generator: str, duration: int) -> str:
+    if generator == 'tone':
+        return f"sine=frequency=440:sample_rate=44100:duration={duration}"
+    return f"aevalsrc=exprs='{SPEECH_EXPR}':sample_rate=44100:duration={duration}"
+
+
+def generate(name: str) -> str:
+    """Создает файл корпуса (если его еще нет) и возвращает путь"""
+    kind, duration, size, has_audio, generator = CORPUS[name]
+    path = os.path.join(CORPUS_DIR, name + ('.mp3' if kind == 'audio' else '.mp4'))
+    if os.path.exists(path):
+        return path
+    os.makedirs(CORPUS_DIR, exist_ok=True)
+    print(f"🎛 Генерирую {name} ({duration} сек)...", file=sys.stderr)
+
+    command = [FFMPEG_BINARY, '-hide_banner', '-loglevel', 'error', '-y']
+    if kind == 'audio':
+        command += ['-f', 'lavfi', '-i', audio_source(generator, duration), '-c:a', 'libmp3lame', '-b:a', '128k']
+    else:
+        command += ['-f', 'lavfi', '-i', f"testsrc2=size={size}:rate=25:duration={duration}"]
+        if has_audio:
+            command += ['-f', 'lavfi', '-i', audio_source(generator, duration), '-c:a', 'aac', '-b:a', '128k']
+        command += ['-c:v', 'libx264', '-preset', 'ultrafast', '-pix_fmt', 'yuv420p', '-movflags', '+faststart']
+    tmp_path = path + '.part'
+    subprocess.run(command + ['-f', 'mp3' if kind == 'audio' else 'mp4', tmp_path], check=True)
+    os.replace(tmp_path, path)
+    return path
+
+
+def _usage() -> tuple:
+    """(CPU секунды процесса, CPU секунды детей, пиковый RSS процесса, детей) в байтах"""
+    if resource is None:
+        return time.process_time(), 0.0, 0, 0
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    # ru_maxrss: килобайты в Linux, байты в macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return (
+        own.ru_utime + own.ru_stime,
+        children.ru_utime + children.ru_stime,
+        own.ru_maxrss * scale,
+        children.ru_maxrss * scale
+    )
+
+
+def run_case(operation: str, path: str, duration: float) -> dict:
+    """Выполняет одну операцию (в отдельном процессе) и возвращает замеры"""
+    import logging
+    logging.disable(logging.CRITICAL)
+    from media_processor import MediaProcessor
+    from workspace import JobWorkspace
+
+    processor = MediaProcessor(recognition_backend='stub')
+    workspace = JobWorkspace(prefix='bench_')
+    cpu_start, child_start, _, _ = _usage()
+    spawned_start = spawned_count()
+    started = time.perf_counter()
+    error = None
+    try:
+        if operation == 'extract_audio_from_video':
+            processor.extract_audio_from_video(path, workspace=workspace)
+        elif operation == 'convert_audio_to_text':
+            text = processor.convert_audio_to_text(path)
+            if text.startswith('❌'):
+                error = text
+        elif operation == 'compress_video_for_user':
+            processor.compress_video_for_user(path, workspace=workspace, duration=duration)
+        elif operation == 'compress_video_for_processing':
+            # Порог 1 MB, чтобы сжатие выполнялось для всех файлов корпуса
+            processor.compress_video_for_processing(path, max_size_mb=1, workspace=workspace, duration=duration)
+        elif operation == 'video_to_text_and_compress':
+            result = processor.process_video_to_text(
+                path, workspace=workspace, keep_input=True, compress_target_mb=2, duration=duration
+            )
+            error = result.get('error')
+    except Exception as e:
+        error = str(e)
+    finally:
+        workspace.cleanup()
+
+    wall = time.perf_counter() - started
+    cpu_end, child_end, peak_rss, peak_child_rss = _usage()
+    cpu = (cpu_end - cpu_start) + (child_end - child_start)
+    media_minutes = duration / 60
+    return {
+        'wall_seconds': round(wall, 3),
+        'cpu_seconds': round(cpu, 3),
+        'cpu_seconds_per_media_minute': round(cpu / media_minutes, 3),
+        'media_seconds_per_second': round(duration / wall, 2) if wall else None,
+        'input_mb_per_second': round(os.path.getsize(path) / (1024 * 1024) / wall, 2) if wall else None,
+        'peak_rss_mb': round(peak_rss / (1024 * 1024), 1),
+        'peak_ffmpeg_rss_mb': round(peak_child_rss / (1024 * 1024), 1),
+        'subprocesses': spawned_count() - spawned_start,
+        'error': error
+    }
+
+
+def measure(operation: str, path: str, duration: float) -> dict:
+    """Запускает замер в свежем процессе"""
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(1, maxtasksperchild=1) as pool:
+        return pool.apply(run_case, (operation, path, duration))
+
+
+def median_result(runs: list) -> dict:
+    """Медиана числовых полей по повторам"""
+    result = dict(runs[0])
+    for key, value in runs[0].items():
+        if isinstance(value, (int, float)):
+            values = sorted(run[key] for run in runs)
+            result[key] = values[len(values) // 2]
+    return result
+
+
+def environment() -> dict:
+    """Коммит и окружение, чтобы прогоны можно было сравнивать"""
+    def git(*args):
+        try:
+            return subprocess.run(['git', *args], cwd=ROOT_DIR, capture_output=True, text=True).stdout.strip()
+        except OSError:
+            return ''
+
+    ffmpeg_version = subprocess.run(
+        [FFMPEG_BINARY, '-version'], capture_output=True, text=True
+    ).stdout.split('\n')[0]
+    return {
+        'commit': git('rev-parse', 'HEAD'),
+        'dirty': bool(git('status', '--porcelain', '--untracked-files=no')),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'ffmpeg': ffmpeg_version
+    }
+
+
+def run(profile: str, repeat: int, operations: list) -> dict:
+    report = {'profile': profile, 'repeat': repeat, **environment(), 'results': []}
+    for name in PROFILES[profile]:
+        kind, duration = CORPUS[name][0], CORPUS[name][1]
+        path = generate(name)
+        for operation in operations:
+            if kind not in OPERATIONS[operation]:
+                continue
+            runs = [measure(operation, path, duration) for _ in range(repeat)]
+            result = {'file': name, 'operation': operation, 'media_seconds': duration, **median_result(runs)}
+            report['results'].append(result)
+            print(
+                f"{name:24} {operation:30} {result['wall_seconds']:8.2f} сек  "
+                f"{result['cpu_seconds_per_media_minute']:7.2f} CPU-сек/мин  "
+                f"{result['peak_rss_mb']:7.1f} MB  {result['subprocesses']} ffmpeg" + (f"  ❌ {result['error'][:60]}" if result['error'] else ''),
+                file=sys.stderr
+            )
+    return report
+
+
+def compare(old_path: str, new_path: str):
+    """Печатает изменение времени и CPU между двумя прогонами"""
+    with open(old_path, encoding='utf-8') as f:
+        old = json.load(f)
+    with open(new_path, encoding='utf-8') as f:
+        new = json.load(f)
+
+    old_results = {(r['file'], r['operation']): r for r in old['results']}
+    print(f"{old['commit'][:10]} -> {new['commit'][:10]}")
+    for result in new['results']:
+        before = old_results.get((result['file'], result['operation']))
+        if before is None:
+            continue
+        changes = []
+        for key in ('wall_seconds', 'cpu_seconds_per_media_minute', 'peak_rss_mb'):
+            if before[key]:
+                changes.append(f"{key}: {(result[key] / before[key] - 1) * 100:+.1f}%")
+        print(f"{result['file']:24} {result['operation']:30} " + '  '.join(changes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарки MediaProcessor")
+    parser.add_argument('--profile', choices=list(PROFILES), default='quick')
+    parser.add_argument('--repeat', type=int, default=3, help="Повторов каждого замера (берется медиана)")
+    parser.add_argument('--operation', action='append', choices=list(OPERATIONS),
+                        help="Запустить только эти операции")
+    parser.add_argument('--output', help="Файл для JSON (по умолчанию benchmarks/results/<commit>_<profile>.json)")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help="Сравнить два прогона")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    report = run(args.profile, args.repeat, args.operation or list(OPERATIONS))
+    output = args.output or os.path.join(RESULTS_DIR, f"{report['commit'][:10] or 'nogit'}_{args.profile}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    print(f"📄 Результаты сохранены: {output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,34 @@
+import asyncio
 import logging
 import os
-import tempfile
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, BufferedInputFile
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters, ContextTypes
-from config import BOT_TOKEN, MAX_FILE_SIZE, LOG_LEVEL, DEBUG
-from media_processor import MediaProcessor
+from config import (
+    BOT_TOKEN, MAX_FILE_SIZE, LOG_LEVEL, DEBUG,
+    MAX_CONCURRENT_JOBS, RECOGNITION_LANGUAGE,
+    TRANSCRIPT_CACHE_PATH, TRANSCRIPT_CACHE_MAX_BYTES, MAX_QUEUE_DEPTH, JOB_AGING_FACTOR,
+    BOT_MODE, CONCURRENT_UPDATES, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_URL, WEBHOOK_PATH,
+    WEBHOOK_SECRET, PROCESSING_MODE, BROKER_PATH, JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS,
+    BROKER_POLL_INTERVAL, METRICS_PORT, SCRATCH_DIR, INGEST_RAM_DIR,
+    BOT_API_BASE_URL, BOT_API_BASE_FILE_URL, BOT_API_LOCAL_MODE, MAX_DOWNLOAD_SIZE, AUTO_DELETE_TEMP_FILES, CLEANUP_INTERVAL, PREWARM,
+    TRANSCRIPT_DOCUMENT_THRESHOLD, RECOGNITION_BACKEND, VOSK_MODEL_PATH
+)
+import metrics
+from broker import SQLiteBroker
+from cleanup import TempJanitor
+from job_scheduler import JobScheduler, QueueFullError, estimate_cost
+from ffmpeg_tools import max_duration_for_size
+from pipeline import MediaPipeline, COMPRESSED_VIDEO_TARGET_MB, compressed_video_caption
+from progress import ProgressReporter
+from rate_limiter import FloodControlLimiter
+from recognition import get_backend_class
+from transcript_cache import TranscriptCache
+from transcript_delivery import (
+    TranscriptWriter, CAPTION_LIMIT, MESSAGE_LIMIT, TRANSCRIPT_HEADING, split_text,
+    send_transcript_files
+)
+from update_processor import PerChatUpdateProcessor
+from uploads import reply_media
 
 # Настройка логирования
 log_level = getattr(logging, LOG_LEVEL.upper(), logging.INFO)
@@ -16,10 +40,304 @@ logger = logging.getLogger(__name__)
 
 class TelegramBot:
     def __init__(self):
-        self.application = Application.builder().token(BOT_TOKEN).build()
-        self.media_processor = MediaProcessor()
+        builder = (
+            Application.builder()
+            .token(BOT_TOKEN)
+            # Обновления разных чатов обрабатываются параллельно, одного чата - по порядку
+            .concurrent_updates(PerChatUpdateProcessor(CONCURRENT_UPDATES))
+            # Все исходящие запросы проходят через лимиты Telegram, прогресс отбрасывается первым
+            .rate_limiter(FloodControlLimiter())
+            .post_init(self.post_init)
+            .post_shutdown(self.post_shutdown)
+        )
+        if BOT_API_BASE_URL:
+            builder = builder.base_url(BOT_API_BASE_URL)
+        if BOT_API_BASE_FILE_URL:
+            builder = builder.base_file_url(BOT_API_BASE_FILE_URL)
+        if BOT_API_LOCAL_MODE:
+            builder = builder.local_mode(True)
+        self.application = builder.build()
+        if PROCESSING_MODE == 'broker':
+            # Обработкой занимаются медиа-воркеры, бот только ставит задачи в брокер
+            self.pipeline = None
+            self.broker = SQLiteBroker(BROKER_PATH, lease_seconds=JOB_LEASE_SECONDS, max_attempts=JOB_MAX_ATTEMPTS)
+            self.remote_jobs = {}
+            self.results_task = None
+            scheduler_workers = MAX_QUEUE_DEPTH
+        else:
+            # Скачивание и обработка в пуле воркеров этого процесса
+            self.pipeline = MediaPipeline()
+            self.broker = None
+            scheduler_workers = MAX_CONCURRENT_JOBS
+        # Очередь задач: ограниченное число задач одновременно, короткие - первыми,
+        # задачи одного чата - в порядке поступления
+        self.scheduler = JobScheduler(
+            workers=scheduler_workers,
+            max_queue_depth=MAX_QUEUE_DEPTH,
+            aging_factor=JOB_AGING_FACTOR
+        )
+        # Кэш распознанного текста для повторно пересылаемых файлов
+        self.transcript_cache = TranscriptCache(
+            TRANSCRIPT_CACHE_PATH, TRANSCRIPT_CACHE_MAX_BYTES,
+            engine=get_backend_class(RECOGNITION_BACKEND).cache_key(model_path=VOSK_MODEL_PATH)
+        )
+        # Файлы, задачи распознавания которых стоят в очереди или выполняются
+        self.queued_media = {}
+        # Фоновая очистка временных файлов (в режиме broker файлы создают медиа-воркеры)
+        self.janitor = None
+        self.prewarm_task = None
+        if AUTO_DELETE_TEMP_FILES and self.pipeline is not None:
+            if self.application.job_queue is None:
+                logger.warning("⚠️ job_queue недоступна (pip install \"python-telegram-bot[job-queue]\"), очистка отключена")
+            else:
+                self.janitor = TempJanitor()
+                self.application.job_queue.run_repeating(
+                    self.cleanup_temp_files, interval=CLEANUP_INTERVAL, first=1, name='cleanup_temp_files'
+                )
         self.setup_handlers()
     
+    async def transcribe(self, media, context: ContextTypes.DEFAULT_TYPE, kind: str, message=None,
+                         progress: ProgressReporter = None, transcript: TranscriptWriter = None) -> dict:
+        """
+        Преобразует речь из файла Telegram в текст с использованием кэша
+        
+        Args:
+            media: Объект файла Telegram (Video, Audio, Document)
+            context: Контекст обработчика
+            kind: Тип обработки: 'video' или 'audio'
+            message: Сообщение пользователя (для доставки результата медиа-воркера)
+            progress: Прогресс в сообщении "Обрабатываю..." (только при локальной обработке)
+            transcript: Отправка текста по мере распознавания (только при локальной обработке)
+            
+        Returns:
+            dict: Результат обработки MediaProcessor
+        """
+        if self.broker is not None:
+            compute = lambda: self.run_remote(kind, media, message)
+        else:
+            compute = lambda: self.pipeline.transcribe(
+                context.bot, media.file_id, kind, media.file_size, RECOGNITION_LANGUAGE,
+                progress=progress, duration=getattr(media, 'duration', None), transcript=transcript
+            )
+        result = await self.transcript_cache.get_or_compute(media.file_unique_id, RECOGNITION_LANGUAGE, compute)
+        metrics.count_cache_lookup(result.get('cached', False))
+        return result
+    
+    async def run_remote(self, kind: str, media, message=None, **extra) -> dict:
+        """
+        Ставит задачу в брокер и ждет результат от медиа-воркера
+        
+        Args:
+            kind: Тип задачи: 'video', 'audio' или 'compress'
+            media: Объект файла Telegram
+            message: Сообщение пользователя, на которое отвечает воркер
+            **extra: Дополнительные поля описания задачи
+            
+        Returns:
+            dict: Результат задачи
+        """
+        payload = {
+            'file_id': media.file_id,
+            'file_unique_id': media.file_unique_id,
+            'file_size': media.file_size,
+            'language': RECOGNITION_LANGUAGE,
+            'chat_id': message.chat_id if message else None,
+            'message_id': message.message_id if message else None,
+            **extra
+        }
+        priority = estimate_cost(getattr(media, 'duration', None), media.file_size,
+                                 kind='audio' if kind == 'audio' else 'video')
+        # Вызовы SQLite блокирующие, event loop бота они не задерживают
+        job_id = await asyncio.to_thread(self.broker.enqueue, kind, payload, priority)
+        future = asyncio.get_running_loop().create_future()
+        self.remote_jobs[job_id] = future
+        depth = await asyncio.to_thread(self.broker.depth)
+        logger.info(f"Задача {job_id} ({kind}) передана медиа-воркерам, в очереди брокера: {depth}")
+        try:
+            return await future
+        finally:
+            self.remote_jobs.pop(job_id, None)
+    
+    async def collect_remote_results(self):
+        """Забирает из брокера результаты медиа-воркеров и передает их ожидающим задачам"""
+        while True:
+            for job in await asyncio.to_thread(self.broker.fetch_finished):
+                future = self.remote_jobs.get(job['id'])
+                try:
+                    if future is not None and not future.done():
+                        future.set_result(job['result'])
+                    else:
+                        # Задачу поставил предыдущий запуск бота - отвечаем в чат напрямую
+                        await self.deliver_orphan_result(job)
+                except Exception as e:
+                    logger.error(f"Не удалось доставить результат задачи {job['id']}: {e}")
+                await asyncio.to_thread(self.broker.mark_delivered, job['id'])
+            await asyncio.sleep(BROKER_POLL_INTERVAL)
+    
+    async def deliver_orphan_result(self, job: dict):
+        """Отправляет результат задачи, которую никто не ждет (после перезапуска бота)"""
+        payload, result = job['payload'], job['result']
+        if job['kind'] == 'compress' and result['success'] and not payload.get('with_text'):
+            # Сжатое видео воркер уже отправил сам
+            return
+        if result['success'] and (job['kind'] in ('video', 'audio') or payload.get('with_text')):
+            await asyncio.to_thread(
+                self.transcript_cache.put, payload['file_unique_id'], payload['language'], result['text']
+            )
+        if payload.get('chat_id') is None:
+            return
+        bot = self.application.bot
+        if not result['success']:
+            await bot.send_message(payload['chat_id'], result['text'], reply_to_message_id=payload.get('message_id'))
+            return
+        if len(result['text']) > TRANSCRIPT_DOCUMENT_THRESHOLD:
+            # Длинный текст - файлами, как в TranscriptWriter
+            await send_transcript_files(
+                bot, payload['chat_id'], result['text'], result.get('segments'), payload.get('message_id')
+            )
+            return
+        for part in split_text(TRANSCRIPT_HEADING + result['text'], MESSAGE_LIMIT):
+            await bot.send_message(payload['chat_id'], part, reply_to_message_id=payload.get('message_id'))
+    
+    async def transcript_caption(self, transcript: TranscriptWriter, result: dict, caption: str, stats: str) -> str:
+        """
+        Подпись к медиа с текстом, если текст помещается в лимит подписи
+        
+        Иначе (или если часть текста уже отправлена по мере распознавания)
+        текст доставляет TranscriptWriter, а в подписи остается статистика.
+        """
+        with_text = f"{caption}\n\n{TRANSCRIPT_HEADING}{result['text']}\n\n{stats}"
+        if not transcript.started and len(with_text) <= CAPTION_LIMIT:
+            return with_text
+        await transcript.finish(result['text'], result.get('segments'))
+        return f"{caption}\n\n{stats}"
+    
+    async def enqueue(self, update: Update, job, cost: float, name: str, media=None):
+        """
+        Ставит задачу обработки в очередь и сообщает пользователю позицию
+        
+        Задачи одного чата выполняются в порядке поступления. Задача
+        распознавания (передан media) обходит очередь, если текст уже
+        в кэше: она сразу отвечает из кэша, ничего не скачивая (такой ответ
+        может прийти раньше ответа на предыдущий файл чата). Если тот же
+        файл уже стоит в очереди или обрабатывается, задача ждет его
+        результат в фоне, не занимая своего места в очереди.
+        
+        Args:
+            update: Обновление с сообщением пользователя
+            job: Корутинная функция без аргументов
+            cost: Оценка стоимости задачи
+            name: Название задачи для логов
+            media: Объект файла Telegram для задачи распознавания
+        """
+        handler = name.split(':')[0]
+        
+        async def labelled_job():
+            # Метка handler для метрик всех этапов задачи
+            token = metrics.current_handler.set(handler)
+            try:
+                await job()
+            finally:
+                metrics.current_handler.reset(token)
+        
+        if media is not None:
+            key = media.file_unique_id
+            leader = self.queued_media.get(key)
+            if leader is not None:
+                logger.info(f"Файл задачи {name} уже в обработке, жду ее результат без очереди")
+                self.application.create_task(
+                    self.enqueue_after(leader, update, job, cost, name, media), update=update
+                )
+                return
+            if await asyncio.to_thread(self.transcript_cache.contains, key, RECOGNITION_LANGUAGE):
+                logger.info(f"Текст для задачи {name} уже в кэше, отвечаю без очереди")
+                await labelled_job()
+                return
+            
+            done = asyncio.Event()
+            self.queued_media[key] = done
+            queued_job = labelled_job
+            
+            async def labelled_job():
+                try:
+                    await queued_job()
+                finally:
+                    self.queued_media.pop(key, None)
+                    done.set()
+        
+        try:
+            # Задачи одного чата выполняются по порядку, по стоимости сортируются только разные чаты
+            position = self.scheduler.submit(labelled_job, cost, name, key=update.effective_chat.id)
+        except QueueFullError:
+            if media is not None:
+                self.queued_media.pop(media.file_unique_id, None)
+                done.set()
+            logger.warning(f"Очередь заполнена, задача {name} отклонена")
+            await update.message.reply_text(
+                "⏳ Бот сейчас перегружен!\n\n"
+                "Слишком много файлов в обработке. Попробуйте отправить файл через несколько минут."
+            )
+            return
+        
+        if position > 0:
+            await update.message.reply_text(
+                f"🕐 Файл поставлен в очередь\n\n"
+                f"📍 Позиция в очереди: {position}\n\n"
+                "Обработка начнется автоматически."
+            )
+    
+    async def enqueue_after(self, leader: asyncio.Event, update: Update, job, cost: float, name: str, media):
+        """Ждет задачу того же файла и ставит свою (обычно она ответит из кэша)"""
+        await leader.wait()
+        await self.enqueue(update, job, cost, name, media)
+    
+    async def post_init(self, application: Application):
+        """Запускает очередь задач и сервер метрик после инициализации бота"""
+        self.scheduler.start()
+        metrics.start_metrics_server(
+            METRICS_PORT,
+            in_flight=lambda: self.scheduler.running,
+            queue_depth=lambda: self.scheduler.depth,
+            temp_dirs=(SCRATCH_DIR, INGEST_RAM_DIR) if self.pipeline is not None else (),
+            pool_saturation=(lambda: self.pipeline.worker_pool.stats()['saturation'])
+            if self.pipeline is not None else None
+        )
+        if self.broker is not None:
+            self.results_task = asyncio.create_task(self.collect_remote_results())
+        if PREWARM and self.pipeline is not None:
+            self.prewarm_task = asyncio.create_task(self.prewarm(application))
+    
+    async def prewarm(self, application: Application):
+        """Прогревает обработку в фоне, когда бот уже принимает обновления"""
+        while not application.running:
+            await asyncio.sleep(0.1)
+        try:
+            await self.pipeline.warm_up()
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось прогреть обработку: {e}")
+    
+    async def post_shutdown(self, application: Application):
+        """Останавливает очередь, пул воркеров и закрывает кэш при завершении бота"""
+        await self.scheduler.stop()
+        if self.prewarm_task is not None:
+            self.prewarm_task.cancel()
+            await asyncio.gather(self.prewarm_task, return_exceptions=True)
+        if self.broker is not None:
+            if self.results_task is not None:
+                self.results_task.cancel()
+                await asyncio.gather(self.results_task, return_exceptions=True)
+            self.broker.close()
+        else:
+            self.pipeline.shutdown()
+        self.transcript_cache.close()
+    
+    async def cleanup_temp_files(self, context: ContextTypes.DEFAULT_TYPE):
+        """Периодическая очистка временных файлов (job_queue)"""
+        try:
+            await self.janitor.run(self.pipeline.active_workspaces)
+        except Exception as e:
+            logger.error(f"❌ Ошибка при очистке временных файлов: {e}")
+    
     def setup_handlers(self):
         """Настройка обработчиков команд и сообщений"""
         # Команды
@@ -54,7 +372,7 @@ class TelegramBot:
         keyboard = [
             [InlineKeyboardButton("🎥 Видео → Текст", callback_data="video_to_text")],
             [InlineKeyboardButton("🎵 Аудио → Текст", callback_data="audio_to_text")],
-            [InlineKeyboardButton("🗜️ Сжать через BufferedFile", callback_data="compress_video")],
+            [InlineKeyboardButton("🗜️ Сжать видео", callback_data="compress_video")],
             [InlineKeyboardButton("❓ Помощь", callback_data="help")]
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
@@ -101,14 +419,14 @@ class TelegramBot:
         await update.message.reply_text("🎛 Главное меню:", reply_markup=reply_markup)
     
     async def compress_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Обработчик команды /compress - сжатие видео через BufferedFile"""
+        """Обработчик команды /compress - сжатие видео"""
         await update.message.reply_text(
-            "🗜️ Режим сжатия видео через BufferedFile\n\n"
-            "Отправь мне видео, и я сожму его в буфере!\n\n"
+            "🗜️ Режим сжатия видео\n\n"
+            "Отправь мне видео, и я сожму его!\n\n"
             "📋 Как это работает:\n"
-            "• Скачиваю видео в буфер\n"
+            "• Скачиваю видео\n"
             "• Сжимаю до 2MB (максимальное сжатие)\n"
-            "• Отправляю через BufferedFile\n"
+            "• Отправляю сжатое видео с диска\n"
             "• Удаляю временные файлы\n\n"
             "Используй /start для полной обработки (видео → текст)."
         )
@@ -144,12 +462,12 @@ class TelegramBot:
             )
         elif query.data == "compress_video":
             await query.edit_message_text(
-                "🗜️ Сжатие видео через BufferedFile\n\n"
-                "Отправь мне видео, и я сожму его в буфере!\n\n"
+                "🗜️ Сжатие видео\n\n"
+                "Отправь мне видео, и я сожму его!\n\n"
                 "📋 Как это работает:\n"
-                "• Скачиваю видео в буфер\n"
+                "• Скачиваю видео\n"
                 "• Сжимаю до 2MB (максимальное сжатие)\n"
-                "• Отправляю через BufferedFile\n"
+                "• Отправляю сжатое видео с диска\n"
                 "• Удаляю временные файлы\n"
                 "• Максимальный размер: 50MB\n\n"
                 "Просто отправь видео файл!",
@@ -214,43 +532,53 @@ class TelegramBot:
     
     async def handle_audio_file(self, update: Update, context: ContextTypes.DEFAULT_TYPE, document):
         """Обработчик аудио файлов, отправленных как документы"""
-        file_name = document.file_name
         file_size = document.file_size
         
         # Проверяем размер файла
-        if file_size > MAX_FILE_SIZE:
+        # Больше MAX_DOWNLOAD_SIZE файл не скачать через Bot API
+        limit = min(MAX_FILE_SIZE, MAX_DOWNLOAD_SIZE)
+        if file_size > limit:
+            metrics.count_rejected_too_large('audio_file')
             await update.message.reply_text(
                 "❌ Файл слишком большой!\n"
-                f"Максимальный размер: {MAX_FILE_SIZE / (1024*1024):.0f}MB\n"
+                f"Максимальный размер: {limit / (1024*1024):.0f}MB\n"
                 f"Размер вашего файла: {file_size / (1024*1024):.1f}MB"
             )
             return
         
+        # Ставим обработку в очередь
+        await self.enqueue(
+            update,
+            lambda: self.audio_file_job(update, context, document),
+            estimate_cost(file_size=file_size, kind='audio'),
+            name=f"audio_file:{document.file_unique_id}",
+            media=document
+        )
+    
+    async def audio_file_job(self, update: Update, context: ContextTypes.DEFAULT_TYPE, document):
+        """Задача: аудио файл, отправленный как документ -> текст"""
+        file_name = document.file_name
+        file_size = document.file_size
+        
         # Показываем, что начали обработку
-        processing_msg = await update.message.reply_text(
+        header = (
             f"🎵 Обрабатываю аудио файл...\n\n"
             f"📁 Файл: {file_name}\n"
-            f"📊 Размер: {file_size / (1024*1024):.1f}MB\n\n"
-            "⏳ Преобразую речь в текст..."
+            f"📊 Размер: {file_size / (1024*1024):.1f}MB"
         )
+        processing_msg = await update.message.reply_text(header + "\n\n⏳ Скачиваю файл...")
         
         try:
-            # Получаем файл
-            file = await context.bot.get_file(document.file_id)
-            
-            # Создаем временный файл для аудио
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.mp3') as temp_audio:
-                temp_audio_path = temp_audio.name
-                await file.download_to_drive(temp_audio_path)
-            
-            # Обрабатываем аудио: конвертируем в текст
-            result = self.media_processor.process_audio_to_text(temp_audio_path)
+            # Обрабатываем аудио: конвертируем в текст (или берем из кэша)
+            async with ProgressReporter(processing_msg, header) as progress, \
+                    TranscriptWriter(update.message) as transcript:
+                result = await self.transcribe(document, context, 'audio', update.message, progress, transcript)
             
             if result['success']:
+                # Текст - отдельными сообщениями (или файлом), здесь только статистика
+                await transcript.finish(result['text'], result.get('segments'))
                 result_text = f"""
-📝 Текст извлечен из аудио файла:
-
-{result['text']}
+✅ Текст извлечен из аудио файла
 
 📊 Статистика:
 • Файл: {file_name}
@@ -258,6 +586,9 @@ class TelegramBot:
 • Символов в тексте: {len(result['text'])}
                 """
             else:
+                metrics.count_failure()
+                # Уже отправленная часть текста остается, но помечается как неполная
+                await transcript.abort()
                 result_text = f"""
 ❌ Ошибка при обработке аудио:
 
@@ -270,6 +601,7 @@ class TelegramBot:
             
         except Exception as e:
             logger.error(f"Ошибка при обработке аудио файла: {str(e)}")
+            metrics.count_failure()
             await processing_msg.edit_text(
                 f"❌ Ошибка при обработке аудио:\n{str(e)}\n\n"
                 "Попробуйте другой файл или обратитесь к администратору."
@@ -277,85 +609,88 @@ class TelegramBot:
     
     async def handle_video_file(self, update: Update, context: ContextTypes.DEFAULT_TYPE, document):
         """Обработчик видео файлов, отправленных как документы"""
-        file_name = document.file_name
         file_size = document.file_size
         
         # Проверяем размер файла
-        if file_size > MAX_FILE_SIZE:
+        # Больше MAX_DOWNLOAD_SIZE файл не скачать через Bot API
+        limit = min(MAX_FILE_SIZE, MAX_DOWNLOAD_SIZE)
+        if file_size > limit:
+            metrics.count_rejected_too_large('video_file')
             await update.message.reply_text(
                 "❌ Файл слишком большой!\n"
-                f"Максимальный размер: {MAX_FILE_SIZE / (1024*1024):.0f}MB\n"
+                f"Максимальный размер: {limit / (1024*1024):.0f}MB\n"
                 f"Размер вашего файла: {file_size / (1024*1024):.1f}MB"
             )
             return
         
+        # Ставим обработку в очередь
+        await self.enqueue(
+            update,
+            lambda: self.video_file_job(update, context, document),
+            estimate_cost(file_size=file_size, kind='video'),
+            name=f"video_file:{document.file_unique_id}",
+            media=document
+        )
+    
+    async def video_file_job(self, update: Update, context: ContextTypes.DEFAULT_TYPE, document):
+        """Задача: видео файл, отправленный как документ -> текст"""
+        file_name = document.file_name
+        file_size = document.file_size
+        
         # Показываем, что начали обработку
-        processing_msg = await update.message.reply_text(
+        header = (
             f"🎥 Обрабатываю видео файл...\n\n"
             f"📁 Файл: {file_name}\n"
-            f"📊 Размер: {file_size / (1024*1024):.1f}MB\n\n"
-            "⏳ Извлекаю аудио из видео..."
+            f"📊 Размер: {file_size / (1024*1024):.1f}MB"
         )
+        processing_msg = await update.message.reply_text(header + "\n\n⏳ Скачиваю файл...")
         
         try:
-            # Получаем файл
-            file = await context.bot.get_file(document.file_id)
-            
-            # Создаем временный файл для видео
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4') as temp_video:
-                temp_video_path = temp_video.name
-                await file.download_to_drive(temp_video_path)
-            
-            # Обновляем сообщение
-            await processing_msg.edit_text(
-                f"🎥 Обрабатываю видео файл...\n\n"
-                f"📁 Файл: {file_name}\n"
-                f"📊 Размер: {file_size / (1024*1024):.1f}MB\n\n"
-                "⏳ Извлекаю аудио из видео...\n"
-                "✅ Аудио извлечено! Конвертирую в текст..."
-            )
-            
-            # Обрабатываем видео: извлекаем аудио и конвертируем в текст
-            result = self.media_processor.process_video_to_text(temp_video_path)
+            # Обрабатываем видео: извлекаем аудио и конвертируем в текст (или берем из кэша)
+            async with ProgressReporter(processing_msg, header) as progress, \
+                    TranscriptWriter(update.message) as transcript:
+                result = await self.transcribe(document, context, 'video', update.message, progress, transcript)
             
             if result['success']:
                 # Отправляем исходное видео обратно (Telegram автоматически сожмет)
                 try:
-                    # Отправляем видео по file_id (Telegram сожмет автоматически)
-                    await update.message.reply_document(
-                        document=document.file_id,  # Документ остается как есть
-                        caption=f"""
-🎬 Видео отправлено обратно (Telegram автоматически сжал):
-
-📝 Текст извлечен:
-
-{result['text']}
-
-📊 Статистика:
+                    # Текст остается в подписи, только если помещается в лимит подписи
+                    caption = await self.transcript_caption(
+                        transcript, result,
+                        "🎬 Видео отправлено обратно (Telegram автоматически сжал):",
+                        f"""📊 Статистика:
 • Файл: {file_name}
 • Исходный размер: {file_size / (1024*1024):.1f}MB
 • Символов в тексте: {len(result['text'])}
-• File ID: `{document.file_id}`
-                        """,
+• File ID: `{document.file_id}`"""
+                    )
+                    # Отправляем видео по file_id (Telegram сожмет автоматически)
+                    await reply_media(
+                        update.message, 'document',
+                        document.file_id,  # Документ остается как есть
+                        caption=caption,
                         parse_mode='Markdown'
                     )
                     
                 except Exception as e:
                     logger.error(f"Ошибка при отправке сжатого видео: {e}")
                     # Если не удалось отправить видео, отправляем только текст
+                    if not transcript.finished:
+                        await transcript.finish(result['text'], result.get('segments'))
                     result_text = f"""
-📝 Текст извлечен из видео файла:
-
-{result['text']}
+✅ Текст извлечен из видео файла
 
 📊 Статистика:
 • Файл: {file_name}
 • Размер видео: {file_size / (1024*1024):.1f}MB
-• Размер аудио: {result['audio_size'] / (1024*1024):.1f}MB
+• Размер аудио: {result.get('audio_size', 0) / (1024*1024):.1f}MB
 • Символов в тексте: {len(result['text'])}
                     """
                     await processing_msg.edit_text(result_text)
             else:
+                metrics.count_failure()
+                # Уже отправленная часть текста остается, но помечается как неполная
+                await transcript.abort()
                 result_text = f"""
 ❌ Ошибка при обработке видео:
 
@@ -367,6 +702,7 @@ class TelegramBot:
             
         except Exception as e:
             logger.error(f"Ошибка при обработке видео файла: {str(e)}")
+            metrics.count_failure()
             await processing_msg.edit_text(
                 f"❌ Ошибка при обработке видео:\n{str(e)}\n\n"
                 "Попробуйте другой файл или обратитесь к администратору."
@@ -378,93 +714,108 @@ class TelegramBot:
         duration = video.duration
         file_size = video.file_size
         
+        # Больше MAX_DOWNLOAD_SIZE видео не скачать через Bot API даже для сжатия
+        if file_size > MAX_DOWNLOAD_SIZE:
+            metrics.count_rejected_too_large('video')
+            await update.message.reply_text(
+                "❌ Файл слишком большой!\n"
+                f"Максимальный размер: {MAX_DOWNLOAD_SIZE / (1024*1024):.0f}MB\n"
+                f"Размер вашего файла: {file_size / (1024*1024):.1f}MB"
+            )
+            return
+        
         # Проверяем, хочет ли пользователь просто сжать видео
         if update.message.caption and "сжать" in update.message.caption.lower():
-            await self.compress_video_only(update, context, video)
+            if await self.reject_uncompressible(update, context, video):
+                return
+            await self.enqueue_compression(update, context, video)
             return
         
         # Проверяем размер файла
         if file_size > MAX_FILE_SIZE:
-            # Если файл большой, предлагаем сжать
+            if await self.reject_uncompressible(update, context, video, with_text=True):
+                return
+            # Большое видео не вернуть как есть: сжимаем его и заодно извлекаем текст
             await update.message.reply_text(
                 f"⚠️ Файл слишком большой!\n\n"
                 f"📊 Размер: {file_size / (1024*1024):.1f}MB\n"
                 f"📏 Лимит: {MAX_FILE_SIZE / (1024*1024):.0f}MB\n\n"
                 f"🗜️ Но я могу сжать его для тебя!\n"
-                f"Отправляю сжатое видео..."
+                f"Отправляю сжатое видео и текст..."
             )
             
-            # Сжимаем видео через буфер
-            await self.compress_video_only(update, context, video)
+            # Сжатое видео и звук для распознавания - за один проход ffmpeg
+            await self.enqueue_compression(update, context, video, with_text=True)
             return
         
+        # Ставим обработку в очередь
+        await self.enqueue(
+            update,
+            lambda: self.video_job(update, context, video),
+            estimate_cost(duration, file_size, kind='video'),
+            name=f"video:{video.file_unique_id}",
+            media=video
+        )
+    
+    async def video_job(self, update: Update, context: ContextTypes.DEFAULT_TYPE, video):
+        """Задача: видео -> текст"""
+        duration = video.duration
+        file_size = video.file_size
+        
         # Показываем, что начали обработку
-        processing_msg = await update.message.reply_text(
+        header = (
             f"🎥 Обрабатываю видео...\n\n"
             f"⏱ Длительность: {duration} сек\n"
-            f"📊 Размер: {file_size / (1024*1024):.1f}MB\n\n"
-            "⏳ Извлекаю аудио из видео..."
+            f"📊 Размер: {file_size / (1024*1024):.1f}MB"
         )
+        processing_msg = await update.message.reply_text(header + "\n\n⏳ Скачиваю файл...")
         
         try:
-            # Получаем файл
-            file = await context.bot.get_file(video.file_id)
-            
-            # Создаем временный файл для видео
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4') as temp_video:
-                temp_video_path = temp_video.name
-                await file.download_to_drive(temp_video_path)
-            
-            # Обновляем сообщение
-            await processing_msg.edit_text(
-                f"🎥 Обрабатываю видео...\n\n"
-                f"⏱ Длительность: {duration} сек\n"
-                f"📊 Размер: {file_size / (1024*1024):.1f}MB\n\n"
-                "⏳ Извлекаю аудио из видео...\n"
-                "✅ Аудио извлечено! Конвертирую в текст..."
-            )
-            
-            # Обрабатываем видео: извлекаем аудио и конвертируем в текст
-            result = self.media_processor.process_video_to_text(temp_video_path)
+            # Обрабатываем видео: извлекаем аудио и конвертируем в текст (или берем из кэша)
+            async with ProgressReporter(processing_msg, header) as progress, \
+                    TranscriptWriter(update.message) as transcript:
+                result = await self.transcribe(video, context, 'video', update.message, progress, transcript)
             
             if result['success']:
                 # Отправляем исходное видео обратно (Telegram автоматически сожмет)
                 try:
-                    # Отправляем видео по file_id (Telegram сожмет автоматически)
-                    await update.message.reply_video(
-                        video=video.file_id,  # Просто file_id
-                        caption=f"""
-🎬 Видео отправлено обратно (Telegram автоматически сжал):
-
-📝 Текст извлечен:
-
-{result['text']}
-
-📊 Статистика:
+                    # Текст остается в подписи, только если помещается в лимит подписи
+                    caption = await self.transcript_caption(
+                        transcript, result,
+                        "🎬 Видео отправлено обратно (Telegram автоматически сжал):",
+                        f"""📊 Статистика:
 • Длительность: {duration} сек
 • Исходный размер: {file_size / (1024*1024):.1f}MB
 • Символов в тексте: {len(result['text'])}
-• File ID: `{video.file_id}`
-                        """,
+• File ID: `{video.file_id}`"""
+                    )
+                    # Отправляем видео по file_id (Telegram сожмет автоматически)
+                    await reply_media(
+                        update.message, 'video',
+                        video.file_id,  # Просто file_id
+                        caption=caption,
                         parse_mode='Markdown'
                     )
                     
                 except Exception as e:
                     logger.error(f"Ошибка при отправке сжатого видео: {e}")
                     # Если не удалось отправить видео, отправляем только текст
+                    if not transcript.finished:
+                        await transcript.finish(result['text'], result.get('segments'))
                     result_text = f"""
-📝 Текст извлечен из видео:
-
-{result['text']}
+✅ Текст извлечен из видео
 
 📊 Статистика:
 • Длительность: {duration} сек
 • Размер видео: {file_size / (1024*1024):.1f}MB
-• Размер аудио: {result['audio_size'] / (1024*1024):.1f}MB
+• Размер аудио: {result.get('audio_size', 0) / (1024*1024):.1f}MB
 • Символов в тексте: {len(result['text'])}
                     """
                     await processing_msg.edit_text(result_text)
             else:
+                metrics.count_failure()
+                # Уже отправленная часть текста остается, но помечается как неполная
+                await transcript.abort()
                 result_text = f"""
 ❌ Ошибка при обработке видео:
 
@@ -476,6 +827,7 @@ class TelegramBot:
             
         except Exception as e:
             logger.error(f"Ошибка при обработке видео: {str(e)}")
+            metrics.count_failure()
             await processing_msg.edit_text(
                 f"❌ Ошибка при обработке видео:\n{str(e)}\n\n"
                 "Попробуйте другой файл или обратитесь к администратору."
@@ -486,43 +838,54 @@ class TelegramBot:
         audio = update.message.audio
         duration = audio.duration
         file_size = audio.file_size
-        file_name = audio.file_name or "audio_file"
         
         # Проверяем размер файла
-        if file_size > MAX_FILE_SIZE:
+        # Больше MAX_DOWNLOAD_SIZE файл не скачать через Bot API
+        limit = min(MAX_FILE_SIZE, MAX_DOWNLOAD_SIZE)
+        if file_size > limit:
+            metrics.count_rejected_too_large('audio')
             await update.message.reply_text(
                 "❌ Файл слишком большой!\n"
-                f"Максимальный размер: {MAX_FILE_SIZE / (1024*1024):.0f}MB\n"
+                f"Максимальный размер: {limit / (1024*1024):.0f}MB\n"
                 f"Размер вашего файла: {file_size / (1024*1024):.1f}MB"
             )
             return
         
+        # Ставим обработку в очередь
+        await self.enqueue(
+            update,
+            lambda: self.audio_job(update, context, audio),
+            estimate_cost(duration, file_size, kind='audio'),
+            name=f"audio:{audio.file_unique_id}",
+            media=audio
+        )
+    
+    async def audio_job(self, update: Update, context: ContextTypes.DEFAULT_TYPE, audio):
+        """Задача: аудио -> текст"""
+        duration = audio.duration
+        file_size = audio.file_size
+        file_name = audio.file_name or "audio_file"
+        
         # Показываем, что начали обработку
-        processing_msg = await update.message.reply_text(
+        header = (
             f"🎵 Обрабатываю аудио...\n\n"
             f"📁 Файл: {file_name}\n"
             f"⏱ Длительность: {duration} сек\n"
-            f"📊 Размер: {file_size / (1024*1024):.1f}MB\n\n"
-            "⏳ Преобразую речь в текст..."
+            f"📊 Размер: {file_size / (1024*1024):.1f}MB"
         )
+        processing_msg = await update.message.reply_text(header + "\n\n⏳ Скачиваю файл...")
         
         try:
-            # Получаем файл
-            file = await context.bot.get_file(audio.file_id)
-            
-            # Создаем временный файл для аудио
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.mp3') as temp_audio:
-                temp_audio_path = temp_audio.name
-                await file.download_to_drive(temp_audio_path)
-            
-            # Обрабатываем аудио: конвертируем в текст
-            result = self.media_processor.process_audio_to_text(temp_audio_path)
+            # Обрабатываем аудио: конвертируем в текст (или берем из кэша)
+            async with ProgressReporter(processing_msg, header) as progress, \
+                    TranscriptWriter(update.message) as transcript:
+                result = await self.transcribe(audio, context, 'audio', update.message, progress, transcript)
             
             if result['success']:
+                # Текст - отдельными сообщениями (или файлом), здесь только статистика
+                await transcript.finish(result['text'], result.get('segments'))
                 result_text = f"""
-📝 Текст извлечен из аудио:
-
-{result['text']}
+✅ Текст извлечен из аудио
 
 📊 Статистика:
 • Файл: {file_name}
@@ -532,6 +895,9 @@ class TelegramBot:
 • Исполнитель: {audio.performer or 'Неизвестно'}
                 """
             else:
+                metrics.count_failure()
+                # Уже отправленная часть текста остается, но помечается как неполная
+                await transcript.abort()
                 result_text = f"""
 ❌ Ошибка при обработке аудио:
 
@@ -544,6 +910,7 @@ class TelegramBot:
             
         except Exception as e:
             logger.error(f"Ошибка при обработке аудио: {str(e)}")
+            metrics.count_failure()
             await processing_msg.edit_text(
                 f"❌ Ошибка при обработке аудио:\n{str(e)}\n\n"
                 "Попробуйте другой файл или обратитесь к администратору."
@@ -558,45 +925,99 @@ class TelegramBot:
         
         await update.message.reply_text(response)
     
-    async def compress_video_only(self, update: Update, context: ContextTypes.DEFAULT_TYPE, video):
-        """Сжимает видео через буфер и отправляет"""
+    async def reject_uncompressible(self, update: Update, context: ContextTypes.DEFAULT_TYPE, video,
+                                    with_text: bool = False) -> bool:
+        """
+        Сообщает сразу, если видео слишком длинное для сжатия до COMPRESSED_VIDEO_TARGET_MB
+        
+        Даже с самыми низкими настройками (ffmpeg_tools.ENCODING_LADDER) такое
+        видео получилось бы больше целевого размера. С with_text текст все
+        равно извлекается, без сжатия видео.
+        
+        Returns:
+            bool: True, если сжатие отклонено
+        """
+        max_duration = max_duration_for_size(COMPRESSED_VIDEO_TARGET_MB * 1024 * 1024)
+        if not video.duration or video.duration <= max_duration:
+            return False
+        
+        await update.message.reply_text(
+            f"❌ Видео слишком длинное, чтобы сжать его до {COMPRESSED_VIDEO_TARGET_MB}MB\n\n"
+            f"⏱ Длительность: {video.duration} сек\n"
+            f"📏 Максимум для сжатия: {max_duration / 60:.0f} мин"
+            + ("\n\nИзвлекаю только текст..." if with_text else "")
+        )
+        if with_text:
+            await self.enqueue(
+                update,
+                lambda: self.video_job(update, context, video),
+                estimate_cost(video.duration, video.file_size, kind='video'),
+                name=f"video:{video.file_unique_id}",
+                media=video
+            )
+        return True
+    
+    async def enqueue_compression(self, update: Update, context: ContextTypes.DEFAULT_TYPE, video,
+                                  with_text: bool = False):
+        """Ставит сжатие видео (и, если with_text, извлечение текста) в очередь"""
+        await self.enqueue(
+            update,
+            lambda: self.compress_video_only(update, context, video, with_text),
+            estimate_cost(video.duration, video.file_size, kind='video'),
+            name=f"compress:{video.file_unique_id}"
+        )
+    
+    async def compress_video_only(self, update: Update, context: ContextTypes.DEFAULT_TYPE, video,
+                                  with_text: bool = False):
+        """
+        Сжимает видео и отправляет его с диска
+        
+        С with_text речь распознается из того же запуска ffmpeg, что сжимает
+        видео, и текст отправляется в ответ на сообщение пользователя.
+        """
         try:
-            # Скачиваем видео в буфер
-            file = await context.bot.get_file(video.file_id)
-            
-            # Создаем временный файл
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4') as temp_video:
-                temp_video_path = temp_video.name
-                await file.download_to_drive(temp_video_path)
-            
-            # Сжимаем видео
-            compressed_video_path = self.media_processor.compress_video_for_user(temp_video_path, target_size_mb=2)
-            
-            # Отправляем сжатое видео через BufferedFile
-            with open(compressed_video_path, 'rb') as compressed_file:
-                video_data = compressed_file.read()
-                buffered_video = BufferedInputFile(video_data, filename="compressed_video.mp4")
-                
-                await update.message.reply_video(
-                    video=buffered_video,
-                    caption=f"""
-🎬 ВИДЕО сжато через BufferedFile!
-
-📊 Статистика:
-• Длительность: {video.duration} сек
-• Исходный размер: {video.file_size / (1024*1024):.1f}MB
-• Сжатый размер: {os.path.getsize(compressed_video_path) / (1024*1024):.1f}MB
-
-💡 Видео сжато в буфере и отправлено через BufferedFile!
-                    """
+            transcript = TranscriptWriter(update.message)
+            if self.broker is not None:
+                # Сжатое видео отправит медиа-воркер, текст - бот
+                result = await self.run_remote(
+                    'compress', video, update.message, duration=video.duration, with_text=with_text
                 )
+            else:
+                async def deliver(compressed_video_path):
+                    await reply_media(
+                        update.message, 'video',
+                        compressed_video_path,
+                        filename="compressed_video.mp4",
+                        caption=compressed_video_caption(
+                            video.duration, video.file_size, os.path.getsize(compressed_video_path)
+                        )
+                    )
+                
+                async with transcript:
+                    result = await self.pipeline.compress(
+                        context.bot, video.file_id, deliver, video.file_size, video.duration,
+                        language=RECOGNITION_LANGUAGE if with_text else None,
+                        transcript=transcript if with_text else None
+                    )
             
-            # Удаляем временные файлы
-            os.unlink(temp_video_path)
-            os.unlink(compressed_video_path)
+            if 'compressed_size' not in result:
+                # Видео не отправлено
+                raise RuntimeError(result['error'])
+            if not with_text:
+                return
+            if not result['success']:
+                # Видео отправлено, а текст получить не удалось (например, в видео нет звука)
+                metrics.count_failure()
+                await transcript.abort()
+                await update.message.reply_text(f"❌ Не удалось извлечь текст:\n{result['error']}")
+                return
+            await asyncio.to_thread(self.transcript_cache.put, video.file_unique_id, RECOGNITION_LANGUAGE, result['text'])
+            await transcript.finish(result['text'], result.get('segments'))
             
         except Exception as e:
             logger.error(f"Ошибка при сжатии видео: {e}")
+            metrics.count_failure()
+            await transcript.abort()
             await update.message.reply_text(
                 f"❌ Ошибка при сжатии видео:\n{str(e)}"
             )
@@ -606,20 +1027,23 @@ class TelegramBot:
         try:
             if quality == "best":
                 # Лучшее качество
-                await update.message.reply_video(
-                    video=video.file_id,  # Лучшее качество
+                await reply_media(
+                    update.message, 'video',
+                    video.file_id,  # Лучшее качество
                     caption="🎬 ВИДЕО (лучшее качество)"
                 )
             elif quality == "worst":
                 # Худшее качество
-                await update.message.reply_video(
-                    video=video.file_id,  # Худшее качество
+                await reply_media(
+                    update.message, 'video',
+                    video.file_id,  # Худшее качество
                     caption="🎬 ВИДЕО (худшее качество)"
                 )
             else:
                 # Обычное качество
-                await update.message.reply_video(
-                    video=video.file_id,  # Обычное качество
+                await reply_media(
+                    update.message, 'video',
+                    video.file_id,  # Обычное качество
                     caption="🎬 ВИДЕО (обычное качество)"
                 )
         except Exception as e:
@@ -628,10 +1052,31 @@ class TelegramBot:
                 f"❌ Ошибка при отправке видео:\n{str(e)}"
             )
     
-    def run(self):
-        """Запуск бота"""
-        logger.info("Запуск бота...")
-        self.application.run_polling(allowed_updates=Update.ALL_TYPES)
+    def run(self, mode: str = None):
+        """
+        Запуск бота
+        
+        Args:
+            mode: 'polling' или 'webhook' (по умолчанию BOT_MODE из config.py)
+        """
+        mode = mode or BOT_MODE
+        logger.info(f"Запуск бота в режиме {mode} (одновременных обновлений: {CONCURRENT_UPDATES})...")
+        
+        if mode == 'webhook':
+            if not WEBHOOK_URL:
+                raise ValueError("Для режима webhook укажите WEBHOOK_URL в .env")
+            self.application.run_webhook(
+                listen=WEBHOOK_LISTEN,
+                port=WEBHOOK_PORT,
+                url_path=WEBHOOK_PATH,
+                webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+                secret_token=WEBHOOK_SECRET or None,
+                allowed_updates=Update.ALL_TYPES
+            )
+        elif mode == 'polling':
+            self.application.run_polling(allowed_updates=Update.ALL_TYPES)
+        else:
+            raise ValueError(f"Неизвестный режим запуска: {mode} (polling или webhook)")
 
 if __name__ == "__main__":
     bot = TelegramBot()
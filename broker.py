@@ -0,0 +1,245 @@
+"""
+Очередь задач между ботом и медиа-воркерами на SQLite
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteBroker:
+    """
+    Брокер задач обработки медиа в базе SQLite.
+
+    Бот кладет в очередь описание задачи (file_id, тип, чат, сообщение),
+    воркеры забирают задачи с арендой (lease) на lease_seconds и продлевают
+    ее heartbeat'ами. Если воркер перестал отвечать, аренда истекает, и
+    задача снова попадает в очередь - до max_attempts попыток. Готовые
+    результаты бот забирает через fetch_finished.
+
+    База должна быть доступна всем процессам: бот и воркеры запускаются
+    на одной машине или с общим локальным томом (не сетевой ФС).
+
+    Методы блокирующие (SQLite ждет блокировку базы до 30 секунд), поэтому
+    из event loop их вызывают через asyncio.to_thread. Соединение одно на
+    процесс, вызовы из разных потоков выполняются по очереди.
+    """
+
+    def __init__(self, db_path: str, lease_seconds: float = 60, max_attempts: int = 3):
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        # isolation_level=None: транзакции управляются явно (BEGIN IMMEDIATE)
+        self._conn = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        # Транзакция claim не должна перемежаться запросами из других потоков
+        self._lock = threading.Lock()
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                priority REAL NOT NULL DEFAULT 0,
+                status TEXT NOT NULL DEFAULT 'queued',
+                worker_id TEXT,
+                lease_until REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                delivered INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, priority, id)")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS workers (
+                worker_id TEXT PRIMARY KEY,
+                started_at REAL NOT NULL,
+                last_heartbeat REAL NOT NULL
+            )
+            """
+        )
+
+    def enqueue(self, kind: str, payload: dict, priority: float = 0) -> int:
+        """
+        Ставит задачу в очередь
+
+        Args:
+            kind: Тип задачи ('video', 'audio', 'compress')
+            payload: Описание задачи (сериализуется в JSON)
+            priority: Чем меньше, тем раньше задача будет выполнена
+
+        Returns:
+            int: Идентификатор задачи
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO jobs (kind, payload, priority, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (kind, json.dumps(payload), priority, now, now)
+            )
+        return cursor.lastrowid
+
+    def claim(self, worker_id: str):
+        """
+        Забирает следующую задачу из очереди
+
+        Returns:
+            dict | None: id, kind, payload, attempts или None, если очередь пуста
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._requeue_expired(now)
+                row = self._conn.execute(
+                    "SELECT id, kind, payload, attempts FROM jobs WHERE status = 'queued' "
+                    "ORDER BY priority, id LIMIT 1"
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+
+                job_id, kind, payload, attempts = row
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'running', worker_id = ?, lease_until = ?, "
+                    "attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                    (worker_id, now + self.lease_seconds, now, job_id)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        return {'id': job_id, 'kind': kind, 'payload': json.loads(payload), 'attempts': attempts + 1}
+
+    def _requeue_expired(self, now: float):
+        """Возвращает в очередь задачи воркеров, переставших присылать heartbeat"""
+        expired = self._conn.execute(
+            "SELECT id, worker_id, attempts FROM jobs WHERE status = 'running' AND lease_until < ?",
+            (now,)
+        ).fetchall()
+        for job_id, worker_id, attempts in expired:
+            if attempts >= self.max_attempts:
+                logger.error(f"❌ Задача {job_id} не выполнена за {attempts} попыток, воркер {worker_id} не отвечает")
+                error = "Воркер обработки перестал отвечать"
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'failed', result = ?, updated_at = ? WHERE id = ?",
+                    (json.dumps({'success': False, 'error': error, 'text': f"❌ {error}"}), now, job_id)
+                )
+            else:
+                logger.warning(f"⚠️ Воркер {worker_id} не отвечает, задача {job_id} возвращена в очередь")
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'queued', worker_id = NULL, lease_until = NULL, "
+                    "updated_at = ? WHERE id = ?",
+                    (now, job_id)
+                )
+
+    def heartbeat(self, worker_id: str, job_ids=()):
+        """Отмечает, что воркер жив, и продлевает аренду его задач"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO workers (worker_id, started_at, last_heartbeat) VALUES (?, ?, ?) "
+                "ON CONFLICT(worker_id) DO UPDATE SET last_heartbeat = excluded.last_heartbeat",
+                (worker_id, now, now)
+            )
+            for job_id in job_ids:
+                self._conn.execute(
+                    "UPDATE jobs SET lease_until = ? WHERE id = ? AND worker_id = ? AND status = 'running'",
+                    (now + self.lease_seconds, job_id, worker_id)
+                )
+
+    def owns(self, job_id: int, worker_id: str) -> bool:
+        """Задача все еще выполняется этим воркером (аренда не перешла к другому)"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM jobs WHERE id = ? AND worker_id = ? AND status = 'running'",
+                (job_id, worker_id)
+            ).fetchone()
+        return row is not None
+
+    def complete(self, job_id: int, worker_id: str, result: dict) -> bool:
+        """
+        Сохраняет результат выполненной задачи
+
+        Returns:
+            bool: False, если аренда истекла и задача уже у другого воркера
+                  (результат отброшен)
+        """
+        return self._finish(job_id, worker_id, 'done', result)
+
+    def fail(self, job_id: int, worker_id: str, error: str) -> bool:
+        """
+        Отмечает задачу как завершенную с ошибкой
+
+        Returns:
+            bool: False, если аренда истекла и задача уже у другого воркера
+        """
+        return self._finish(job_id, worker_id, 'failed', {'success': False, 'error': error, 'text': f"❌ {error}"})
+
+    def _finish(self, job_id: int, worker_id: str, status: str, result: dict) -> bool:
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, updated_at = ? "
+                "WHERE id = ? AND worker_id = ? AND status = 'running'",
+                (status, json.dumps(result), time.time(), job_id, worker_id)
+            )
+        if cursor.rowcount != 1:
+            logger.warning(f"⚠️ Результат задачи {job_id} от воркера {worker_id} отброшен: аренда истекла")
+            return False
+        return True
+
+    def release(self, worker_id: str):
+        """Возвращает в очередь задачи воркера (при штатной остановке)"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'queued', worker_id = NULL, lease_until = NULL, "
+                "attempts = MAX(attempts - 1, 0), updated_at = ? WHERE worker_id = ? AND status = 'running'",
+                (time.time(), worker_id)
+            )
+            self._conn.execute("DELETE FROM workers WHERE worker_id = ?", (worker_id,))
+
+    def fetch_finished(self, limit: int = 100) -> list:
+        """
+        Возвращает завершенные задачи, результат которых еще не доставлен
+
+        Returns:
+            list: Словари id, kind, payload, result
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, kind, payload, result FROM jobs "
+                "WHERE status IN ('done', 'failed') AND delivered = 0 ORDER BY id LIMIT ?",
+                (limit,)
+            ).fetchall()
+        return [
+            {'id': job_id, 'kind': kind, 'payload': json.loads(payload), 'result': json.loads(result)}
+            for job_id, kind, payload, result in rows
+        ]
+
+    def mark_delivered(self, job_id: int):
+        """Удаляет задачу, результат которой доставлен"""
+        with self._lock:
+            self._conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def depth(self) -> int:
+        """Количество задач, ожидающих воркера"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+
+    def close(self):
+        """Закрывает соединение с базой"""
+        with self._lock:
+            self._conn.close()
@@ -1,66 +1,262 @@
 """
 Модуль для очистки временных файлов
+
+TempJanitor периодически запускается ботом (job_queue) и медиа-воркером.
+Он удаляет файлы задач, оставшиеся после падения процесса, файлы старше
+TEMP_MAX_AGE, а если на диске заканчивается место - самые старые файлы,
+не принадлежащие выполняемым задачам.
 """
 
 import os
 import time
+import shutil
+import asyncio
 import logging
-from pathlib import Path
+import tempfile
+
+import metrics
+from config import SCRATCH_DIR, INGEST_RAM_DIR, TEMP_MAX_AGE, DISK_HIGH_WATERMARK, DISK_LOW_WATERMARK
+from workspace import owner_pid
 
 logger = logging.getLogger(__name__)
 
-def cleanup_temp_files(temp_dir: str = None, max_age_hours: int = 1):
+# Промежуточные файлы MediaProcessor вне рабочей директории задачи (tempfile.mkstemp)
+TEMP_FILE_PREFIXES = ('compressed_', 'user_compressed_', 'extracted_audio_')
+
+
+def default_locations() -> dict:
+    """
+    Директории временных файлов бота: {путь: префиксы имен или None}
+
+    В SCRATCH_DIR и INGEST_RAM_DIR лежат только файлы задач, поэтому они
+    проверяются целиком. В системной временной директории - только файлы
+    с префиксами MediaProcessor, чужие файлы не трогаем.
+    """
+    temp_dir = os.path.abspath(tempfile.gettempdir())
+    locations = {temp_dir: TEMP_FILE_PREFIXES}
+    for path in (SCRATCH_DIR, INGEST_RAM_DIR):
+        if not path:
+            continue
+        if os.path.abspath(path) == temp_dir:
+            locations[temp_dir] = ('job_',) + TEMP_FILE_PREFIXES
+        else:
+            locations[os.path.abspath(path)] = None
+    return locations
+
+
+def _process_alive(pid: int) -> bool:
+    """Проверяет, работает ли процесс"""
+    if os.name == 'nt':
+        # В Windows os.kill завершает процесс; полагаемся только на возраст
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # Процесс есть, но принадлежит другому пользователю
+        return True
+    return True
+
+
+def _tree_usage(entry: os.DirEntry) -> tuple:
+    """(размер в байтах, время последнего изменения) файла или директории с содержимым"""
+    stat = entry.stat(follow_symlinks=False)
+    if not entry.is_dir(follow_symlinks=False):
+        return stat.st_size, stat.st_mtime
+
+    size, newest = 0, stat.st_mtime
+    for child in os.scandir(entry.path):
+        try:
+            child_size, child_mtime = _tree_usage(child)
+        except OSError:
+            # Файл мог быть удален во время обхода
+            continue
+        size += child_size
+        newest = max(newest, child_mtime)
+    return size, newest
+
+
+class TempJanitor:
+    """
+    Фоновая очистка временных файлов задач.
+
+    Файл или рабочая директория задачи не удаляется, если задача
+    выполняется в этом процессе (active) или в другом работающем процессе
+    (PID в имени, см. workspace.owner_pid). Остальные удаляются:
+    - orphan: задача процесса, который уже завершился (или этого процесса,
+      но уже не выполняется);
+    - age: файлы без владельца старше max_age_seconds;
+    - pressure: если диск занят больше high_watermark, самые старые
+      оставшиеся файлы, пока занятость не опустится до low_watermark.
+    Файлы моложе grace_seconds не трогаются: задача могла только что
+    создать директорию и еще не успеть отметить ее как активную.
+    """
+
+    def __init__(self, locations: dict = None, max_age_seconds: float = TEMP_MAX_AGE,
+                 high_watermark: float = DISK_HIGH_WATERMARK, low_watermark: float = DISK_LOW_WATERMARK,
+                 grace_seconds: float = 60):
+        self.locations = locations if locations is not None else default_locations()
+        self.max_age_seconds = max_age_seconds
+        self.high_watermark = high_watermark
+        self.low_watermark = min(low_watermark, high_watermark)
+        self.grace_seconds = grace_seconds
+
+    async def run(self, active=()) -> dict:
+        """Выполняет sweep в отдельном потоке, чтобы не блокировать event loop"""
+        # Снимок активных задач берем в потоке event loop: множество меняется в нем же
+        return await asyncio.to_thread(self.sweep, set(active))
+
+    def sweep(self, active=()) -> dict:
+        """
+        Один проход очистки
+
+        Args:
+            active: Имена рабочих директорий выполняемых задач этого процесса
+
+        Returns:
+            dict: {'removed': число удаленных, 'reclaimed_bytes': освобождено, 'reasons': {причина: байт}}
+        """
+        now = time.time()
+        candidates = []
+        devices = {}
+
+        for root, prefixes in self.locations.items():
+            try:
+                entries = list(os.scandir(root))
+                devices.setdefault(os.stat(root).st_dev, root)
+            except OSError:
+                # Директории еще нет
+                continue
+            for entry in entries:
+                if prefixes is not None and not entry.name.startswith(prefixes):
+                    continue
+                candidate = self._candidate(entry, active, now)
+                if candidate is not None:
+                    candidates.append(candidate)
+
+        report = {'removed': 0, 'reclaimed_bytes': 0, 'reasons': {}}
+        remaining = []
+        for candidate in candidates:
+            if candidate['reason'] is not None:
+                self._remove(candidate, report)
+            else:
+                remaining.append(candidate)
+
+        # Диск почти заполнен: удаляем самые старые файлы без активной задачи
+        remaining.sort(key=lambda candidate: candidate['mtime'])
+        for device, root in devices.items():
+            try:
+                usage = shutil.disk_usage(root)
+            except OSError:
+                continue
+            excess = usage.used - self.low_watermark * usage.total
+            if usage.used <= self.high_watermark * usage.total:
+                continue
+            logger.warning(
+                f"⚠️ Диск {root} занят на {usage.used / usage.total:.0%}, удаляю старые временные файлы"
+            )
+            for candidate in remaining:
+                if excess <= 0:
+                    break
+                if candidate['device'] != device or candidate['removed']:
+                    continue
+                candidate['reason'] = 'pressure'
+                excess -= self._remove(candidate, report)
+
+        if report['removed']:
+            reasons = ', '.join(f"{reason}: {size / (1024*1024):.1f}MB" for reason, size in report['reasons'].items())
+            logger.info(
+                f"🧹 Очистка временных файлов: удалено {report['removed']}, "
+                f"освобождено {report['reclaimed_bytes'] / (1024*1024):.1f}MB ({reasons})"
+            )
+        else:
+            logger.debug("🧹 Временных файлов для очистки не найдено")
+        return report
+
+    def _candidate(self, entry: os.DirEntry, active, now: float):
+        """Описание файла для очистки или None, если его трогать нельзя"""
+        name = entry.name
+        if any(name == workspace or name.startswith(workspace + '_') for workspace in active):
+            return None
+
+        pid = owner_pid(name)
+        if pid is not None and pid != os.getpid() and _process_alive(pid):
+            # Задача другого работающего процесса (например, соседнего медиа-воркера)
+            return None
+
+        try:
+            size, mtime = _tree_usage(entry)
+            device = entry.stat(follow_symlinks=False).st_dev
+        except OSError:
+            return None
+        age = now - mtime
+        if age < self.grace_seconds:
+            return None
+
+        if pid is not None:
+            reason = 'orphan'
+        elif age > self.max_age_seconds:
+            reason = 'age'
+        else:
+            reason = None
+        return {
+            'path': entry.path,
+            'is_dir': entry.is_dir(follow_symlinks=False),
+            'size': size,
+            'mtime': mtime,
+            'device': device,
+            'reason': reason,
+            'removed': False,
+        }
+
+    def _remove(self, candidate: dict, report: dict) -> int:
+        """Удаляет файл или директорию и возвращает освобожденное место"""
+        try:
+            if candidate['is_dir']:
+                shutil.rmtree(candidate['path'])
+            else:
+                os.remove(candidate['path'])
+        except FileNotFoundError:
+            # Задача успела удалить файл сама
+            return 0
+        except OSError as e:
+            logger.warning(f"⚠️ Не удалось удалить {candidate['path']}: {e}")
+            return 0
+
+        candidate['removed'] = True
+        size, reason = candidate['size'], candidate['reason']
+        report['removed'] += 1
+        report['reclaimed_bytes'] += size
+        report['reasons'][reason] = report['reasons'].get(reason, 0) + size
+        metrics.count_reclaimed(reason, size)
+        logger.debug(f"🗑️ Удален временный файл ({reason}): {candidate['path']} ({size / 1024:.1f}KB)")
+        return size
+
+
+def cleanup_temp_files(temp_dir: str = None, max_age_hours: int = 1) -> dict:
     """
     Очищает временные файлы старше указанного возраста
-    
+
     Args:
-        temp_dir: Директория с временными файлами (по умолчанию системная)
+        temp_dir: Директория с временными файлами (по умолчанию все директории бота)
         max_age_hours: Максимальный возраст файлов в часах
     """
-    if not temp_dir:
-        temp_dir = os.path.join(os.path.dirname(__file__), 'temp')
-    
-    # Создаем директорию, если её нет
-    os.makedirs(temp_dir, exist_ok=True)
-    
-    current_time = time.time()
-    max_age_seconds = max_age_hours * 3600
-    
-    cleaned_count = 0
-    total_size = 0
-    
-    try:
-        for file_path in Path(temp_dir).glob('*'):
-            if file_path.is_file():
-                file_age = current_time - file_path.stat().st_mtime
-                
-                if file_age > max_age_seconds:
-                    file_size = file_path.stat().st_size
-                    total_size += file_size
-                    
-                    try:
-                        file_path.unlink()
-                        cleaned_count += 1
-                        logger.info(f"🗑️ Удален старый файл: {file_path.name} ({file_size / 1024:.1f}KB)")
-                    except Exception as e:
-                        logger.warning(f"⚠️ Не удалось удалить файл {file_path.name}: {e}")
-        
-        if cleaned_count > 0:
-            logger.info(f"✅ Очистка завершена: удалено {cleaned_count} файлов, освобождено {total_size / 1024:.1f}KB")
-        else:
-            logger.debug("🧹 Старых файлов для очистки не найдено")
-            
-    except Exception as e:
-        logger.error(f"❌ Ошибка при очистке временных файлов: {e}")
+    locations = {temp_dir: None} if temp_dir else None
+    return TempJanitor(locations, max_age_seconds=max_age_hours * 3600).sweep()
+
 
 def cleanup_old_files():
     """Очищает файлы старше 1 часа"""
     cleanup_temp_files(max_age_hours=1)
 
+
 def cleanup_very_old_files():
     """Очищает файлы старше 24 часов"""
     cleanup_temp_files(max_age_hours=24)
 
+
 if __name__ == "__main__":
-    # Тестовая очистка
+    # Разовая очистка
+    logging.basicConfig(level=logging.INFO)
     cleanup_temp_files()
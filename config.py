@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 # Загружаем переменные окружения
@@ -15,14 +16,102 @@ if not BOT_TOKEN:
         "BOT_TOKEN=your_bot_token_here"
     )
 
+# Режим получения обновлений
+BOT_MODE = os.getenv('BOT_MODE', 'polling')  # polling или webhook
+CONCURRENT_UPDATES = int(os.getenv('CONCURRENT_UPDATES', '64'))  # Обновлений обрабатывается одновременно
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')  # Внешний адрес, например https://bot.example.com
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', 'telegram')
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8000'))
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')  # Проверка заголовка X-Telegram-Bot-Api-Secret-Token
+
+# Запуск
+PREWARM = os.getenv('PREWARM', 'True').lower() == 'true'  # Прогрев обработки в фоне после запуска
+IMPORT_TIME_BUDGET = float(os.getenv('IMPORT_TIME_BUDGET', '2.0'))  # Допустимое время импорта модулей, сек
+
+# Прогресс обработки в сообщении пользователя
+PROGRESS_INTERVAL = float(os.getenv('PROGRESS_INTERVAL', '3'))  # Не чаще одного редактирования за N сек
+# Текст длиннее отправляется файлами .txt и .srt, а не сообщениями
+TRANSCRIPT_DOCUMENT_THRESHOLD = int(os.getenv('TRANSCRIPT_DOCUMENT_THRESHOLD', '12000'))
+
+# Ограничение исходящих сообщений (лимиты Telegram)
+OUTBOUND_GLOBAL_RATE = float(os.getenv('OUTBOUND_GLOBAL_RATE', '30'))  # Сообщений в секунду на весь бот
+OUTBOUND_CHAT_RATE = float(os.getenv('OUTBOUND_CHAT_RATE', '1'))  # Сообщений в секунду в личный чат
+OUTBOUND_CHAT_BURST = int(os.getenv('OUTBOUND_CHAT_BURST', '3'))  # Сообщений в чат подряд без ожидания
+OUTBOUND_GROUP_PER_MINUTE = float(os.getenv('OUTBOUND_GROUP_PER_MINUTE', '20'))  # Сообщений в минуту в группу
+OUTBOUND_MAX_RETRIES = int(os.getenv('OUTBOUND_MAX_RETRIES', '3'))  # Повторов после RetryAfter
+
+# Адрес Bot API (пусто - api.telegram.org; например локальный сервер или loadtest/fake_bot_api.py)
+BOT_API_BASE_URL = os.getenv('BOT_API_BASE_URL', '')  # Например http://127.0.0.1:8081/bot
+BOT_API_BASE_FILE_URL = os.getenv('BOT_API_BASE_FILE_URL', '')  # Например http://127.0.0.1:8081/file/bot
+# Сервер telegram-bot-api запущен с --local: файлы без лимита 20MB, читаются прямо с его диска
+BOT_API_LOCAL_MODE = os.getenv('BOT_API_LOCAL_MODE', 'False').lower() == 'true'
+
 # Настройки обработки файлов
 MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB
+# Больше через Bot API не скачать: 20MB у api.telegram.org, до 2000MB у локального сервера
+MAX_DOWNLOAD_SIZE = int(os.getenv('MAX_DOWNLOAD_SIZE_MB', '2000' if BOT_API_LOCAL_MODE else '20')) * 1024 * 1024
+DOWNLOAD_CONNECTIONS = int(os.getenv('DOWNLOAD_CONNECTIONS', '4'))  # Параллельных Range запросов на файл
+DOWNLOAD_PART_SIZE = int(os.getenv('DOWNLOAD_PART_SIZE_MB', '4')) * 1024 * 1024  # Размер одной части
 SUPPORTED_VIDEO_FORMATS = ['.mp4', '.avi', '.mov', '.mkv']
 SUPPORTED_AUDIO_FORMATS = ['.mp3', '.wav', '.m4a', '.ogg']
+TWO_PASS_ENCODING = os.getenv('TWO_PASS_ENCODING', 'False').lower() == 'true'  # Двухпроходное сжатие видео
+
+# Настройки временных файлов задач
+SCRATCH_DIR = os.getenv('SCRATCH_DIR', os.path.join(tempfile.gettempdir(), 'convert_bot'))
+JOB_DISK_BUDGET = int(os.getenv('JOB_DISK_BUDGET_MB', '500')) * 1024 * 1024  # Лимит диска на задачу
+
+# Настройки скачивания в память (tmpfs)
+INGEST_RAM_DIR = os.getenv(
+    'INGEST_RAM_DIR', os.path.join('/dev/shm', 'convert_bot') if os.path.isdir('/dev/shm') else ''
+)  # Пустое значение - всегда скачивать на диск
+INGEST_MEMORY_THRESHOLD = int(os.getenv('INGEST_MEMORY_THRESHOLD_MB', '20')) * 1024 * 1024  # Файлы меньше - в память
+INGEST_MEMORY_BUDGET = int(os.getenv('INGEST_MEMORY_BUDGET_MB', '256')) * 1024 * 1024  # Общий лимит памяти
+
+# Настройки распознавания речи
+RECOGNITION_LANGUAGE = os.getenv('RECOGNITION_LANGUAGE', 'ru')
+RECOGNITION_BACKEND = os.getenv('RECOGNITION_BACKEND', 'google')  # google или vosk (локально)
+VOSK_MODEL_PATH = os.getenv('VOSK_MODEL_PATH', os.path.join('models', 'vosk-model-small-ru-0.22'))
+RECOGNITION_FANOUT = int(os.getenv('RECOGNITION_FANOUT', '4'))  # Фрагментов распознается одновременно
+MAX_CHUNK_SECONDS = int(os.getenv('MAX_CHUNK_SECONDS', '30'))  # Максимальная длина фрагмента
+CHUNK_RETRIES = int(os.getenv('CHUNK_RETRIES', '2'))  # Повторы при ошибке сервиса
+STREAMING_INGEST = os.getenv('STREAMING_INGEST', 'True').lower() == 'true'  # Распознавать во время скачивания
+
+# Настройки кэша распознанного текста
+TRANSCRIPT_CACHE_PATH = os.getenv('TRANSCRIPT_CACHE_PATH', os.path.join('data', 'transcripts.sqlite3'))
+TRANSCRIPT_CACHE_MAX_BYTES = int(os.getenv('TRANSCRIPT_CACHE_MAX_MB', '100')) * 1024 * 1024
 
 # Настройки очистки файлов
-AUTO_DELETE_TEMP_FILES = True  # Автоматически удалять временные файлы
-CLEANUP_INTERVAL = 300  # Очистка каждые 5 минут (в секундах)
+AUTO_DELETE_TEMP_FILES = os.getenv('AUTO_DELETE_TEMP_FILES', 'True').lower() == 'true'  # Фоновая очистка
+CLEANUP_INTERVAL = int(os.getenv('CLEANUP_INTERVAL', '300'))  # Очистка каждые 5 минут (в секундах)
+TEMP_MAX_AGE = int(os.getenv('TEMP_MAX_AGE_MINUTES', '60')) * 60  # Файлы старше удаляются всегда
+DISK_HIGH_WATERMARK = float(os.getenv('DISK_HIGH_WATERMARK', '0.9'))  # Доля занятого места, с которой удаляем
+DISK_LOW_WATERMARK = float(os.getenv('DISK_LOW_WATERMARK', '0.8'))  # ...самые старые файлы до этой доли
+
+# Настройки параллельной обработки
+MAX_CONCURRENT_JOBS = int(os.getenv('MAX_CONCURRENT_JOBS', '4'))  # Одновременных задач обработки
+CPU_WORKERS = int(os.getenv('CPU_WORKERS', str(os.cpu_count() or 2)))  # Процессы для кодирования видео
+IO_WORKERS = int(os.getenv('IO_WORKERS', '8'))  # Потоки для распознавания речи
+MAX_QUEUE_DEPTH = int(os.getenv('MAX_QUEUE_DEPTH', '50'))  # Задач в очереди, дальше - "бот перегружен"
+JOB_AGING_FACTOR = float(os.getenv('JOB_AGING_FACTOR', '1.0'))  # Насколько ожидание повышает приоритет
+
+# Настройки разделения на бота и медиа-воркеров
+PROCESSING_MODE = os.getenv('PROCESSING_MODE', 'local')  # local - обработка в боте, broker - в медиа-воркерах
+BROKER_PATH = os.getenv('BROKER_PATH', os.path.join('data', 'broker.sqlite3'))
+WORKER_CONCURRENCY = int(os.getenv('WORKER_CONCURRENCY', str(MAX_CONCURRENT_JOBS)))  # Задач на один воркер
+WORKER_HEARTBEAT_INTERVAL = float(os.getenv('WORKER_HEARTBEAT_INTERVAL', '10'))  # Секунд между heartbeat
+JOB_LEASE_SECONDS = float(os.getenv('JOB_LEASE_SECONDS', '60'))  # Без heartbeat задача вернется в очередь
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))  # Попыток выполнить задачу
+BROKER_POLL_INTERVAL = float(os.getenv('BROKER_POLL_INTERVAL', '1.0'))  # Секунд между опросами брокера
+
+# Настройки метрик Prometheus
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9108'))  # 0 - метрики отключены
+WORKER_METRICS_PORT = int(os.getenv('WORKER_METRICS_PORT', '0'))  # Для медиа-воркера
+
+# Профилирование части задач MediaProcessor
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))  # Доля задач под профилировщиком (0.0 - 1.0)
+PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join('data', 'profiles'))
+PROFILER = os.getenv('PROFILER', 'cprofile')  # cprofile или pyinstrument (pip install pyinstrument)
 
 # Настройки логирования
 LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
@@ -0,0 +1,155 @@
+"""
+Скачивание файлов Telegram: с диска локального Bot API сервера или по HTTP частями
+"""
+
+import os
+import asyncio
+import logging
+
+import httpx
+
+from config import DOWNLOAD_CONNECTIONS, DOWNLOAD_PART_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Размер блока, который передается обработчику данных
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+
+def local_file_path(file_path: str):
+    """
+    Путь к файлу на диске, если Bot API сервер работает в режиме --local
+
+    Такой сервер возвращает в getFile абсолютный путь, а PTB оставляет его
+    как есть, если файл виден боту (общий volume). Тогда файл можно читать
+    на месте, не скачивая.
+
+    Returns:
+        str | None: Путь к файлу или None, если файл нужно скачивать
+    """
+    if file_path and os.path.isabs(file_path) and os.path.isfile(file_path):
+        return file_path
+    return None
+
+
+def _content_range_total(value: str):
+    """Полный размер файла из заголовка Content-Range ('bytes 0-99/1234')"""
+    total = (value or '').rpartition('/')[2]
+    return int(total) if total.isdigit() else None
+
+
+class RangedDownloader:
+    """
+    Скачивает файл несколькими параллельными HTTP Range запросами.
+
+    Файл делится на части по part_size байт, одновременно скачивается до
+    connections частей. Обработчик on_data получает данные строго по
+    порядку, поэтому их можно сразу писать в IngestBuffer или подавать в
+    ffmpeg. В памяти одновременно не больше connections частей. Если
+    сервер не поддерживает Range (ответ 200 вместо 206) или файл меньше
+    одной части, файл скачивается одним потоком.
+    """
+
+    def __init__(self, connections: int = DOWNLOAD_CONNECTIONS, part_size: int = DOWNLOAD_PART_SIZE):
+        self.connections = max(1, connections)
+        self.part_size = part_size
+
+    async def fetch(self, url: str, on_data, total_bytes: int = None) -> int:
+        """
+        Скачивает файл, передавая данные в on_data по порядку
+
+        Args:
+            url: Ссылка на файл
+            on_data: Корутинная функция on_data(bytes)
+            total_bytes: Размер файла, если известен заранее
+
+        Returns:
+            int: Скачано байт
+        """
+        timeout = httpx.Timeout(60.0, connect=10.0)
+        limits = httpx.Limits(max_connections=self.connections)
+        async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+            if self.connections == 1 or (total_bytes and total_bytes <= self.part_size):
+                async with client.stream('GET', url) as response:
+                    response.raise_for_status()
+                    return await self._stream(response, on_data)
+
+            # Первая часть заодно показывает, поддерживает ли сервер Range и каков размер файла
+            async with client.stream('GET', url, headers={'Range': f'bytes=0-{self.part_size - 1}'}) as response:
+                response.raise_for_status()
+                total = _content_range_total(response.headers.get('Content-Range'))
+                if response.status_code != 206 or total is None:
+                    logger.debug(f"Сервер не поддерживает Range, скачиваю одним потоком: {url}")
+                    return await self._stream(response, on_data)
+
+                parts = [(start, min(start + self.part_size, total) - 1)
+                         for start in range(self.part_size, total, self.part_size)]
+                pending = []
+                try:
+                    # Остальные части скачиваются, пока обрабатывается первая
+                    for start, end in parts[:self.connections - 1]:
+                        pending.append(asyncio.create_task(self._fetch_part(client, url, start, end)))
+                    downloaded = await self._stream(response, on_data)
+                    next_part = len(pending)
+
+                    while pending:
+                        data = await pending.pop(0)
+                        if next_part < len(parts):
+                            start, end = parts[next_part]
+                            pending.append(asyncio.create_task(self._fetch_part(client, url, start, end)))
+                            next_part += 1
+                        for offset in range(0, len(data), DOWNLOAD_CHUNK_SIZE):
+                            await on_data(data[offset:offset + DOWNLOAD_CHUNK_SIZE])
+                        downloaded += len(data)
+                finally:
+                    for task in pending:
+                        task.cancel()
+                    await asyncio.gather(*pending, return_exceptions=True)
+
+        if downloaded != total:
+            raise IOError(f"Скачано {downloaded} байт из {total}")
+        logger.debug(f"Файл скачан в {min(self.connections, len(parts) + 1)} потоков: {total} байт")
+        return downloaded
+
+    async def download(self, url: str, out, total_bytes: int = None, progress=None) -> int:
+        """
+        Скачивает файл в out (IngestBuffer или другой файл для записи)
+
+        Args:
+            url: Ссылка на файл
+            out: Файл для записи; закрывается после скачивания
+            total_bytes: Размер файла, если известен заранее
+            progress: ProgressReporter задачи (скачанные байты)
+
+        Returns:
+            int: Скачано байт
+        """
+        downloaded = 0
+
+        async def on_data(data: bytes):
+            nonlocal downloaded
+            out.write(data)
+            downloaded += len(data)
+            if progress is not None:
+                progress.update('download', downloaded, total_bytes or downloaded)
+
+        try:
+            return await self.fetch(url, on_data, total_bytes)
+        finally:
+            out.close()
+
+    @staticmethod
+    async def _stream(response: httpx.Response, on_data) -> int:
+        downloaded = 0
+        async for data in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+            await on_data(data)
+            downloaded += len(data)
+        return downloaded
+
+    @staticmethod
+    async def _fetch_part(client: httpx.AsyncClient, url: str, start: int, end: int) -> bytes:
+        response = await client.get(url, headers={'Range': f'bytes={start}-{end}'})
+        response.raise_for_status()
+        if response.status_code != 206 or len(response.content) != end - start + 1:
+            raise IOError(f"Сервер вернул неверную часть файла {start}-{end}")
+        return response.content
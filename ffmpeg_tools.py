@@ -0,0 +1,250 @@
+"""
+Прямые вызовы ffmpeg и ffprobe
+"""
+
+import logging
+import os
+import subprocess
+import threading
+
+logger = logging.getLogger(__name__)
+
+FFMPEG_BINARY = 'ffmpeg'
+FFPROBE_BINARY = 'ffprobe'
+
+# Формат PCM, подходящий для распознавания речи
+PCM_SAMPLE_RATE = 16000
+PCM_SAMPLE_WIDTH = 2  # 16 бит
+PCM_CHANNELS = 1
+
+# Доля размера, которую забирает контейнер MP4 и погрешность rate control
+CONTAINER_OVERHEAD = 0.05
+MIN_VIDEO_BITRATE_K = 24
+
+# Ступени упрощения, если видео не укладывается в целевой размер: сначала
+# звук 32k моно, затем меньше кадр и частота кадров. Поля: высота кадра не
+# выше (None - как запрошено), кадров в секунду (None - как в исходнике),
+# битрейт аудио (None - как запрошено), моно, минимальный битрейт видео
+ENCODING_LADDER = (
+    (None, None, None, False, MIN_VIDEO_BITRATE_K),
+    (None, None, 32, True, MIN_VIDEO_BITRATE_K),
+    (144, 15, 32, True, 16),
+    (96, 10, 24, True, 10),
+)
+
+# Аудио кодеки, которые можно скопировать в отдельный файл без перекодирования
+COPYABLE_AUDIO_CODECS = {
+    'aac': '.m4a',
+    'mp3': '.mp3',
+    'opus': '.ogg',
+    'vorbis': '.ogg',
+    'flac': '.flac',
+}
+
+
+# Аргументы выхода PCM для распознавания в stdout (после -i)
+PCM_OUTPUT_ARGS = [
+    '-map', '0:a:0',
+    '-vn', '-sn', '-dn',
+    '-ac', str(PCM_CHANNELS),
+    '-ar', str(PCM_SAMPLE_RATE),
+    '-acodec', 'pcm_s16le',
+    '-f', 's16le',
+    'pipe:1'
+]
+
+# Счетчик запусков ffmpeg/ffprobe в текущем потоке (задачи пула выполняются в своих потоках)
+_spawned = threading.local()
+
+
+class FFmpegError(Exception):
+    """ffmpeg завершился с ошибкой"""
+
+
+class NoAudioStreamError(ValueError):
+    """В файле нет аудио дорожки"""
+
+
+class TargetSizeUnreachableError(ValueError):
+    """Видео не уложить в целевой размер даже с самыми низкими настройками"""
+
+
+def spawned_count() -> int:
+    """Сколько раз текущий поток запускал ffmpeg или ffprobe (для замеров задачи)"""
+    return getattr(_spawned, 'count', 0)
+
+
+def _run(command: list) -> subprocess.CompletedProcess:
+    _spawned.count = spawned_count() + 1
+    return subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+
+def run_ffmpeg(args: list, progress_path: str = None) -> bytes:
+    """
+    Запускает ffmpeg и возвращает его stdout
+
+    Args:
+        args: Аргументы ffmpeg (без имени программы)
+        progress_path: Файл, куда ffmpeg пишет прогресс (-progress), если нужен
+
+    Returns:
+        bytes: Данные, записанные ffmpeg в stdout
+
+    Raises:
+        FFmpegError: Если ffmpeg завершился с ошибкой
+    """
+    command = [FFMPEG_BINARY, '-hide_banner', '-nostdin', '-loglevel', 'error']
+    if progress_path:
+        command += ['-progress', progress_path]
+    command += args
+    logger.debug(f"Запуск ffmpeg: {' '.join(command)}")
+
+    process = _run(command)
+    if process.returncode != 0:
+        stderr = process.stderr.decode('utf-8', errors='replace').strip()
+        raise FFmpegError(stderr[-1000:] or f"ffmpeg завершился с кодом {process.returncode}")
+    return process.stdout
+
+
+def probe_duration(input_path: str) -> float:
+    """
+    Возвращает длительность файла в секундах
+
+    Raises:
+        FFmpegError: Если ffprobe не смог прочитать файл
+    """
+    command = [
+        FFPROBE_BINARY, '-v', 'error',
+        '-show_entries', 'format=duration',
+        '-of', 'default=noprint_wrappers=1:nokey=1',
+        input_path
+    ]
+    process = _run(command)
+    output = process.stdout.decode('utf-8', errors='replace').strip()
+    try:
+        return float(output)
+    except ValueError:
+        stderr = process.stderr.decode('utf-8', errors='replace').strip()
+        raise FFmpegError(f"Не удалось определить длительность: {stderr or output}") from None
+
+
+def probe_audio_codec(input_path: str):
+    """
+    Возвращает имя кодека первой аудио дорожки или None, если ее нет
+    """
+    command = [
+        FFPROBE_BINARY, '-v', 'error',
+        '-select_streams', 'a:0',
+        '-show_entries', 'stream=codec_name',
+        '-of', 'default=noprint_wrappers=1:nokey=1',
+        input_path
+    ]
+    process = _run(command)
+    if process.returncode != 0:
+        stderr = process.stderr.decode('utf-8', errors='replace').strip()
+        raise FFmpegError(f"Не удалось прочитать файл: {stderr}")
+    codec = process.stdout.decode('utf-8', errors='replace').strip()
+    return codec or None
+
+
+def extract_audio(input_path: str, output_path: str, codec: str = None, size_limit: int = None) -> str:
+    """
+    Извлекает аудио дорожку в отдельный файл, по возможности без перекодирования
+
+    Если кодек дорожки можно положить в контейнер с расширением output_path
+    (например, AAC в .m4a), дорожка копируется как есть (-c:a copy), и
+    ffmpeg ничего не декодирует. Иначе аудио кодируется в формат по
+    расширению output_path.
+
+    Args:
+        input_path: Исходный файл
+        output_path: Куда сохранить аудио
+        codec: Кодек аудио дорожки, если уже известен (иначе запускается ffprobe)
+        size_limit: Лимит размера файла в байтах (ffmpeg -fs): запись останавливается
+                    чуть позже лимита, поэтому превышение видно по размеру файла
+
+    Returns:
+        str: Путь к аудио файлу
+
+    Raises:
+        NoAudioStreamError: Если в файле нет аудио дорожки
+    """
+    codec = codec or probe_audio_codec(input_path)
+    if codec is None:
+        raise NoAudioStreamError("В видео файле нет аудио дорожки")
+
+    ext = os.path.splitext(output_path)[1].lower()
+    if COPYABLE_AUDIO_CODECS.get(codec) == ext:
+        logger.info(f"Копирую аудио дорожку без перекодирования ({codec})")
+        codec_args = ['-c:a', 'copy']
+    else:
+        logger.info(f"Перекодирую аудио дорожку {codec} в {ext}")
+        codec_args = []
+
+    limit_args = ['-fs', str(size_limit)] if size_limit is not None else []
+    run_ffmpeg(['-i', input_path, '-map', '0:a:0', '-vn', '-sn', '-dn'] + codec_args + limit_args + ['-y', output_path])
+    return output_path
+
+
+def plan_video_encoding(target_bytes: int, duration: float, height: int, audio_bitrate_k: int) -> dict:
+    """
+    Подбирает настройки кодирования, чтобы файл уложился в target_bytes
+
+    Битрейт видео - то, что остается от целевого размера после звука. Если
+    его не хватает, настройки упрощаются по ENCODING_LADDER: звук 32k моно,
+    затем кадр меньше и реже.
+
+    Args:
+        target_bytes: Целевой размер файла
+        duration: Длительность в секундах
+        height: Запрошенная высота кадра
+        audio_bitrate_k: Запрошенный битрейт аудио в kbps
+
+    Returns:
+        dict: video_k, audio_k (kbps), height, fps (None - как в исходнике), mono
+
+    Raises:
+        TargetSizeUnreachableError: Если не подходит даже последняя ступень
+    """
+    total_k = target_bytes * 8 * (1 - CONTAINER_OVERHEAD) / max(duration, 1.0) / 1000
+    for level, (max_height, fps, audio_k, mono, min_video_k) in enumerate(ENCODING_LADDER):
+        audio_k = min(audio_k or audio_bitrate_k, audio_bitrate_k)
+        video_k = int(total_k - audio_k)
+        if video_k < min_video_k:
+            continue
+        plan = {
+            'video_k': video_k,
+            'audio_k': audio_k,
+            'height': min(max_height or height, height),
+            'fps': fps,
+            'mono': mono,
+        }
+        if level:
+            logger.warning(
+                f"⚠️ Для {duration:.0f} сек в {target_bytes / (1024*1024):.1f}MB упрощаю кодирование: "
+                f"{plan['height']}p, {fps or 'исходные'} кадр/с, аудио {audio_k}k моно"
+            )
+        return plan
+    raise TargetSizeUnreachableError(
+        f"Видео длительностью {duration:.0f} сек не сжать до {target_bytes / (1024*1024):.0f}MB "
+        f"(максимум {max_duration_for_size(target_bytes) / 60:.0f} мин)"
+    )
+
+
+def max_duration_for_size(target_bytes: int) -> float:
+    """Самая большая длительность (сек), которую последняя ступень ENCODING_LADDER уложит в target_bytes"""
+    _, _, audio_k, _, min_video_k = ENCODING_LADDER[-1]
+    return target_bytes * 8 * (1 - CONTAINER_OVERHEAD) / (audio_k + min_video_k) / 1000
+
+
+def video_codec_args(video_k: int, height: int, preset: str = 'fast', fps: int = None) -> list:
+    """Аргументы кодирования H.264 с битрейтом video_k kbps, высотой кадра height и частотой кадров fps"""
+    video_filter = f'scale=-2:{height}' + (f',fps={fps}' if fps else '')
+    return [
+        '-vf', video_filter,
+        '-c:v', 'libx264',
+        '-preset', preset,
+        '-b:v', f'{video_k}k',
+        '-maxrate', f'{video_k}k',
+        '-bufsize', f'{video_k * 2}k',
+    ]
@@ -0,0 +1,142 @@
+"""
+Буфер для скачиваемых файлов: в памяти (tmpfs) для маленьких, на диске для больших
+"""
+
+import os
+import shutil
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryBudget:
+    """
+    Общий лимит памяти под скачиваемые файлы всех задач.
+
+    Задача резервирует место перед записью в tmpfs и освобождает его
+    после обработки. Если резерв не удался, файл пишется на диск.
+    """
+
+    def __init__(self, limit_bytes: int):
+        self.limit_bytes = limit_bytes
+        self._used = 0
+        self._lock = threading.Lock()
+
+    @property
+    def used(self) -> int:
+        """Зарезервировано байт"""
+        return self._used
+
+    def try_reserve(self, size: int) -> bool:
+        """Резервирует size байт; возвращает False, если лимит будет превышен"""
+        with self._lock:
+            if self._used + size > self.limit_bytes:
+                return False
+            self._used += size
+            return True
+
+    def release(self, size: int):
+        """Возвращает зарезервированные байты"""
+        with self._lock:
+            self._used = max(0, self._used - size)
+
+
+def ram_dir_available(path: str) -> bool:
+    """Проверяет, что директорию в tmpfs можно использовать"""
+    if not path:
+        return False
+    try:
+        os.makedirs(path, exist_ok=True)
+    except OSError:
+        return False
+    return os.access(path, os.W_OK)
+
+
+class IngestBuffer:
+    """
+    Файл, в который скачивается входящее медиа.
+
+    Если размер файла известен и не больше memory_threshold, а в общем
+    лимите памяти есть место, файл пишется в ram_dir (tmpfs, например
+    /dev/shm) - ffmpeg читает его без обращения к диску. Иначе, а также
+    если данных пришло больше ожидаемого, файл пишется (или переносится)
+    в рабочую директорию задачи на диске.
+
+    Объект ведет себя как файл для записи (write/close), поэтому его можно
+    передать в RangedDownloader.download или писать в него по мере скачивания.
+    Запись, которая вышла бы за лимит диска задачи (workspace.remaining()),
+    прерывается исключением WorkspaceBudgetExceeded, не дожидаясь конца
+    скачивания.
+    """
+
+    def __init__(self, workspace, name: str, expected_size: int = None,
+                 memory_budget: MemoryBudget = None, ram_dir: str = None,
+                 memory_threshold: int = 0):
+        self.disk_path = workspace.file(name)
+        self.workspace = workspace
+        self.size_limit = workspace.remaining()
+        self.memory_budget = memory_budget
+        self.reserved = 0
+        self.size = 0
+
+        if (expected_size and expected_size <= memory_threshold and memory_budget is not None
+                and ram_dir_available(ram_dir) and memory_budget.try_reserve(expected_size)):
+            self.reserved = expected_size
+            self.path = os.path.join(ram_dir, f"{os.path.basename(workspace.path)}_{name}")
+            logger.debug(f"Файл {name} ({expected_size} байт) скачивается в память: {self.path}")
+        else:
+            self.path = self.disk_path
+
+        self._file = open(self.path, 'wb')
+
+    @property
+    def in_memory(self) -> bool:
+        """Файл находится в tmpfs"""
+        return self.path != self.disk_path
+
+    def write(self, data: bytes) -> int:
+        """Записывает данные; при превышении резерва переносит файл на диск"""
+        if self.size_limit is not None and self.size + len(data) > self.size_limit:
+            raise self.workspace.budget_error(self.workspace.budget_bytes - self.size_limit + self.size + len(data))
+        if self.in_memory and self.size + len(data) > self.reserved:
+            self._spill()
+        self._file.write(data)
+        self.size += len(data)
+        return len(data)
+
+    def _spill(self):
+        """Переносит уже записанные данные из tmpfs на диск"""
+        logger.info(f"💾 Файл больше ожидаемого, переношу на диск: {self.disk_path}")
+        self._file.close()
+        shutil.move(self.path, self.disk_path)
+        self._release_memory()
+        self.path = self.disk_path
+        self._file = open(self.path, 'ab')
+
+    def close(self):
+        """Завершает запись; файл остается доступен по self.path"""
+        if not self._file.closed:
+            self._file.close()
+
+    def _release_memory(self):
+        if self.reserved:
+            self.memory_budget.release(self.reserved)
+            self.reserved = 0
+
+    def release(self):
+        """Удаляет файл из памяти и освобождает резерв (файл на диске удалит workspace.cleanup)"""
+        self.close()
+        if self.in_memory:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+        self._release_memory()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
@@ -0,0 +1,213 @@
+"""
+Очередь задач обработки с ограничением глубины и приоритетом коротких задач
+"""
+
+import asyncio
+import itertools
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Примерный битрейт для оценки длительности, если Telegram ее не передал
+AUDIO_BYTES_PER_SECOND = 16 * 1024  # ~128 kbps
+VIDEO_BYTES_PER_SECOND = 256 * 1024  # ~2 Mbps
+
+
+class QueueFullError(Exception):
+    """Очередь заполнена, новую задачу принять нельзя"""
+
+
+def estimate_cost(duration: int = None, file_size: int = None, kind: str = 'audio') -> float:
+    """
+    Оценивает стоимость задачи в секундах медиа
+
+    Args:
+        duration: Длительность из Telegram (если известна)
+        file_size: Размер файла в байтах
+        kind: 'audio' или 'video'
+
+    Returns:
+        float: Оценка стоимости (чем меньше, тем раньше задача будет выполнена)
+    """
+    if duration:
+        return float(duration)
+    if file_size:
+        rate = VIDEO_BYTES_PER_SECOND if kind == 'video' else AUDIO_BYTES_PER_SECOND
+        return file_size / rate
+    return 0.0
+
+
+class _QueuedJob:
+    def __init__(self, seq: int, cost: float, job, name: str, key=None):
+        self.seq = seq
+        self.cost = cost
+        self.job = job
+        self.name = name
+        self.key = key
+        self.enqueued_at = time.monotonic()
+
+    def priority(self, now: float, aging_factor: float) -> tuple:
+        # Чем дольше задача ждет, тем выше ее приоритет - длинные задачи не голодают
+        return (self.cost - (now - self.enqueued_at) * aging_factor, self.seq)
+
+
+class JobScheduler:
+    """
+    Планировщик задач между обработчиками бота и MediaProcessor.
+
+    Задачи выполняются не более чем workers одновременно, в очереди ждут не
+    более max_queue_depth задач. Из очереди первой берется самая короткая
+    задача (shortest job first); за каждую секунду ожидания стоимость
+    задачи уменьшается на aging_factor, поэтому длинные задачи тоже
+    дождутся своей очереди.
+
+    Задачи с одинаковым key (например, одного чата) выполняются по одной и
+    в порядке постановки: по стоимости упорядочиваются только задачи разных
+    ключей, и короткий второй файл чата не обгонит длинный первый.
+    """
+
+    def __init__(self, workers: int, max_queue_depth: int, aging_factor: float = 1.0):
+        self.workers = workers
+        self.max_queue_depth = max_queue_depth
+        self.aging_factor = aging_factor
+
+        self._queue = []
+        self._seq = itertools.count()
+        self._available = asyncio.Event()
+        self._idle = 0
+        self._tasks = []
+        self._stopping = False
+        # Ключи выполняемых задач
+        self._running_keys = set()
+
+    @property
+    def depth(self) -> int:
+        """Количество задач в очереди"""
+        return len(self._queue)
+
+    @property
+    def running(self) -> int:
+        """Количество выполняемых задач"""
+        return len(self._tasks) - self._idle if self._tasks else 0
+
+    def start(self):
+        """Запускает воркеры очереди (вызывается внутри event loop)"""
+        if self._tasks:
+            return
+        self._stopping = False
+        self._tasks = [
+            asyncio.create_task(self._worker(i), name=f"job-worker-{i}")
+            for i in range(self.workers)
+        ]
+
+    async def stop(self):
+        """Останавливает воркеры; задачи в очереди отбрасываются"""
+        self._stopping = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue.clear()
+        self._running_keys.clear()
+
+    def submit(self, job, cost: float, name: str = '', key=None) -> int:
+        """
+        Ставит задачу в очередь
+
+        Args:
+            job: Корутинная функция без аргументов
+            cost: Оценка стоимости задачи (см. estimate_cost)
+            name: Название задачи для логов
+            key: Задачи с одним ключом выполняются по порядку, по одной (None - без ограничения)
+
+        Returns:
+            int: Позиция в очереди (0 - задача начнется сразу)
+
+        Raises:
+            QueueFullError: Если очередь заполнена
+        """
+        if len(self._queue) >= self.max_queue_depth:
+            raise QueueFullError(f"Очередь заполнена: {len(self._queue)} задач")
+
+        entry = _QueuedJob(next(self._seq), cost, job, name, key)
+        self._queue.append(entry)
+        position = self.position(entry)
+        self._available.set()
+
+        logger.info(f"Задача {name} в очереди: стоимость {cost:.0f}, позиция {position}, глубина {self.depth}")
+        return position
+
+    def position(self, entry: _QueuedJob) -> int:
+        """Позиция задачи с учетом свободных воркеров (0 - начнется сразу)"""
+        now = time.monotonic()
+        priority = entry.priority(now, self.aging_factor)
+        ahead = sum(
+            1 for other in self._queue
+            if other.priority(now, self.aging_factor) < priority
+            or (entry.key is not None and other.key == entry.key and other.seq < entry.seq)
+        )
+        if entry.key is not None and entry.key in self._running_keys:
+            # Задача ждет окончания предыдущей задачи того же ключа
+            return ahead + 1
+        return max(0, ahead + 1 - self._idle)
+
+    def _pop(self):
+        """Забирает самую приоритетную задачу, которую можно начать (или None)"""
+        now = time.monotonic()
+        eligible = []
+        seen_keys = set()
+        for entry in sorted(self._queue, key=lambda e: e.seq):
+            if entry.key is None:
+                eligible.append(entry)
+            elif entry.key not in seen_keys:
+                # Из задач одного ключа начать можно только самую раннюю
+                seen_keys.add(entry.key)
+                if entry.key not in self._running_keys:
+                    eligible.append(entry)
+        if not eligible:
+            return None
+        entry = min(eligible, key=lambda e: e.priority(now, self.aging_factor))
+        self._queue.remove(entry)
+        if entry.key is not None:
+            self._running_keys.add(entry.key)
+        return entry
+
+    def _worker_cancelled(self) -> bool:
+        """Отменяют ли сам воркер (stop, остановка event loop)"""
+        if self._stopping:
+            return True
+        task = asyncio.current_task()
+        # Task.cancelling() есть начиная с Python 3.11
+        cancelling = getattr(task, 'cancelling', None)
+        return cancelling is not None and cancelling() > 0
+
+    async def _worker(self, number: int):
+        while True:
+            self._idle += 1
+            try:
+                entry = self._pop()
+                while entry is None:
+                    self._available.clear()
+                    await self._available.wait()
+                    entry = self._pop()
+            finally:
+                self._idle -= 1
+
+            waited = time.monotonic() - entry.enqueued_at
+            logger.info(f"Воркер {number} начал задачу {entry.name} (ожидание {waited:.1f} сек)")
+            try:
+                await entry.job()
+            except asyncio.CancelledError:
+                if self._worker_cancelled():
+                    raise
+                # CancelledError из чужого future (например, отмененного общего
+                # вычисления single-flight): воркер продолжает работу
+                logger.error(f"Задача {entry.name} отменена")
+            except Exception as e:
+                logger.error(f"Ошибка в задаче {entry.name}: {e}")
+            finally:
+                if entry.key is not None:
+                    # Следующая задача того же ключа может начинаться
+                    self._running_keys.discard(entry.key)
+                    self._available.set()
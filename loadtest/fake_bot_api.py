@@ -0,0 +1,195 @@
+"""
+Локальный поддельный Bot API сервер для нагрузочных тестов
+
+Отдает getFile и скачивание файлов из корпуса, отвечает на методы
+отправки сообщений и записывает все вызовы. Бот подключается к нему
+через BOT_API_BASE_URL / BOT_API_BASE_FILE_URL. Файлы отдаются с
+поддержкой Range; с local_mode=True getFile, как telegram-bot-api --local,
+возвращает абсолютный путь к файлу на диске.
+"""
+
+import os
+import re
+import json
+import time
+import threading
+import itertools
+from email.parser import BytesParser
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlparse
+
+# Методы, которые возвращают отправленное сообщение
+MESSAGE_METHODS = {
+    'sendMessage', 'editMessageText', 'sendVideo', 'sendDocument', 'sendAudio', 'sendVoice', 'sendPhoto'
+}
+
+
+class FakeBotAPI:
+    """
+    Поддельный Bot API в отдельном потоке.
+
+    files: словарь file_id -> путь к локальному файлу. on_call вызывается
+    для каждого вызова метода (из потока сервера) с записью вызова.
+    """
+
+    def __init__(self, files: dict, host: str = '127.0.0.1', port: int = 0, on_call=None,
+                 local_mode: bool = False):
+        self.files = files
+        self.on_call = on_call
+        self.local_mode = local_mode
+        self.calls = []
+        self.bytes_served = 0
+        self.range_requests = 0
+        self.bytes_uploaded = 0
+        self._lock = threading.Lock()
+        self._message_ids = itertools.count(1000)
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/bot"
+
+    @property
+    def base_file_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/file/bot"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-bot-api', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def method_counts(self) -> dict:
+        counts = {}
+        for call in self.calls:
+            counts[call['method']] = counts.get(call['method'], 0) + 1
+        return counts
+
+    def _record(self, method: str, params: dict):
+        call = {'method': method, 'params': params, 'time': time.perf_counter()}
+        with self._lock:
+            self.calls.append(call)
+        if self.on_call is not None:
+            self.on_call(call)
+
+    def _result(self, method: str, params: dict):
+        if method == 'getMe':
+            return {'id': 1, 'is_bot': True, 'first_name': 'LoadTest', 'username': 'load_test_bot'}
+        if method == 'getFile':
+            file_id = params.get('file_id')
+            if file_id not in self.files:
+                return None
+            file_path = os.path.abspath(self.files[file_id]) if self.local_mode else file_id
+            return {'file_id': file_id, 'file_unique_id': file_id, 'file_path': file_path}
+        if method in MESSAGE_METHODS:
+            chat_id = int(params.get('chat_id', 0))
+            message = {
+                'message_id': int(params.get('message_id') or next(self._message_ids)),
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'},
+            }
+            if 'text' in params:
+                message['text'] = params['text']
+            return message
+        # deleteWebhook, setMyCommands, answerCallbackQuery и прочие
+        return True
+
+    def _make_handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, payload: dict, status: int = 200):
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _params(self) -> dict:
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                content_type = self.headers.get('Content-Type', '')
+                params = {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+
+                if content_type.startswith('application/json') and body:
+                    params.update(json.loads(body))
+                elif content_type.startswith('multipart/form-data'):
+                    message = BytesParser().parsebytes(
+                        f"Content-Type: {content_type}\r\n\r\n".encode('latin-1') + body
+                    )
+                    for part in message.get_payload():
+                        name = part.get_param('name', header='content-disposition')
+                        payload = part.get_payload(decode=True) or b''
+                        if part.get_filename():
+                            with api._lock:
+                                api.bytes_uploaded += len(payload)
+                            params[name] = f"<upload {len(payload)} bytes>"
+                        else:
+                            params[name] = payload.decode('utf-8', errors='replace')
+                elif body:
+                    params.update({key: values[0] for key, values in parse_qs(body.decode('utf-8')).items()})
+                return params
+
+            def do_POST(self):
+                self._handle_method()
+
+            def do_GET(self):
+                if self.path.startswith('/file/'):
+                    self._serve_file()
+                else:
+                    self._handle_method()
+
+            def _handle_method(self):
+                path = urlparse(self.path).path
+                method = path.rsplit('/', 1)[-1]
+                params = self._params()
+                api._record(method, params)
+                result = api._result(method, params)
+                if result is None:
+                    self._send_json({'ok': False, 'error_code': 400, 'description': 'Bad Request: file not found'}, 400)
+                else:
+                    self._send_json({'ok': True, 'result': result})
+
+            def _serve_file(self):
+                file_id = urlparse(self.path).path.rsplit('/', 1)[-1]
+                path = api.files.get(file_id)
+                if path is None:
+                    self.send_error(404)
+                    return
+                size = os.path.getsize(path)
+                match = re.fullmatch(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+                start, end = 0, size - 1
+                if match:
+                    start = int(match.group(1))
+                    end = min(int(match.group(2) or end), size - 1)
+                    if start > end:
+                        self.send_error(416)
+                        return
+                with open(path, 'rb') as f:
+                    f.seek(start)
+                    data = f.read(end - start + 1)
+                self.send_response(206 if match else 200)
+                self.send_header('Content-Type', 'application/octet-stream')
+                self.send_header('Accept-Ranges', 'bytes')
+                if match:
+                    self.send_header('Content-Range', f"bytes {start}-{end}/{size}")
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+                with api._lock:
+                    api.bytes_served += len(data)
+                    api.range_requests += bool(match)
+
+        return Handler
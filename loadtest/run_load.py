@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест TelegramBot через поддельный Bot API
+
+Бот запускается целиком (настоящие обработчики, очередь, пул воркеров),
+но вместо api.telegram.org обращается к loadtest/fake_bot_api.py. Драйвер
+кладет обновления с видео, аудио и документами в очередь приложения с
+заданной частотой и ждет итогового ответа бота в каждом чате.
+
+Примеры:
+    python loadtest/run_load.py --rate 2 --count 100
+    python loadtest/run_load.py --rate 5 --duration 120 --mix video=1,audio=3,document=1
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import threading
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+LOAD_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(LOAD_DIR)
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, 'benchmarks'))
+
+from fake_bot_api import FakeBotAPI  # noqa: E402
+from run_benchmarks import CORPUS, generate  # noqa: E402
+
+# Типы обновлений: тип -> файл корпуса по умолчанию
+DEFAULT_FILES = {
+    'video': 'video_360p_30s',
+    'audio': 'speech_30s',
+    'document': 'video_240p_5s',
+}
+
+# Ответы бота, после которых обработка обновления считается завершенной
+SUCCESS_METHODS = {'sendVideo', 'sendDocument', 'sendAudio'}
+# Итоговая правка сообщения "Обрабатываю..." (сам текст приходит раньше, частями)
+SUCCESS_MARKER = '✅ Текст извлечен'
+# Файлы .txt/.srt с длинным текстом отправляются до итогового ответа
+TRANSCRIPT_FILE_CAPTIONS = ('📄 Полный текст', '🎬 Субтитры')
+ERROR_MARKER = '❌'
+REJECTED_MARKER = '⏳ Бот сейчас перегружен'
+
+
+def parse_mix(value: str) -> dict:
+    """'video=1,audio=2' -> {'video': 1.0, 'audio': 2.0}"""
+    mix = {}
+    for item in value.split(','):
+        kind, _, weight = item.partition('=')
+        if kind not in DEFAULT_FILES:
+            raise argparse.ArgumentTypeError(f"Неизвестный тип обновления: {kind}")
+        mix[kind] = float(weight or 1)
+    return mix
+
+
+def percentile(values: list, q: float):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))
+    return round(values[index], 3)
+
+
+def _usage() -> dict:
+    """CPU секунды и пиковый RSS процесса бота и его дочерних процессов (пул, ffmpeg)"""
+    if resource is None:
+        return {'cpu_seconds': time.process_time(), 'child_cpu_seconds': 0.0, 'peak_rss_mb': 0, 'peak_child_rss_mb': 0}
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    # ru_maxrss: килобайты в Linux, байты в macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return {
+        'cpu_seconds': own.ru_utime + own.ru_stime,
+        'child_cpu_seconds': children.ru_utime + children.ru_stime,
+        'peak_rss_mb': round(own.ru_maxrss * scale / (1024 * 1024), 1),
+        'peak_child_rss_mb': round(children.ru_maxrss * scale / (1024 * 1024), 1),
+    }
+
+
+class LoadTracker:
+    """
+    Сопоставляет вызовы Bot API с отправленными обновлениями.
+
+    У каждого обновления свой чат, поэтому итоговый ответ бота находится
+    по chat_id. on_call вызывается из потока поддельного сервера.
+    """
+
+    def __init__(self):
+        self.pending = {}
+        self.results = {}
+        self._lock = threading.Lock()
+
+    def sent(self, chat_id: int, kind: str):
+        with self._lock:
+            self.pending[chat_id] = {'kind': kind, 'sent': time.perf_counter()}
+
+    def on_call(self, call: dict):
+        params = call['params']
+        try:
+            chat_id = int(params.get('chat_id', 0))
+        except (TypeError, ValueError):
+            return
+        text = str(params.get('text') or params.get('caption') or '')
+
+        if call['method'] in SUCCESS_METHODS and text.startswith(TRANSCRIPT_FILE_CAPTIONS):
+            return
+        if call['method'] in SUCCESS_METHODS or SUCCESS_MARKER in text:
+            status = 'ok'
+        elif REJECTED_MARKER in text:
+            status = 'rejected'
+        elif ERROR_MARKER in text:
+            status = 'error'
+        else:
+            return
+
+        with self._lock:
+            job = self.pending.pop(chat_id, None)
+            if job is None:
+                return
+            self.results[chat_id] = {
+                'kind': job['kind'],
+                'status': status,
+                'latency': call['time'] - job['sent'],
+                'finished': call['time'],
+                'detail': text.strip()[:200] if status == 'error' else None,
+            }
+
+    def finished(self) -> bool:
+        with self._lock:
+            return not self.pending
+
+    def expire(self):
+        """Незавершенные к концу ожидания обновления считаются ошибкой по таймауту"""
+        with self._lock:
+            for chat_id, job in self.pending.items():
+                self.results[chat_id] = {'kind': job['kind'], 'status': 'timeout', 'latency': None,
+                                         'finished': None, 'detail': None}
+            self.pending.clear()
+
+
+def make_update(update_id: int, kind: str, file_id: str, unique_id: str, path: str, duration: int) -> dict:
+    """JSON обновления Telegram с файлом корпуса"""
+    chat_id = 10_000_000 + update_id
+    size = os.path.getsize(path)
+    message = {
+        'message_id': update_id,
+        'date': int(time.time()),
+        'chat': {'id': chat_id, 'type': 'private'},
+        'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Load'},
+    }
+    if kind == 'video':
+        message['video'] = {
+            'file_id': file_id, 'file_unique_id': unique_id, 'width': 640, 'height': 360,
+            'duration': duration, 'file_size': size, 'mime_type': 'video/mp4'
+        }
+    elif kind == 'audio':
+        message['audio'] = {
+            'file_id': file_id, 'file_unique_id': unique_id, 'duration': duration,
+            'file_size': size, 'mime_type': 'audio/mpeg', 'file_name': os.path.basename(path)
+        }
+    else:
+        message['document'] = {
+            'file_id': file_id, 'file_unique_id': unique_id, 'file_size': size,
+            'mime_type': 'video/mp4' if path.endswith('.mp4') else 'audio/mpeg',
+            'file_name': os.path.basename(path)
+        }
+    return {'update_id': update_id, 'message': message}
+
+
+def configure_environment(api: FakeBotAPI, scratch: str, args):
+    """Настройки бота для теста; задаются до импорта config"""
+    os.environ['BOT_TOKEN'] = '123456:LOADTEST'
+    os.environ['BOT_API_BASE_URL'] = api.base_url
+    os.environ['BOT_API_BASE_FILE_URL'] = api.base_file_url
+    os.environ['BOT_MODE'] = 'polling'
+    os.environ['PROCESSING_MODE'] = 'local'
+    os.environ['METRICS_PORT'] = '0'
+    os.environ['TRANSCRIPT_CACHE_PATH'] = os.path.join(scratch, 'transcripts.sqlite3')
+    os.environ.setdefault('RECOGNITION_BACKEND', 'stub')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    if args.max_concurrent_jobs:
+        os.environ['MAX_CONCURRENT_JOBS'] = str(args.max_concurrent_jobs)
+    if args.local_mode:
+        os.environ['BOT_API_LOCAL_MODE'] = 'True'
+
+
+async def drive(args) -> dict:
+    files = {kind: getattr(args, kind) or DEFAULT_FILES[kind] for kind in args.mix}
+    paths = {kind: generate(name) for kind, name in files.items()}
+
+    tracker = LoadTracker()
+    corpus = {}
+    api = FakeBotAPI(corpus, on_call=tracker.on_call, local_mode=args.local_mode)
+    api.start()
+    scratch = tempfile.mkdtemp(prefix='loadtest_')
+    configure_environment(api, scratch, args)
+
+    from telegram import Update
+    from bot import TelegramBot
+
+    bot = TelegramBot()
+    application = bot.application
+    await application.initialize()
+    await bot.post_init(application)
+    await application.start()
+
+    kinds = list(args.mix)
+    weights = [args.mix[kind] for kind in kinds]
+    rng = random.Random(args.seed)
+    interval = 1 / args.rate
+    usage_start = _usage()
+    started = time.perf_counter()
+    sent = 0
+
+    print(f"🚀 Нагрузка: {args.rate} обновл./сек, смесь {args.mix}", file=sys.stderr)
+    try:
+        while True:
+            elapsed = time.perf_counter() - started
+            if (args.duration and elapsed >= args.duration) or (not args.duration and sent >= args.count):
+                break
+            # Обновления отправляются по расписанию, независимо от скорости ответов бота
+            await asyncio.sleep(max(0.0, sent * interval - elapsed))
+            sent += 1
+            kind = rng.choices(kinds, weights)[0]
+            name = files[kind]
+            # Уникальный file_unique_id, чтобы не попадать в кэш распознанного текста
+            unique_id = f"{name}-{sent}" if not args.reuse_files else name
+            file_id = f"{name}-{sent}"
+            corpus[file_id] = paths[kind]
+            update = Update.de_json(
+                make_update(sent, kind, file_id, unique_id, paths[kind], CORPUS[name][1]), application.bot
+            )
+            tracker.sent(update.effective_chat.id, kind)
+            await application.update_queue.put(update)
+
+        send_finished = time.perf_counter()
+        print(f"⏳ Отправлено {sent} обновлений, жду ответов...", file=sys.stderr)
+        deadline = send_finished + args.timeout
+        while not tracker.finished() and time.perf_counter() < deadline:
+            await asyncio.sleep(0.2)
+        tracker.expire()
+    finally:
+        await application.stop()
+        await bot.post_shutdown(application)
+        await application.shutdown()
+        api.stop()
+
+    usage_end = _usage()
+    return report(args, tracker, api, sent, started, send_finished, usage_start, usage_end)
+
+
+def report(args, tracker: LoadTracker, api: FakeBotAPI, sent: int, started: float, send_finished: float,
+           usage_start: dict, usage_end: dict) -> dict:
+    results = list(tracker.results.values())
+    latencies = [r['latency'] for r in results if r['status'] == 'ok']
+    finished = [r['finished'] for r in results if r['finished'] is not None]
+    statuses = {}
+    for result in results:
+        statuses[result['status']] = statuses.get(result['status'], 0) + 1
+    errors = statuses.get('error', 0) + statuses.get('timeout', 0)
+    span = (max(finished) - started) if finished else None
+
+    by_kind = {}
+    for kind in args.mix:
+        kind_latencies = [r['latency'] for r in results if r['kind'] == kind and r['status'] == 'ok']
+        by_kind[kind] = {
+            'sent': sum(1 for r in results if r['kind'] == kind),
+            'ok': len(kind_latencies),
+            'p50': percentile(kind_latencies, 50),
+            'p95': percentile(kind_latencies, 95),
+        }
+
+    return {
+        'rate': args.rate,
+        'mix': args.mix,
+        'sent': sent,
+        'send_seconds': round(send_finished - started, 2),
+        'statuses': statuses,
+        'error_rate': round(errors / sent, 4) if sent else None,
+        'rejection_rate': round(statuses.get('rejected', 0) / sent, 4) if sent else None,
+        'throughput_per_second': round(len(latencies) / span, 3) if span else None,
+        'latency_seconds': {
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'p99': percentile(latencies, 99),
+            'max': round(max(latencies), 3) if latencies else None,
+        },
+        'by_kind': by_kind,
+        'resources': {
+            'cpu_seconds': round(usage_end['cpu_seconds'] - usage_start['cpu_seconds'], 2),
+            'child_cpu_seconds': round(usage_end['child_cpu_seconds'] - usage_start['child_cpu_seconds'], 2),
+            'peak_rss_mb': usage_end['peak_rss_mb'],
+            'peak_child_rss_mb': usage_end['peak_child_rss_mb'],
+            'downloaded_mb': round(api.bytes_served / (1024 * 1024), 1),
+            'range_requests': api.range_requests,
+            'uploaded_mb': round(api.bytes_uploaded / (1024 * 1024), 1),
+        },
+        'api_calls': api.method_counts(),
+        'sample_errors': [r['detail'] for r in results if r['detail']][:5],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест бота с поддельным Bot API")
+    parser.add_argument('--rate', type=float, default=1.0, help="Обновлений в секунду")
+    parser.add_argument('--count', type=int, default=50, help="Сколько обновлений отправить")
+    parser.add_argument('--duration', type=float, help="Отправлять обновления N секунд (вместо --count)")
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('video=1,audio=1,document=1'),
+                        help="Доли типов обновлений, например video=1,audio=3,document=1")
+    for kind, name in DEFAULT_FILES.items():
+        parser.add_argument(f'--{kind}', choices=list(CORPUS), help=f"Файл корпуса для {kind} (по умолчанию {name})")
+    parser.add_argument('--reuse-files', action='store_true',
+                        help="Один file_unique_id на файл корпуса (проверка кэша распознанного текста)")
+    parser.add_argument('--timeout', type=float, default=300, help="Ожидание ответов после отправки, сек")
+    parser.add_argument('--max-concurrent-jobs', type=int, help="MAX_CONCURRENT_JOBS для теста")
+    parser.add_argument('--local-mode', action='store_true',
+                        help="Bot API в режиме --local: бот читает файлы корпуса с диска, без скачивания")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="Сохранить отчет в JSON файл")
+    args = parser.parse_args()
+
+    result = asyncio.run(drive(args))
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"📄 Отчет сохранен: {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
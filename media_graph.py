@@ -0,0 +1,173 @@
+"""
+Все выходы задачи из одного запуска ffmpeg
+
+Задача может требовать от одного файла несколько результатов: PCM для
+распознавания и сжатое видео для пользователя. Если получать их
+отдельными вызовами, ffmpeg каждый раз запускается заново и заново
+декодирует файл. MediaGraph собирает выходы задачи в одну команду
+ffmpeg с несколькими выходами: файл читается и декодируется один раз.
+"""
+
+import os
+import logging
+
+from ffmpeg_tools import (
+    FFmpegError, NoAudioStreamError, PCM_OUTPUT_ARGS, run_ffmpeg, probe_duration,
+    spawned_count, plan_video_encoding, video_codec_args
+)
+
+logger = logging.getLogger(__name__)
+
+
+class MediaGraph:
+    """
+    Граф обработки одного файла: вход и набор выходов.
+
+    Выходы:
+    - add_pcm(): 16 кГц моно 16-бит PCM для распознавания (в память, через stdout);
+    - add_video(): видео H.264/AAC с битрейтом под целевой размер (в файл);
+      если битрейта не хватает, звук, кадр и частота кадров упрощаются
+      (ffmpeg_tools.plan_video_encoding).
+
+    run() выполняет все выходы одним запуском ffmpeg. Дополнительные
+    запуски нужны только в двух случаях: ffprobe, если для сжатия видео
+    неизвестна длительность (передайте duration из Telegram), и первый
+    (анализирующий) проход двухпроходного кодирования. PCM в этом случае
+    получается из первого прохода, второй кодирует только видео. Если в
+    файле нет аудио дорожки, а кроме PCM нужно видео, видео кодируется
+    повторным запуском без выхода PCM, и run() возвращает pcm=None.
+
+    Пример:
+        outputs = MediaGraph(path, duration=video.duration).add_pcm().add_video(
+            compressed_path, target_bytes=2 * 1024 * 1024, height=180, audio_bitrate_k=64
+        ).run()
+        pcm, subprocesses = outputs['pcm'], outputs['subprocesses']
+    """
+
+    def __init__(self, input_path: str, duration: float = None, progress_path: str = None,
+                 size_limit: int = None):
+        """
+        Args:
+            input_path: Исходный аудио или видео файл
+            duration: Длительность в секундах (если известна, ffprobe не запускается)
+            progress_path: Файл прогресса ffmpeg (см. ffmpeg_tools.run_ffmpeg)
+            size_limit: Лимит размера видео файла в байтах (ffmpeg -fs, остаток лимита
+                        диска задачи); ffmpeg останавливает запись чуть позже лимита
+        """
+        self.input_path = input_path
+        self.duration = duration
+        self.progress_path = progress_path
+        self.size_limit = size_limit
+        self.pcm = False
+        self.video = None
+
+    def add_pcm(self) -> 'MediaGraph':
+        """Добавляет выход PCM для распознавания (первая аудио дорожка)"""
+        self.pcm = True
+        return self
+
+    def add_video(self, output_path: str, target_bytes: int, height: int, audio_bitrate_k: int,
+                  preset: str = 'fast', two_pass: bool = False) -> 'MediaGraph':
+        """
+        Добавляет выход сжатого видео
+
+        Args:
+            output_path: Куда сохранить видео
+            target_bytes: Целевой размер файла
+            height: Высота кадра (ширина подбирается с сохранением пропорций)
+            audio_bitrate_k: Битрейт аудио в kbps
+            preset: Пресет libx264
+            two_pass: Двухпроходное кодирование (точнее по размеру, в 2 раза дольше)
+        """
+        self.video = {
+            'output_path': output_path,
+            'target_bytes': target_bytes,
+            'height': height,
+            'audio_bitrate_k': audio_bitrate_k,
+            'preset': preset,
+            'two_pass': two_pass,
+        }
+        return self
+
+    def run(self) -> dict:
+        """
+        Выполняет граф
+
+        Returns:
+            dict: {'pcm': PCM данные или None (выход не нужен или в файле нет звука),
+                   'video_path': путь к видео или None,
+                   'subprocesses': сколько раз запускались ffmpeg/ffprobe}
+
+        Raises:
+            NoAudioStreamError: Если нужен только PCM, а в файле нет аудио дорожки
+            TargetSizeUnreachableError: Если видео не уложить в целевой размер (ffmpeg не запускается)
+            FFmpegError: При других ошибках ffmpeg
+        """
+        if not self.pcm and self.video is None:
+            raise ValueError("У графа нет выходов")
+
+        spawned_before = spawned_count()
+        pcm_args = PCM_OUTPUT_ARGS if self.pcm else []
+        try:
+            if self.video is None:
+                pcm = run_ffmpeg(['-i', self.input_path] + pcm_args, progress_path=self.progress_path)
+            else:
+                stdout = self._run_with_video(pcm_args)
+                pcm = stdout if self.pcm else None
+        except FFmpegError as e:
+            # '-map 0:a:0' без аудио дорожки: "Stream map '0:a:0' matches no streams"
+            if not self.pcm or 'matches no streams' not in str(e):
+                raise
+            if self.video is None:
+                raise NoAudioStreamError("В видео файле нет аудио дорожки") from e
+            # Сжатое видео пользователю нужно и без звука
+            logger.warning(f"⚠️ В файле нет аудио дорожки, сжимаю только видео: {self.input_path}")
+            self._run_with_video([])
+            pcm = None
+
+        subprocesses = spawned_count() - spawned_before
+        outputs = ', '.join(name for name, used in (('pcm', pcm is not None), ('video', self.video)) if used)
+        logger.info(f"🎬 Выходы задачи ({outputs}) получены за {subprocesses} запуск(ов) ffmpeg")
+        return {
+            'pcm': pcm,
+            'video_path': self.video['output_path'] if self.video else None,
+            'subprocesses': subprocesses,
+        }
+
+    def _run_with_video(self, pcm_args: list) -> bytes:
+        video = self.video
+        duration = self.duration or probe_duration(self.input_path)
+        plan = plan_video_encoding(video['target_bytes'], duration, video['height'], video['audio_bitrate_k'])
+        logger.info(f"Кодирую видео: {plan['height']}p, видео {plan['video_k']}k, аудио {plan['audio_k']}k")
+
+        video_args = video_codec_args(plan['video_k'], plan['height'], video['preset'], plan['fps'])
+        audio_args = ['-c:a', 'aac', '-b:a', f"{plan['audio_k']}k"] + (['-ac', '1'] if plan['mono'] else [])
+        output_args = ['-movflags', '+faststart', '-y', video['output_path']]
+        if self.size_limit is not None:
+            output_args = ['-fs', str(self.size_limit)] + output_args
+
+        if not video['two_pass']:
+            # Видео в файл и PCM в stdout из одного декодирования
+            return run_ffmpeg(
+                ['-i', self.input_path] + video_args + audio_args + output_args + pcm_args,
+                progress_path=self.progress_path
+            )
+
+        passlog = os.path.splitext(video['output_path'])[0] + '_passlog'
+        try:
+            # Первый проход все равно декодирует файл целиком, PCM получаем из него
+            pcm = run_ffmpeg(
+                ['-y', '-i', self.input_path] + video_args
+                + ['-pass', '1', '-passlogfile', passlog, '-an', '-f', 'mp4', os.devnull] + pcm_args,
+                progress_path=self.progress_path
+            )
+            run_ffmpeg(
+                ['-i', self.input_path] + video_args + ['-pass', '2', '-passlogfile', passlog]
+                + audio_args + output_args,
+                progress_path=self.progress_path
+            )
+            return pcm
+        finally:
+            for suffix in ('-0.log', '-0.log.mbtree'):
+                if os.path.exists(passlog + suffix):
+                    os.remove(passlog + suffix)
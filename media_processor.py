@@ -1,218 +1,269 @@
 import os
+import time
 import tempfile
 import logging
-from moviepy.editor import VideoFileClip
-from pydub import AudioSegment
-import speech_recognition as sr
-from moviepy.video.fx import resize
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+from metrics import stage_timer
+from timings import JobTimer
+from recognition import create_backend, RecognitionError
+from ffmpeg_tools import (
+    extract_audio, probe_audio_codec, NoAudioStreamError, TargetSizeUnreachableError, COPYABLE_AUDIO_CODECS,
+    PCM_SAMPLE_RATE, PCM_SAMPLE_WIDTH, PCM_CHANNELS
+)
+from media_graph import MediaGraph
+from progress import (
+    FFMPEG_PROGRESS_FILE, SEGMENTS_PROGRESS_FILE, SEGMENTS_TEXT_FILE, write_segments_progress, append_segment_text
+)
+from segmentation import split_audio
+from workspace import JobWorkspace, WorkspaceBudgetExceeded
+
+if TYPE_CHECKING:
+    # pydub загружается при первом декодировании, а не при импорте модуля
+    from pydub import AudioSegment
 
 logger = logging.getLogger(__name__)
 
+# Параметры сжатия видео: для отправки пользователю и для дальнейшей обработки
+USER_VIDEO = {'height': 180, 'audio_bitrate_k': 64, 'preset': 'veryfast'}
+PROCESSING_VIDEO = {'height': 360, 'audio_bitrate_k': 128, 'preset': 'fast'}
+
+NO_SPEECH_TEXT = "❌ Не удалось распознать речь в аудио файле. Возможно, файл слишком тихий или содержит только музыку."
+
 class MediaProcessor:
-    def __init__(self):
-        self.recognizer = sr.Recognizer()
+    def __init__(self, recognition_fanout: int = 4, max_chunk_seconds: int = 30, chunk_retries: int = 2,
+                 recognition_backend: str = 'google', backend_options: dict = None,
+                 two_pass_encoding: bool = False, profile_sample_rate: float = 0.0,
+                 profile_dir: str = None, profiler: str = 'cprofile'):
+        """
+        Args:
+            recognition_fanout: Сколько фрагментов аудио распознавать одновременно
+            max_chunk_seconds: Максимальная длина фрагмента для распознавания
+            chunk_retries: Повторы распознавания фрагмента при ошибке сервиса
+            recognition_backend: Бэкенд распознавания (google, vosk)
+            backend_options: Параметры бэкенда (например, model_path для vosk)
+            two_pass_encoding: Двухпроходное сжатие видео (точнее по размеру, медленнее)
+            profile_sample_rate: Доля задач, выполняемых под профилировщиком (0.0 - 1.0)
+            profile_dir: Куда сохранять профили задач
+            profiler: Профилировщик: cprofile или pyinstrument
+        """
+        self.backend = create_backend(recognition_backend, **(backend_options or {}))
+        self.recognition_fanout = recognition_fanout
+        self.max_chunk_seconds = max_chunk_seconds
+        self.chunk_retries = chunk_retries
+        self.two_pass_encoding = two_pass_encoding
+        self.profile_sample_rate = profile_sample_rate
+        self.profile_dir = profile_dir
+        self.profiler = profiler
+    
+    def warm_up(self):
+        """Загружает pydub и модели распознавания заранее"""
+        import pydub.silence  # noqa: F401
+        self.backend.warm_up()
+    
+    def _timer(self, job: str, media: str) -> JobTimer:
+        """Создает замер этапов задачи (с профилированием части задач)"""
+        return JobTimer(
+            job, media,
+            profile_sample_rate=self.profile_sample_rate,
+            profile_dir=self.profile_dir,
+            profiler=self.profiler
+        )
+    
+    def _scratch_path(self, workspace: JobWorkspace, name: str) -> str:
+        """
+        Возвращает путь для промежуточного файла
+        
+        Args:
+            workspace: Рабочая директория задачи (если не указана - уникальный временный файл)
+            name: Имя файла
+            
+        Returns:
+            str: Путь к файлу
+        """
+        if workspace is not None:
+            return workspace.file(name)
+        
+        base, ext = os.path.splitext(name)
+        fd, path = tempfile.mkstemp(prefix=f"{base}_", suffix=ext)
+        os.close(fd)
+        return path
     
-    def compress_video_for_processing(self, video_path: str, max_size_mb: int = 45) -> str:
+    @staticmethod
+    def _progress_path(workspace: JobWorkspace, name: str):
+        """Файл прогресса в рабочей директории задачи (его читает ProgressReporter бота)"""
+        return workspace.file(name) if workspace is not None else None
+    
+    @staticmethod
+    def _size_limit(workspace: JobWorkspace):
+        """
+        Лимит размера файла, который пишет ffmpeg (-fs): остаток лимита диска задачи
+        
+        ffmpeg останавливает запись сразу после лимита, и check_budget() после
+        шага сообщает о превышении, не дожидаясь, пока файл заполнит диск.
+        """
+        return workspace.remaining() if workspace is not None else None
+    
+    def compress_video_for_processing(self, video_path: str, max_size_mb: int = 45,
+                                      workspace: JobWorkspace = None, duration: float = None) -> str:
         """
         Сжимает видео до размера меньше max_size_mb, сохраняя качество аудио
         
+        Битрейт рассчитывается по длительности, поэтому достаточно одного
+        прохода кодирования без повторного сжатия результата.
+        
         Args:
             video_path: Путь к исходному видео
             max_size_mb: Максимальный размер в MB
+            workspace: Рабочая директория задачи для промежуточных файлов
+            duration: Длительность в секундах (если известна, ffprobe не запускается)
             
         Returns:
             str: Путь к сжатому видео
         """
+        timer = self._timer('compress_video_for_processing', 'video')
         try:
             logger.info(f"Сжимаю видео: {video_path}")
             
-            # Создаем временный файл для сжатого видео
-            temp_dir = tempfile.gettempdir()
-            compressed_path = os.path.join(temp_dir, f"compressed_{os.getpid()}.mp4")
-            
-            # Загружаем видео
-            video = VideoFileClip(video_path)
-            
             # Получаем текущий размер
-            current_size_mb = os.path.getsize(video_path) / (1024 * 1024)
+            current_size = os.path.getsize(video_path)
+            current_size_mb = current_size / (1024 * 1024)
             logger.info(f"Исходный размер: {current_size_mb:.1f}MB")
             
             # Если файл уже меньше лимита, возвращаем исходный
             if current_size_mb <= max_size_mb:
                 logger.info("Файл уже подходящего размера")
-                video.close()
                 return video_path
             
-            # Настраиваем сжатие
-            # Видео: низкое качество, аудио: высокое качество
-            compressed_video = video.resize(height=360)  # 360p для видео
-            
-            # Сохраняем с высоким качеством аудио
-            compressed_video.write_videofile(
-                compressed_path,
-                audio_codec='aac',
-                audio_bitrate='128k',  # Высокое качество аудио
-                video_codec='libx264',
-                preset='fast',  # Быстрое сжатие
-                ffmpeg_params=['-crf', '28'],  # Низкое качество видео
-                verbose=False,
-                logger=None
-            )
-            
-            # Закрываем файлы
-            compressed_video.close()
-            video.close()
-            
-            # Проверяем размер сжатого файла
-            compressed_size_mb = os.path.getsize(compressed_path) / (1024 * 1024)
-            logger.info(f"Сжатый размер: {compressed_size_mb:.1f}MB")
+            # Файл для сжатого видео
+            compressed_path = self._scratch_path(workspace, "compressed.mp4")
             
-            # Если все еще большой, сжимаем еще больше
-            if compressed_size_mb > max_size_mb:
-                logger.info("Дополнительное сжатие...")
-                video = VideoFileClip(compressed_path)
-                ultra_compressed = video.resize(height=240)  # 240p
-                
-                ultra_compressed.write_videofile(
-                    compressed_path,
-                    audio_codec='aac',
-                    audio_bitrate='128k',
-                    video_codec='libx264',
-                    preset='fast',
-                    ffmpeg_params=['-crf', '32'],  # Еще ниже качество видео
-                    verbose=False,
-                    logger=None
-                )
-                
-                ultra_compressed.close()
-                video.close()
-                
-                final_size_mb = os.path.getsize(compressed_path) / (1024 * 1024)
-                logger.info(f"Финальный размер: {final_size_mb:.1f}MB")
+            # Видео: 360p с битрейтом под лимит, аудио: высокое качество
+            with timer.span('compress', bytes_in=current_size) as span:
+                MediaGraph(
+                    video_path, duration, self._progress_path(workspace, FFMPEG_PROGRESS_FILE),
+                    self._size_limit(workspace)
+                ).add_video(
+                    compressed_path, max_size_mb * 1024 * 1024,
+                    two_pass=self.two_pass_encoding, **PROCESSING_VIDEO
+                ).run()
+                span.bytes_out = os.path.getsize(compressed_path)
+            
+            if workspace is not None:
+                workspace.check_budget()
             
+            compressed_size_mb = span.bytes_out / (1024 * 1024)
+            logger.info(f"Сжатый размер: {compressed_size_mb:.1f}MB")
             return compressed_path
             
+        except WorkspaceBudgetExceeded:
+            raise
+            
         except Exception as e:
             logger.error(f"Ошибка при сжатии видео: {str(e)}")
             # В случае ошибки возвращаем исходный файл
             return video_path
+        
+        finally:
+            timer.finish()
     
-    def compress_video_for_user(self, video_path: str, target_size_mb: int = 2) -> str:
+    def compress_video_for_user(self, video_path: str, target_size_mb: int = 2,
+                                workspace: JobWorkspace = None, duration: float = None) -> str:
         """
         Сжимает видео для отправки пользователю (минимальный размер, хороший звук)
         
+        Битрейт рассчитывается по длительности, поэтому результат укладывается
+        в target_size_mb за один проход кодирования. Для длинного видео звук,
+        кадр и частота кадров упрощаются (ffmpeg_tools.plan_video_encoding).
+        
         Args:
             video_path: Путь к исходному видео
             target_size_mb: Целевой размер в MB
+            workspace: Рабочая директория задачи для промежуточных файлов
+            duration: Длительность в секундах (если известна, ffprobe не запускается)
             
         Returns:
             str: Путь к сжатому видео
+            
+        Raises:
+            TargetSizeUnreachableError: Если видео слишком длинное для target_size_mb
         """
+        timer = self._timer('compress_video_for_user', 'video')
         try:
             logger.info(f"Сжимаю видео для пользователя: {video_path}")
             
             # Создаем временный файл для сжатого видео
-            temp_dir = tempfile.gettempdir()
-            compressed_path = os.path.join(temp_dir, f"user_compressed_{os.getpid()}.mp4")
-            
-            # Загружаем видео
-            video = VideoFileClip(video_path)
-            
-            # Агрессивное сжатие для минимального размера
-            # Видео: очень низкое качество, аудио: хорошее качество
-            compressed_video = video.resize(height=180)  # 180p для максимального сжатия
-            
-            # Сохраняем с максимальным сжатием
-            compressed_video.write_videofile(
-                compressed_path,
-                audio_codec='aac',
-                audio_bitrate='64k',  # Минимальное качество аудио
-                video_codec='libx264',
-                preset='ultrafast',  # Максимальная скорость
-                ffmpeg_params=[
-                    '-crf', '40',  # Максимальное сжатие видео
-                    '-movflags', '+faststart',  # Быстрая загрузка
-                    '-vf', 'scale=320:180'  # Принудительное масштабирование
-                ],
-                verbose=False,
-                logger=None
-            )
-            
-            # Закрываем файлы
-            compressed_video.close()
-            video.close()
+            compressed_path = self._scratch_path(workspace, "user_compressed.mp4")
+            
+            # Видео: 180p с битрейтом под целевой размер, аудио: 64k
+            with timer.span('compress', bytes_in=os.path.getsize(video_path)) as span:
+                MediaGraph(
+                    video_path, duration, self._progress_path(workspace, FFMPEG_PROGRESS_FILE),
+                    self._size_limit(workspace)
+                ).add_video(
+                    compressed_path, target_size_mb * 1024 * 1024,
+                    two_pass=self.two_pass_encoding, **USER_VIDEO
+                ).run()
+                span.bytes_out = os.path.getsize(compressed_path)
+            
+            if workspace is not None:
+                workspace.check_budget()
             
             # Проверяем размер
-            final_size_mb = os.path.getsize(compressed_path) / (1024 * 1024)
+            final_size_mb = span.bytes_out / (1024 * 1024)
             logger.info(f"Сжатое видео: {final_size_mb:.1f}MB")
             
-            # Если все еще большой, сжимаем еще больше
-            if final_size_mb > target_size_mb:
-                logger.info("Дополнительное сжатие до минимума...")
-                video = VideoFileClip(compressed_path)
-                ultra_compressed = video.resize(height=180)  # 180p
-                
-                ultra_compressed.write_videofile(
-                    compressed_path,
-                    audio_codec='aac',
-                    audio_bitrate='64k',  # Минимальное качество аудио
-                    video_codec='libx264',
-                    preset='ultrafast',
-                    ffmpeg_params=[
-                        '-crf', '40',  # Минимальное качество видео
-                        '-movflags', '+faststart'
-                    ],
-                    verbose=False,
-                    logger=None
-                )
-                
-                ultra_compressed.close()
-                video.close()
-                
-                final_size_mb = os.path.getsize(compressed_path) / (1024 * 1024)
-                logger.info(f"Ультра-сжатое видео: {final_size_mb:.1f}MB")
-            
             return compressed_path
             
+        except (WorkspaceBudgetExceeded, TargetSizeUnreachableError):
+            # Исходный файл пользователю не отправляем - он больше целевого размера
+            raise
+            
         except Exception as e:
             logger.error(f"Ошибка при сжатии видео для пользователя: {str(e)}")
             # В случае ошибки возвращаем исходный файл
             return video_path
+        
+        finally:
+            timer.finish()
     
-    def extract_audio_from_video(self, video_path: str, output_audio_path: str = None) -> str:
+    def extract_audio_from_video(self, video_path: str, output_audio_path: str = None,
+                                 workspace: JobWorkspace = None) -> str:
         """
-        Извлекает аудио из видео файла и сохраняет как MP3
+        Извлекает аудио из видео файла в отдельный файл
+        
+        Если путь не указан, формат выбирается по кодеку дорожки, и она
+        копируется без перекодирования (AAC -> .m4a, MP3 -> .mp3, Opus -> .ogg).
+        Неизвестные кодеки перекодируются в MP3.
         
         Args:
             video_path: Путь к видео файлу
             output_audio_path: Путь для сохранения аудио (опционально)
+            workspace: Рабочая директория задачи для промежуточных файлов
             
         Returns:
             str: Путь к извлеченному аудио файлу
         """
+        timer = self._timer('extract_audio_from_video', 'video')
         try:
-            # Создаем временный файл для аудио, если путь не указан
-            if not output_audio_path:
-                temp_dir = tempfile.gettempdir()
-                output_audio_path = os.path.join(temp_dir, f"extracted_audio_{os.getpid()}.mp3")
-            
             logger.info(f"Извлекаю аудио из видео: {video_path}")
             
-            # Загружаем видео
-            video = VideoFileClip(video_path)
-            
-            # Извлекаем аудио
-            audio = video.audio
-            
-            if audio is None:
-                raise ValueError("В видео файле нет аудио дорожки")
+            # Создаем временный файл для аудио, если путь не указан
+            codec = None
+            if not output_audio_path:
+                codec = probe_audio_codec(video_path)
+                if codec is None:
+                    raise NoAudioStreamError("В видео файле нет аудио дорожки")
+                ext = COPYABLE_AUDIO_CODECS.get(codec, '.mp3')
+                output_audio_path = self._scratch_path(workspace, f"extracted_audio{ext}")
             
-            # Сохраняем как MP3
-            audio.write_audiofile(output_audio_path, verbose=False, logger=None)
+            with timer.span('extract', bytes_in=os.path.getsize(video_path)) as span:
+                extract_audio(video_path, output_audio_path, codec, self._size_limit(workspace))
+                span.bytes_out = os.path.getsize(output_audio_path)
             
-            # Закрываем файлы
-            audio.close()
-            video.close()
+            if workspace is not None:
+                workspace.check_budget()
             
             logger.info(f"Аудио успешно извлечено: {output_audio_path}")
             return output_audio_path
@@ -220,6 +271,38 @@ class MediaProcessor:
         except Exception as e:
             logger.error(f"Ошибка при извлечении аудио: {str(e)}")
             raise
+        
+        finally:
+            timer.finish()
+    
+    def decode_audio(self, media_path: str, progress_path: str = None) -> 'AudioSegment':
+        """
+        Декодирует аудио дорожку файла сразу в PCM для распознавания
+        
+        Один запуск ffmpeg, без промежуточных MP3/WAV файлов:
+        16 кГц, моно, 16 бит.
+        
+        Args:
+            media_path: Путь к аудио или видео файлу
+            progress_path: Файл прогресса ffmpeg
+            
+        Returns:
+            AudioSegment: Декодированное аудио
+        """
+        logger.info(f"Декодирую аудио: {media_path}")
+        return self._audio_segment(MediaGraph(media_path, progress_path=progress_path).add_pcm().run()['pcm'])
+    
+    @staticmethod
+    def _audio_segment(pcm: bytes) -> 'AudioSegment':
+        """AudioSegment из PCM, декодированного ffmpeg (16 кГц, моно, 16 бит)"""
+        from pydub import AudioSegment
+
+        return AudioSegment(
+            data=pcm,
+            sample_width=PCM_SAMPLE_WIDTH,
+            frame_rate=PCM_SAMPLE_RATE,
+            channels=PCM_CHANNELS
+        )
     
     def convert_audio_to_text(self, audio_path: str, language: str = 'ru') -> str:
         """
@@ -232,30 +315,47 @@ class MediaProcessor:
         Returns:
             str: Распознанный текст
         """
+        logger.info(f"Конвертирую аудио в текст: {audio_path}")
         try:
-            logger.info(f"Конвертирую аудио в текст: {audio_path}")
-            
-            # Загружаем аудио файл
-            audio = AudioSegment.from_file(audio_path)
-            
-            # Конвертируем в формат, подходящий для speech_recognition
-            wav_data = audio.export(format="wav").read()
+            audio = self.decode_audio(audio_path)
+        except Exception as e:
+            logger.error(f"Ошибка при декодировании аудио: {str(e)}")
+            return f"❌ Ошибка при обработке аудио: {str(e)}"
+        
+        return self.transcribe_audio(audio, language)
+    
+    def transcribe_audio(self, audio: 'AudioSegment', language: str = 'ru', progress_path: str = None,
+                         segments_path: str = None, segments: list = None) -> str:
+        """
+        Распознает речь в декодированном аудио
+        
+        Args:
+            audio: Декодированное аудио
+            language: Язык для распознавания
+            progress_path: Файл, куда записывается число распознанных фрагментов
+            segments_path: Файл, куда дописываются тексты фрагментов по мере распознавания
+            segments: Список, в который добавляются [начало мс, конец мс, текст] фрагментов
             
-            # Распознаем речь
-            with sr.AudioData(wav_data, audio.frame_rate, audio.sample_width) as source:
-                # Убираем шум
-                self.recognizer.adjust_for_ambient_noise(source)
-                # Распознаем речь
-                text = self.recognizer.recognize_google(source, language=language)
+        Returns:
+            str: Распознанный текст
+        """
+        try:
+            # Делим на фрагменты по паузам и распознаем их параллельно
+            chunks = split_audio(audio, max_chunk_ms=self.max_chunk_seconds * 1000)
+            logger.info(f"Аудио разбито на {len(chunks)} фрагментов")
+            
+            texts = self._recognize_chunks(chunks, language, progress_path, segments_path)
+            if segments is not None:
+                segments.extend([chunk.start_ms, chunk.end_ms, t] for chunk, t in zip(chunks, texts) if t)
+            text = ' '.join(t for t in texts if t)
+            if not text:
+                logger.warning("Не удалось распознать речь в аудио файле")
+                return NO_SPEECH_TEXT
             
             logger.info(f"Текст успешно распознан, длина: {len(text)} символов")
             return text
             
-        except sr.UnknownValueError:
-            logger.warning("Не удалось распознать речь в аудио файле")
-            return "❌ Не удалось распознать речь в аудио файле. Возможно, файл слишком тихий или содержит только музыку."
-            
-        except sr.RequestError as e:
+        except RecognitionError as e:
             logger.error(f"Ошибка сервиса распознавания речи: {str(e)}")
             return f"❌ Ошибка сервиса распознавания речи: {str(e)}"
             
@@ -263,49 +363,160 @@ class MediaProcessor:
             logger.error(f"Ошибка при конвертации аудио в текст: {str(e)}")
             return f"❌ Ошибка при обработке аудио: {str(e)}"
     
-    def process_video_to_text(self, video_path: str, language: str = 'ru') -> dict:
+    def _recognize_chunks(self, chunks: list, language: str, progress_path: str = None,
+                          segments_path: str = None) -> list:
+        """
+        Распознает фрагменты параллельно и возвращает тексты в исходном порядке
+        
+        Args:
+            chunks: Фрагменты аудио (AudioChunk)
+            language: Язык для распознавания
+            progress_path: Файл, куда записывается число распознанных фрагментов
+            segments_path: Файл, куда дописывается текст каждого фрагмента
+            
+        Returns:
+            list: Текст каждого фрагмента (пустая строка, если речь не найдена)
+        """
+        done = 0
+        lock = threading.Lock()
+        if progress_path:
+            write_segments_progress(progress_path, 0, len(chunks))
+        
+        def recognize(chunk):
+            nonlocal done
+            text = self._recognize_chunk(chunk, language)
+            with lock:
+                if segments_path:
+                    append_segment_text(segments_path, chunk.index, chunk.start_ms, chunk.end_ms, text)
+                if progress_path:
+                    done += 1
+                    write_segments_progress(progress_path, done, len(chunks))
+            return text
+        
+        if len(chunks) <= 1:
+            return [recognize(chunk) for chunk in chunks]
+        
+        with ThreadPoolExecutor(max_workers=self.recognition_fanout,
+                                thread_name_prefix='recognize') as executor:
+            return list(executor.map(recognize, chunks))
+    
+    def recognize_segment(self, chunk, language: str = 'ru') -> str:
+        """
+        Распознает один фрагмент аудио (для потоковой обработки)
+        
+        Args:
+            chunk: Фрагмент аудио (AudioChunk)
+            language: Язык для распознавания
+            
+        Returns:
+            str: Распознанный текст или пустая строка
+        """
+        with stage_timer('recognize_segment', 'stream'):
+            return self._recognize_chunk(chunk, language)
+    
+    def _recognize_chunk(self, chunk, language: str) -> str:
+        """
+        Распознает один фрагмент с повторами при ошибке сервиса
+        
+        Args:
+            chunk: Фрагмент аудио (AudioChunk)
+            language: Язык для распознавания
+            
+        Returns:
+            str: Распознанный текст или пустая строка
+        """
+        audio = chunk.audio.set_channels(1)
+        
+        for attempt in range(self.chunk_retries + 1):
+            try:
+                return self.backend.recognize(
+                    audio.raw_data, audio.frame_rate, audio.sample_width, language
+                )
+            
+            except RecognitionError as e:
+                if attempt == self.chunk_retries:
+                    raise
+                delay = 2 ** attempt
+                logger.warning(
+                    f"⚠️ Ошибка распознавания фрагмента {chunk.index} "
+                    f"(попытка {attempt + 1}): {e}. Повтор через {delay} сек"
+                )
+                time.sleep(delay)
+    
+    def process_video_to_text(self, video_path: str, language: str = 'ru',
+                              workspace: JobWorkspace = None, keep_input: bool = False,
+                              compress_target_mb: int = None, duration: float = None) -> dict:
         """
-        Полный процесс: видео -> сжатие -> аудио -> текст
+        Полный процесс: видео -> PCM аудио -> текст
+        
+        Без compress_target_mb видео дорожка не перекодируется и не
+        декодируется: ffmpeg читает только аудио, поэтому большое видео
+        стоит столько же, сколько его звук. С compress_target_mb тот же
+        запуск ffmpeg (MediaGraph) заодно сжимает видео для пользователя,
+        и файл декодируется один раз.
         
         Args:
             video_path: Путь к видео файлу
             language: Язык для распознавания
+            workspace: Рабочая директория задачи для промежуточных файлов
+            keep_input: Не удалять исходный файл (файл локального Bot API сервера)
+            compress_target_mb: Целевой размер сжатого видео в MB, если оно нужно
+            duration: Длительность в секундах (если известна, ffprobe не запускается)
             
         Returns:
-            dict: Результат обработки с текстом и метаданными
+            dict: Результат обработки с текстом и метаданными; со сжатием -
+                  еще compressed_path (в workspace) и compressed_size, в том
+                  числе при ошибке распознавания (например, в видео нет звука)
         """
-        temp_audio_path = None
-        compressed_video_path = None
+        timer = self._timer('process_video_to_text', 'video')
+        compressed = {}
         try:
-            # Шаг 0: Сжимаем видео если нужно
             original_size = os.path.getsize(video_path)
-            original_size_mb = original_size / (1024 * 1024)
             
-            if original_size_mb > 45:  # Если больше 45MB, сжимаем
-                logger.info(f"Сжимаю большое видео: {original_size_mb:.1f}MB")
-                compressed_video_path = self.compress_video_for_processing(video_path)
-                processing_video_path = compressed_video_path
-            else:
-                processing_video_path = video_path
-            
-            # Шаг 1: Извлекаем аудио из видео
-            temp_audio_path = self.extract_audio_from_video(processing_video_path)
+            # Шаг 1: Декодируем аудио дорожку сразу в PCM (и, если нужно, сжимаем видео)
+            graph = MediaGraph(
+                video_path, duration, self._progress_path(workspace, FFMPEG_PROGRESS_FILE),
+                self._size_limit(workspace)
+            ).add_pcm()
+            compressed_path = None
+            if compress_target_mb:
+                compressed_path = self._scratch_path(workspace, "user_compressed.mp4")
+                graph.add_video(
+                    compressed_path, compress_target_mb * 1024 * 1024,
+                    two_pass=self.two_pass_encoding, **USER_VIDEO
+                )
+            with timer.span('decode', bytes_in=original_size) as span:
+                outputs = graph.run()
+                if compressed_path is not None:
+                    compressed = {
+                        'compressed_path': compressed_path,
+                        'compressed_size': os.path.getsize(compressed_path)
+                    }
+                if outputs['pcm'] is None:
+                    # Видео сжато, а распознавать нечего
+                    raise NoAudioStreamError("В видео файле нет аудио дорожки")
+                audio = self._audio_segment(outputs['pcm'])
+                span.bytes_out = len(audio.raw_data)
+            if workspace is not None:
+                workspace.check_budget()
             
             # Шаг 2: Конвертируем аудио в текст
-            text = self.convert_audio_to_text(temp_audio_path, language)
-            
-            # Получаем информацию о файлах
-            final_video_size = os.path.getsize(processing_video_path)
-            audio_size = os.path.getsize(temp_audio_path) if temp_audio_path else 0
+            segments = []
+            with timer.span('recognize', bytes_in=len(audio.raw_data)) as span:
+                text = self.transcribe_audio(
+                    audio, language, self._progress_path(workspace, SEGMENTS_PROGRESS_FILE),
+                    self._progress_path(workspace, SEGMENTS_TEXT_FILE), segments
+                )
+                span.bytes_out = len(text.encode('utf-8'))
             
             return {
                 'success': True,
                 'text': text,
                 'original_size': original_size,
-                'video_size': final_video_size,
-                'audio_size': audio_size,
-                'compressed': compressed_video_path is not None,
-                'temp_audio_path': temp_audio_path
+                'audio_size': len(audio.raw_data),
+                'segments': segments,
+                'timings': timer.finish(),
+                **compressed
             }
             
         except Exception as e:
@@ -313,56 +524,57 @@ class MediaProcessor:
             return {
                 'success': False,
                 'error': str(e),
-                'text': f"❌ Ошибка при обработке видео: {str(e)}"
+                'text': f"❌ Ошибка при обработке видео: {str(e)}",
+                'timings': timer.finish(),
+                **compressed
             }
         
         finally:
-            # Удаляем временный аудио файл
-            if temp_audio_path and os.path.exists(temp_audio_path):
-                try:
-                    os.remove(temp_audio_path)
-                    logger.info(f"✅ Временный аудио файл удален: {temp_audio_path}")
-                except Exception as e:
-                    logger.warning(f"⚠️ Не удалось удалить временный файл: {e}")
-            
-            # Удаляем сжатое видео (если было создано)
-            if compressed_video_path and os.path.exists(compressed_video_path):
-                try:
-                    os.remove(compressed_video_path)
-                    logger.info(f"✅ Сжатое видео удалено: {compressed_video_path}")
-                except Exception as e:
-                    logger.warning(f"⚠️ Не удалось удалить сжатое видео: {e}")
-            
             # Удаляем исходный видео файл
-            if os.path.exists(video_path):
+            if not keep_input and os.path.exists(video_path):
                 try:
                     os.remove(video_path)
                     logger.info(f"✅ Исходный видео файл удален: {video_path}")
                 except Exception as e:
                     logger.warning(f"⚠️ Не удалось удалить исходный файл: {e}")
     
-    def process_audio_to_text(self, audio_path: str, language: str = 'ru') -> dict:
+    def process_audio_to_text(self, audio_path: str, language: str = 'ru',
+                              workspace: JobWorkspace = None, keep_input: bool = False) -> dict:
         """
         Конвертирует аудио файл в текст
         
         Args:
             audio_path: Путь к аудио файлу
             language: Язык для распознавания
+            workspace: Рабочая директория задачи для промежуточных файлов
+            keep_input: Не удалять исходный файл (файл локального Bot API сервера)
             
         Returns:
             dict: Результат обработки с текстом и метаданными
         """
+        timer = self._timer('process_audio_to_text', 'audio')
         try:
-            # Конвертируем аудио в текст
-            text = self.convert_audio_to_text(audio_path, language)
-            
             # Получаем информацию о файле
             audio_size = os.path.getsize(audio_path)
             
+            # Декодируем аудио сразу в PCM и конвертируем в текст
+            with timer.span('decode', bytes_in=audio_size) as span:
+                audio = self.decode_audio(audio_path, self._progress_path(workspace, FFMPEG_PROGRESS_FILE))
+                span.bytes_out = len(audio.raw_data)
+            segments = []
+            with timer.span('recognize', bytes_in=len(audio.raw_data)) as span:
+                text = self.transcribe_audio(
+                    audio, language, self._progress_path(workspace, SEGMENTS_PROGRESS_FILE),
+                    self._progress_path(workspace, SEGMENTS_TEXT_FILE), segments
+                )
+                span.bytes_out = len(text.encode('utf-8'))
+            
             return {
                 'success': True,
                 'text': text,
-                'audio_size': audio_size
+                'audio_size': audio_size,
+                'segments': segments,
+                'timings': timer.finish()
             }
             
         except Exception as e:
@@ -370,12 +582,13 @@ class MediaProcessor:
             return {
                 'success': False,
                 'error': str(e),
-                'text': f"❌ Ошибка при обработке аудио: {str(e)}"
+                'text': f"❌ Ошибка при обработке аудио: {str(e)}",
+                'timings': timer.finish()
             }
         
         finally:
             # Удаляем исходный аудио файл
-            if os.path.exists(audio_path):
+            if not keep_input and os.path.exists(audio_path):
                 try:
                     os.remove(audio_path)
                     logger.info(f"✅ Исходный аудио файл удален: {audio_path}")
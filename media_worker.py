@@ -0,0 +1,206 @@
+"""
+Медиа-воркер: выполняет задачи обработки из брокера
+
+Запуск: python run_bot.py --mode worker (можно запустить несколько воркеров)
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import uuid
+
+from telegram import Bot
+from telegram.ext import ExtBot
+
+import metrics
+from broker import SQLiteBroker
+from config import (
+    BOT_TOKEN, LOG_LEVEL, BROKER_PATH, JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS,
+    WORKER_CONCURRENCY, WORKER_HEARTBEAT_INTERVAL, BROKER_POLL_INTERVAL,
+    WORKER_METRICS_PORT, SCRATCH_DIR, INGEST_RAM_DIR, BOT_API_BASE_URL, BOT_API_BASE_FILE_URL,
+    BOT_API_LOCAL_MODE, AUTO_DELETE_TEMP_FILES, CLEANUP_INTERVAL, PREWARM
+)
+from cleanup import TempJanitor
+from pipeline import MediaPipeline, compressed_video_caption
+from rate_limiter import FloodControlLimiter
+from uploads import send_media
+
+logger = logging.getLogger(__name__)
+
+
+class MediaWorker:
+    """
+    Забирает задачи из брокера и выполняет их через MediaPipeline.
+
+    Одновременно выполняется не больше concurrency задач. Пока задачи
+    выполняются, воркер раз в heartbeat_interval продлевает их аренду;
+    если процесс упадет, брокер вернет задачи в очередь другим воркерам.
+    Результат распознавания записывается в брокер и доставляется ботом,
+    сжатое видео воркер отправляет в чат сам. Если передан janitor, воркер
+    раз в CLEANUP_INTERVAL очищает временные файлы.
+    """
+
+    def __init__(self, broker: SQLiteBroker, pipeline: MediaPipeline, bot: Bot, concurrency: int,
+                 heartbeat_interval: float = 10, poll_interval: float = 1.0, worker_id: str = None,
+                 janitor: TempJanitor = None):
+        self.broker = broker
+        self.janitor = janitor
+        self.pipeline = pipeline
+        self.bot = bot
+        self.concurrency = concurrency
+        self.heartbeat_interval = heartbeat_interval
+        self.poll_interval = poll_interval
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self._active = {}
+        self._slot_freed = asyncio.Event()
+
+    async def run(self):
+        """Основной цикл воркера"""
+        logger.info(f"🛠 Медиа-воркер {self.worker_id} запущен (задач одновременно: {self.concurrency})")
+        metrics.start_metrics_server(
+            WORKER_METRICS_PORT,
+            in_flight=lambda: len(self._active),
+            queue_depth=self.broker.depth,
+            temp_dirs=(SCRATCH_DIR, INGEST_RAM_DIR),
+            pool_saturation=lambda: self.pipeline.worker_pool.stats()['saturation']
+        )
+        heartbeat = asyncio.create_task(self._heartbeat())
+        janitor = asyncio.create_task(self._cleanup()) if self.janitor is not None else None
+        # Задачи забираются сразу, прогрев идет параллельно
+        prewarm = asyncio.create_task(self._prewarm()) if PREWARM else None
+        try:
+            async with self.bot:
+                while True:
+                    while len(self._active) < self.concurrency:
+                        job = await asyncio.to_thread(self.broker.claim, self.worker_id)
+                        if job is None:
+                            break
+                        self._active[job['id']] = asyncio.create_task(self._execute(job))
+
+                    self._slot_freed.clear()
+                    try:
+                        await asyncio.wait_for(self._slot_freed.wait(), timeout=self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+        finally:
+            background = [task for task in (heartbeat, janitor, prewarm) if task is not None]
+            for task in background + list(self._active.values()):
+                task.cancel()
+            await asyncio.gather(*background, *self._active.values(), return_exceptions=True)
+            # Незавершенные задачи сразу достанутся другим воркерам
+            await asyncio.to_thread(self.broker.release, self.worker_id)
+            self.pipeline.shutdown()
+            logger.info(f"Медиа-воркер {self.worker_id} остановлен")
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.to_thread(self.broker.heartbeat, self.worker_id, list(self._active))
+            await asyncio.sleep(self.heartbeat_interval)
+
+    async def _prewarm(self):
+        try:
+            await self.pipeline.warm_up()
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось прогреть обработку: {e}")
+
+    async def _cleanup(self):
+        while True:
+            try:
+                await self.janitor.run(self.pipeline.active_workspaces)
+            except Exception as e:
+                logger.error(f"❌ Ошибка при очистке временных файлов: {e}")
+            await asyncio.sleep(CLEANUP_INTERVAL)
+
+    async def _execute(self, job: dict):
+        job_id = job['id']
+        logger.info(f"Воркер {self.worker_id} начал задачу {job_id} ({job['kind']}, попытка {job['attempts']})")
+        metrics.current_handler.set(job['kind'])
+        try:
+            result = await self.process(job['kind'], job['payload'], job_id)
+            if await asyncio.to_thread(self.broker.complete, job_id, self.worker_id, result):
+                logger.info(f"✅ Задача {job_id} выполнена")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка в задаче {job_id}: {e}")
+            metrics.count_failure()
+            await asyncio.to_thread(self.broker.fail, job_id, self.worker_id, str(e))
+        finally:
+            self._active.pop(job_id, None)
+            self._slot_freed.set()
+
+    async def process(self, kind: str, payload: dict, job_id: int = None) -> dict:
+        """
+        Выполняет одну задачу
+
+        Args:
+            kind: 'video', 'audio' или 'compress'
+            payload: Описание задачи от бота
+            job_id: Задача в брокере (перед отправкой видео проверяется, что она все еще у этого воркера)
+
+        Returns:
+            dict: Результат для бота
+        """
+        if kind in ('video', 'audio'):
+            return await self.pipeline.transcribe(
+                self.bot, payload['file_id'], kind, payload.get('file_size'), payload['language']
+            )
+
+        if kind == 'compress':
+            async def deliver(path):
+                # Если аренда истекла, задачу выполняет другой воркер и видео отправит он
+                if job_id is not None and not await asyncio.to_thread(self.broker.owns, job_id, self.worker_id):
+                    raise RuntimeError(f"Аренда задачи {job_id} истекла, видео не отправлено")
+                await send_media(
+                    self.bot, payload['chat_id'], 'video', path,
+                    filename="compressed_video.mp4",
+                    caption=compressed_video_caption(
+                        payload.get('duration'), payload.get('file_size') or 0, os.path.getsize(path)
+                    ),
+                    reply_to_message_id=payload.get('message_id')
+                )
+
+            # with_text: кроме сжатого видео нужен текст (его доставляет бот)
+            return await self.pipeline.compress(
+                self.bot, payload['file_id'], deliver, payload.get('file_size'), payload.get('duration'),
+                language=payload['language'] if payload.get('with_text') else None
+            )
+
+        raise ValueError(f"Неизвестный тип задачи: {kind}")
+
+
+def run_worker():
+    """Запускает медиа-воркер до Ctrl+C"""
+    log_level = getattr(logging, LOG_LEVEL.upper(), logging.INFO)
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=log_level
+    )
+
+    broker = SQLiteBroker(BROKER_PATH, lease_seconds=JOB_LEASE_SECONDS, max_attempts=JOB_MAX_ATTEMPTS)
+    worker = MediaWorker(
+        broker,
+        MediaPipeline(max_concurrent_jobs=WORKER_CONCURRENCY),
+        ExtBot(
+            BOT_TOKEN,
+            base_url=BOT_API_BASE_URL or 'https://api.telegram.org/bot',
+            base_file_url=BOT_API_BASE_FILE_URL or 'https://api.telegram.org/file/bot',
+            local_mode=BOT_API_LOCAL_MODE,
+            rate_limiter=FloodControlLimiter()
+        ),
+        concurrency=WORKER_CONCURRENCY,
+        heartbeat_interval=WORKER_HEARTBEAT_INTERVAL,
+        poll_interval=BROKER_POLL_INTERVAL,
+        janitor=TempJanitor() if AUTO_DELETE_TEMP_FILES else None
+    )
+    try:
+        asyncio.run(worker.run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        broker.close()
+
+
+if __name__ == "__main__":
+    run_worker()
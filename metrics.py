@@ -0,0 +1,171 @@
+"""
+Метрики Prometheus: время этапов обработки, счетчики и загрузка
+"""
+
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+logger = logging.getLogger(__name__)
+
+# Обработчик бота, от имени которого выполняется задача (метка handler)
+current_handler = ContextVar('current_handler', default='none')
+
+STAGE_SECONDS = Histogram(
+    'convert_bot_stage_seconds',
+    'Время этапа обработки медиа',
+    ['stage', 'media', 'handler'],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+)
+CACHE_LOOKUPS = Counter(
+    'convert_bot_cache_lookups_total',
+    'Обращения к кэшу распознанного текста',
+    ['result']
+)
+FAILURES = Counter(
+    'convert_bot_failures_total',
+    'Задачи, завершившиеся ошибкой',
+    ['handler']
+)
+REJECTED_TOO_LARGE = Counter(
+    'convert_bot_rejected_too_large_total',
+    'Файлы, отклоненные из-за размера',
+    ['handler']
+)
+TEMP_RECLAIMED_BYTES = Counter(
+    'convert_bot_temp_reclaimed_bytes_total',
+    'Место, освобожденное фоновой очисткой временных файлов',
+    ['reason']
+)
+OUTBOUND_EVENTS = Counter(
+    'convert_bot_outbound_events_total',
+    'Исходящие запросы к Bot API, задержанные или отброшенные ограничителем',
+    ['event']
+)
+JOBS_IN_FLIGHT = Gauge('convert_bot_jobs_in_flight', 'Выполняемые задачи в пуле воркеров')
+QUEUE_DEPTH = Gauge('convert_bot_queue_depth', 'Задачи, ожидающие в очереди')
+POOL_SATURATION = Gauge('convert_bot_worker_pool_saturation', 'Доля занятых слотов пула воркеров (0.0 - 1.0)')
+TEMP_DISK_BYTES = Gauge('convert_bot_temp_disk_bytes', 'Размер временных файлов задач')
+
+# Замеры, сделанные внутри воркеров пула (передаются в основной процесс)
+_local = threading.local()
+
+
+def enable_sample_buffer():
+    """
+    Включает накопление замеров в текущем потоке воркера
+
+    Воркер пула может быть отдельным процессом, где метрики основного
+    процесса недоступны, поэтому замеры копятся в буфере, возвращаются
+    вместе с результатом задачи и записываются через replay_samples.
+    """
+    _local.samples = []
+
+
+def drain_samples() -> list:
+    """Забирает накопленные в текущем потоке замеры"""
+    samples = getattr(_local, 'samples', None)
+    if not samples:
+        return []
+    _local.samples = []
+    return samples
+
+
+def replay_samples(samples: list):
+    """Записывает замеры воркера в метрики основного процесса"""
+    for stage, media, seconds in samples:
+        observe_stage(stage, media, seconds)
+
+
+def observe_stage(stage: str, media: str, seconds: float):
+    """Записывает длительность этапа (или сохраняет ее в буфер воркера)"""
+    samples = getattr(_local, 'samples', None)
+    if samples is not None:
+        samples.append((stage, media, seconds))
+        return
+    STAGE_SECONDS.labels(stage=stage, media=media, handler=current_handler.get()).observe(seconds)
+
+
+@contextmanager
+def stage_timer(stage: str, media: str):
+    """Замеряет время выполнения блока как этап обработки"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, media, time.perf_counter() - started)
+
+
+def count_cache_lookup(hit: bool):
+    """Учитывает попадание или промах кэша"""
+    CACHE_LOOKUPS.labels(result='hit' if hit else 'miss').inc()
+
+
+def count_failure(handler: str = None):
+    """Учитывает задачу, завершившуюся ошибкой"""
+    FAILURES.labels(handler=handler or current_handler.get()).inc()
+
+
+def count_rejected_too_large(handler: str):
+    """Учитывает файл, отклоненный из-за размера"""
+    REJECTED_TOO_LARGE.labels(handler=handler).inc()
+
+
+def directory_size(path: str) -> int:
+    """Суммарный размер файлов в директории (рекурсивно)"""
+    total = 0
+    try:
+        entries = list(os.scandir(path))
+    except OSError:
+        return 0
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                total += directory_size(entry.path)
+            elif entry.is_file(follow_symlinks=False):
+                total += entry.stat(follow_symlinks=False).st_size
+        except OSError:
+            # Файл мог быть удален во время обхода
+            pass
+    return total
+
+
+def count_reclaimed(reason: str, size: int):
+    """Учитывает место, освобожденное очисткой временных файлов"""
+    TEMP_RECLAIMED_BYTES.labels(reason=reason).inc(size)
+
+
+def count_outbound(event: str):
+    """Учитывает отброшенный запрос (dropped) или ответ RetryAfter от Telegram (retry_after)"""
+    OUTBOUND_EVENTS.labels(event=event).inc()
+
+
+def start_metrics_server(port: int, in_flight=None, queue_depth=None, temp_dirs=(), pool_saturation=None):
+    """
+    Запускает HTTP сервер /metrics и подключает gauge'и к источникам
+
+    Args:
+        port: Порт сервера (0 - метрики отключены)
+        in_flight: Функция без аргументов - число выполняемых задач
+        queue_depth: Функция без аргументов - глубина очереди
+        temp_dirs: Директории временных файлов задач
+        pool_saturation: Функция без аргументов - доля занятых слотов пула воркеров
+    """
+    if not port:
+        return
+    if in_flight is not None:
+        JOBS_IN_FLIGHT.set_function(in_flight)
+    if queue_depth is not None:
+        QUEUE_DEPTH.set_function(queue_depth)
+    if pool_saturation is not None:
+        POOL_SATURATION.set_function(pool_saturation)
+    temp_dirs = [path for path in temp_dirs if path]
+    TEMP_DISK_BYTES.set_function(lambda: sum(directory_size(path) for path in temp_dirs))
+
+    start_http_server(port)
+    logger.info(f"📈 Метрики Prometheus: http://0.0.0.0:{port}/metrics")
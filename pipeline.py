@@ -0,0 +1,260 @@
+"""
+Скачивание файла Telegram и его обработка в пуле воркеров
+"""
+
+import os
+import time
+import asyncio
+import logging
+import importlib
+
+from telegram import Bot
+
+from config import (
+    MAX_CONCURRENT_JOBS, CPU_WORKERS, IO_WORKERS, SCRATCH_DIR, JOB_DISK_BUDGET,
+    RECOGNITION_LANGUAGE, RECOGNITION_FANOUT, MAX_CHUNK_SECONDS, CHUNK_RETRIES,
+    STREAMING_INGEST, RECOGNITION_BACKEND, VOSK_MODEL_PATH, TWO_PASS_ENCODING,
+    INGEST_RAM_DIR, INGEST_MEMORY_THRESHOLD, INGEST_MEMORY_BUDGET,
+    PROFILE_SAMPLE_RATE, PROFILE_DIR, PROFILER
+)
+from downloads import RangedDownloader, local_file_path
+from ingest import IngestBuffer, MemoryBudget
+from metrics import stage_timer
+from progress import ProgressReporter
+from recognition import get_backend_class
+from streaming_ingest import StreamingTranscriber
+from worker_pool import WorkerPool
+from workspace import JobWorkspace
+
+logger = logging.getLogger(__name__)
+
+# Целевой размер сжатого видео для пользователя
+COMPRESSED_VIDEO_TARGET_MB = 2
+
+
+def compressed_video_caption(duration: int, original_size: int, compressed_size: int) -> str:
+    """Подпись к сжатому видео"""
+    return f"""
+🎬 ВИДЕО сжато!
+
+📊 Статистика:
+• Длительность: {duration} сек
+• Исходный размер: {original_size / (1024*1024):.1f}MB
+• Сжатый размер: {compressed_size / (1024*1024):.1f}MB
+                """
+
+
+class MediaPipeline:
+    """
+    Обработка одного файла Telegram: скачивание в буфер задачи,
+    распознавание речи или сжатие в пуле воркеров и очистка временных
+    файлов. Используется ботом (локальная обработка) и медиа-воркерами.
+    """
+
+    def __init__(self, max_concurrent_jobs: int = MAX_CONCURRENT_JOBS):
+        # Тяжелая обработка выполняется в пуле, чтобы не блокировать event loop
+        self.worker_pool = WorkerPool(
+            cpu_workers=CPU_WORKERS,
+            io_workers=IO_WORKERS,
+            max_concurrent_jobs=max_concurrent_jobs,
+            processor_kwargs={
+                'recognition_fanout': RECOGNITION_FANOUT,
+                'max_chunk_seconds': MAX_CHUNK_SECONDS,
+                'chunk_retries': CHUNK_RETRIES,
+                'recognition_backend': RECOGNITION_BACKEND,
+                'backend_options': {'model_path': VOSK_MODEL_PATH} if RECOGNITION_BACKEND == 'vosk' else {},
+                'two_pass_encoding': TWO_PASS_ENCODING,
+                'profile_sample_rate': PROFILE_SAMPLE_RATE,
+                'profile_dir': PROFILE_DIR,
+                'profiler': PROFILER
+            }
+        )
+        # Локальные движки грузят процессор - распознаем аудио в пуле процессов
+        self.recognition_cpu_bound = get_backend_class(RECOGNITION_BACKEND).cpu_bound
+        # Файлы скачиваются несколькими параллельными Range запросами
+        self.downloader = RangedDownloader()
+        # Распознавание речи во время скачивания
+        self.streaming_transcriber = StreamingTranscriber(
+            self.worker_pool,
+            fanout=RECOGNITION_FANOUT,
+            max_chunk_seconds=MAX_CHUNK_SECONDS,
+            cpu_bound=self.recognition_cpu_bound,
+            downloader=self.downloader
+        )
+        # Маленькие файлы скачиваются в память (tmpfs) в пределах общего лимита
+        self.ingest_budget = MemoryBudget(INGEST_MEMORY_BUDGET)
+        # Рабочие директории выполняемых задач (их не трогает фоновая очистка)
+        self.active_workspaces = set()
+
+    def create_workspace(self) -> JobWorkspace:
+        """Создает изолированную рабочую директорию для новой задачи"""
+        workspace = JobWorkspace(SCRATCH_DIR, budget_bytes=JOB_DISK_BUDGET)
+        self.active_workspaces.add(os.path.basename(workspace.path))
+        return workspace
+
+    def finish_workspace(self, workspace: JobWorkspace):
+        """Удаляет рабочую директорию завершенной задачи"""
+        workspace.cleanup()
+        self.active_workspaces.discard(os.path.basename(workspace.path))
+
+    def create_ingest(self, workspace: JobWorkspace, name: str, file_size: int = None) -> IngestBuffer:
+        """Создает буфер для скачивания файла: в памяти, если он маленький, иначе на диске"""
+        return IngestBuffer(
+            workspace, name,
+            expected_size=file_size,
+            memory_budget=self.ingest_budget,
+            ram_dir=INGEST_RAM_DIR,
+            memory_threshold=INGEST_MEMORY_THRESHOLD
+        )
+
+    async def transcribe(self, bot: Bot, file_id: str, kind: str, file_size: int = None,
+                         language: str = RECOGNITION_LANGUAGE, progress: ProgressReporter = None,
+                         duration: float = None, transcript=None) -> dict:
+        """
+        Скачивает файл в буфер задачи и преобразует речь в текст
+
+        Args:
+            bot: Бот для скачивания файла
+            file_id: Идентификатор файла Telegram
+            kind: Тип обработки: 'video' или 'audio'
+            file_size: Размер файла из Telegram (если известен)
+            language: Язык для распознавания
+            progress: Прогресс задачи в сообщении пользователя (если есть)
+            duration: Длительность из Telegram (для процента декодирования)
+            transcript: TranscriptWriter, отправляющий текст по мере распознавания (если есть)
+
+        Returns:
+            dict: Результат обработки MediaProcessor
+        """
+        workspace = self.create_workspace()
+        ingest = None
+        try:
+            # Получаем файл
+            file = await bot.get_file(file_id)
+            local_path = local_file_path(file.file_path)
+
+            def process_downloaded(input_path: str = None):
+                workspace.check_budget()
+                if progress is not None:
+                    # Декодирование и распознавание идут в воркерах, прогресс - в файлах задачи
+                    progress.watch(workspace, 'decode', duration)
+                if transcript is not None:
+                    # Воркеры дописывают распознанные фрагменты в файл задачи
+                    transcript.watch(workspace)
+                # Файл локального Bot API сервера принадлежит серверу, его нельзя удалять
+                options = {'workspace': workspace, 'keep_input': input_path is not None}
+                input_path = input_path or ingest.path
+                if kind == 'video':
+                    return self.worker_pool.run_cpu('process_video_to_text', input_path, language, **options)
+                run = self.worker_pool.run_cpu if self.recognition_cpu_bound else self.worker_pool.run_io
+                return run('process_audio_to_text', input_path, language, **options)
+
+            if local_path:
+                # Локальный Bot API сервер: файл уже на диске, обрабатываем его на месте
+                logger.info(f"📂 Файл читается с диска Bot API сервера: {local_path}")
+                return await process_downloaded(local_path)
+
+            ingest = self.create_ingest(workspace, 'input.mp4' if kind == 'video' else 'input.mp3', file_size)
+            if STREAMING_INGEST:
+                # Распознаем речь, не дожидаясь окончания скачивания
+                result = await self.streaming_transcriber.transcribe(
+                    file.file_path, ingest, language, fallback=process_downloaded, media=kind,
+                    progress=progress, total_bytes=file_size, transcript=transcript
+                )
+                workspace.check_budget()
+                return result
+
+            # Скачиваем файл в буфер задачи
+            if progress is not None:
+                progress.update('download', 0, file_size)
+            with stage_timer('download', kind):
+                await self.downloader.download(file.file_path, ingest, file_size, progress)
+            if progress is not None:
+                progress.update('download', ingest.size, file_size or ingest.size)
+            return await process_downloaded()
+
+        finally:
+            # Удаляем временные файлы задачи
+            if ingest is not None:
+                ingest.release()
+            self.finish_workspace(workspace)
+
+    async def compress(self, bot: Bot, file_id: str, deliver, file_size: int = None, duration: int = None,
+                       language: str = None, transcript=None) -> dict:
+        """
+        Скачивает видео, сжимает его для отправки пользователю и передает в deliver
+
+        Если указан language, речь распознается из того же запуска ffmpeg,
+        что сжимает видео (MediaProcessor.process_video_to_text с
+        compress_target_mb): файл декодируется один раз.
+
+        Args:
+            bot: Бот для скачивания файла
+            file_id: Идентификатор файла Telegram
+            deliver: Корутинная функция deliver(path), отправляющая сжатое видео;
+                     файл удаляется после ее завершения
+            file_size: Размер файла из Telegram (если известен)
+            duration: Длительность из Telegram (если известна, ffprobe не запускается)
+            language: Язык распознавания, если кроме сжатого видео нужен текст
+            transcript: TranscriptWriter, отправляющий текст по мере распознавания (если есть)
+
+        Returns:
+            dict: {'success', 'compressed_size'}, а с language - результат
+                  MediaProcessor (text, segments, ...). Если видео сжато, но
+                  текст получить не удалось, success=False, а видео отправлено.
+        """
+        workspace = self.create_workspace()
+        ingest = None
+        try:
+            file = await bot.get_file(file_id)
+            input_path = local_file_path(file.file_path)
+
+            if input_path is None:
+                # Скачиваем видео в буфер задачи
+                ingest = self.create_ingest(workspace, 'input.mp4', file_size)
+                with stage_timer('download', 'video'):
+                    await self.downloader.download(file.file_path, ingest, file_size)
+                input_path = ingest.path
+            workspace.check_budget()
+
+            if language is None:
+                # Сжимаем видео
+                compressed_video_path = await self.worker_pool.run_cpu(
+                    'compress_video_for_user', input_path, target_size_mb=COMPRESSED_VIDEO_TARGET_MB, workspace=workspace,
+                    duration=duration
+                )
+                result = {'success': True}
+            else:
+                # Сжатое видео и PCM для распознавания - из одного запуска ffmpeg
+                if transcript is not None:
+                    transcript.watch(workspace)
+                result = await self.worker_pool.run_cpu(
+                    'process_video_to_text', input_path, language, workspace=workspace, keep_input=True,
+                    compress_target_mb=COMPRESSED_VIDEO_TARGET_MB, duration=duration
+                )
+                compressed_video_path = result.pop('compressed_path', None)
+                if compressed_video_path is None:
+                    return result
+
+            # Отправляем сжатое видео с диска
+            await deliver(compressed_video_path)
+            result['compressed_size'] = os.path.getsize(compressed_video_path)
+            return result
+
+        finally:
+            # Удаляем временные файлы задачи
+            if ingest is not None:
+                ingest.release()
+            self.finish_workspace(workspace)
+
+    async def warm_up(self):
+        """Заранее загружает медиа-библиотеки и запускает процессы пула"""
+        started = time.perf_counter()
+        # pydub нужен в этом процессе для распознавания во время скачивания
+        await asyncio.to_thread(importlib.import_module, 'pydub.silence')
+        await self.worker_pool.warm_up()
+        logger.info(f"🔥 Прогрев обработки завершен за {time.perf_counter() - started:.1f} сек")
+
+    def shutdown(self):
+        """Останавливает пул воркеров"""
+        self.worker_pool.shutdown(wait=False)
@@ -0,0 +1,276 @@
+"""
+Прогресс обработки в сообщении пользователя
+
+ProgressReporter работает в процессе бота и редактирует сообщение "Обрабатываю..."
+не чаще одного раза в interval секунд. Прогресс приходит из трех источников:
+- скачивание: число полученных байт (update из pipeline / streaming_ingest);
+- ffmpeg: файл -progress в рабочей директории задачи (out_time);
+- распознавание: файл с числом готовых фрагментов в рабочей директории.
+Там же воркеры дописывают тексты распознанных фрагментов (segments.jsonl),
+их по мере готовности отправляет пользователю TranscriptWriter.
+Файлы пишутся воркерами пула (в том числе из других процессов), а
+читаются ботом на каждом такте, поэтому отдельный канал между процессами
+не нужен.
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Файлы прогресса в рабочей директории задачи
+FFMPEG_PROGRESS_FILE = 'ffmpeg.progress'
+SEGMENTS_PROGRESS_FILE = 'segments.progress'
+SEGMENTS_TEXT_FILE = 'segments.jsonl'
+
+# Этапы в порядке показа
+STAGES = {
+    'download': '⬇️ Скачивание',
+    'decode': '🎵 Извлечение аудио',
+    'recognize': '📝 Распознавание',
+    'compress': '🗜 Сжатие видео',
+}
+
+# Хвост файла ffmpeg -progress, в котором ищется последнее значение
+FFMPEG_PROGRESS_TAIL = 4096
+
+
+def write_segments_progress(path: str, done: int, total: int):
+    """Записывает число распознанных фрагментов (вызывается из воркера пула)"""
+    tmp_path = path + '.tmp'
+    try:
+        with open(tmp_path, 'w') as f:
+            f.write(f"{done} {total}")
+        os.replace(tmp_path, path)
+    except OSError as e:
+        # Прогресс необязателен, обработка продолжается
+        logger.debug(f"Не удалось записать прогресс: {e}")
+
+
+def read_segments_progress(path: str):
+    """(готово, всего) фрагментов или None, если распознавание не началось"""
+    try:
+        with open(path) as f:
+            done, total = f.read().split()
+        return int(done), int(total)
+    except (OSError, ValueError):
+        return None
+
+
+def append_segment_text(path: str, index: int, start_ms: int, end_ms: int, text: str):
+    """Дописывает распознанный фрагмент одной строкой JSON (вызывается из воркера пула)"""
+    line = json.dumps({'index': index, 'start_ms': start_ms, 'end_ms': end_ms, 'text': text}, ensure_ascii=False)
+    try:
+        # Одна запись целиком, поэтому читатель не увидит половину строки
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+    except OSError as e:
+        logger.debug(f"Не удалось записать фрагмент текста: {e}")
+
+
+def read_segment_texts(path: str, offset: int = 0):
+    """
+    Новые фрагменты из segments.jsonl
+
+    Returns:
+        tuple: (список фрагментов-словарей, смещение для следующего чтения)
+    """
+    try:
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            data = f.read()
+    except OSError:
+        return [], offset
+
+    # Последняя строка может быть еще не дописана
+    complete = data[:data.rfind(b'\n') + 1]
+    segments = []
+    for line in complete.splitlines():
+        try:
+            segments.append(json.loads(line))
+        except ValueError:
+            continue
+    return segments, offset + len(complete)
+
+
+def read_ffmpeg_progress(path: str):
+    """
+    Последнее состояние ffmpeg из файла -progress
+
+    Returns:
+        tuple | None: (обработано секунд, завершен ли ffmpeg) или None
+    """
+    try:
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - FFMPEG_PROGRESS_TAIL))
+            tail = f.read().decode('ascii', errors='replace')
+    except OSError:
+        return None
+
+    seconds, finished = None, False
+    for line in tail.splitlines():
+        key, _, value = line.partition('=')
+        if key == 'out_time_us' and value.strip().isdigit():
+            seconds = int(value) / 1_000_000
+        elif key == 'progress':
+            finished = value.strip() == 'end'
+    if seconds is None:
+        return None
+    return seconds, finished
+
+
+def _bar(fraction: float, width: int = 10) -> str:
+    filled = int(round(fraction * width))
+    return '▓' * filled + '░' * (width - filled)
+
+
+def format_stage(stage: str, done, total) -> str:
+    """Строка этапа: название, процент и подробности"""
+    label = STAGES.get(stage, stage)
+    if done is None:
+        return f"{label}..."
+
+    if stage == 'download':
+        detail = f"{done / (1024*1024):.1f}MB" + (f" из {total / (1024*1024):.1f}MB" if total else '')
+    elif stage == 'recognize':
+        detail = f"{done}" + (f"/{total}" if total else '') + " фрагм."
+    else:
+        # Секунды медиа, обработанные ffmpeg
+        detail = f"{int(done) // 60}:{int(done) % 60:02d}" + (
+            f" из {int(total) // 60}:{int(total) % 60:02d}" if total else ''
+        )
+
+    if not total:
+        return f"{label}: {detail}"
+    fraction = min(1.0, done / total)
+    return f"{label}: {_bar(fraction)} {fraction:.0%} ({detail})"
+
+
+class ProgressReporter:
+    """
+    Показывает прогресс задачи, редактируя одно сообщение.
+
+    update() только запоминает состояние, сообщение редактирует фоновая
+    задача: не чаще раза в interval секунд и только если текст изменился.
+    Если задача завершилась быстрее interval, сообщение не редактируется
+    ни разу. Правки отправляются с низким приоритетом (rate_limiter.LOW_PRIORITY)
+    и пропускаются, если Telegram не успевает принимать сообщения.
+    Используется как async context manager.
+
+    Пример:
+        async with ProgressReporter(processing_msg, header) as progress:
+            result = await pipeline.transcribe(..., progress=progress)
+    """
+
+    def __init__(self, message, header: str, interval: float = None):
+        if interval is None:
+            # Воркеры пула импортируют этот модуль без настроек бота (BOT_TOKEN), поэтому config - здесь
+            from config import PROGRESS_INTERVAL
+            interval = PROGRESS_INTERVAL
+        self.message = message
+        self.header = header.rstrip()
+        self.interval = interval
+        self._stages = {}
+        self._workspace = None
+        self._ffmpeg_stage = None
+        self._duration = None
+        self._last_text = None
+        self._next_edit = 0.0
+        self._task = None
+
+    def update(self, stage: str, done=None, total=None):
+        """Запоминает состояние этапа (без запросов к Telegram)"""
+        self._stages[stage] = (done, total)
+
+    def watch(self, workspace, ffmpeg_stage: str = None, duration: float = None):
+        """
+        Начинает читать файлы прогресса воркеров в рабочей директории задачи
+
+        Args:
+            workspace: Рабочая директория задачи (JobWorkspace)
+            ffmpeg_stage: Этап, к которому относится прогресс ffmpeg ('decode', 'compress')
+            duration: Длительность медиа в секундах (для процента ffmpeg), если известна
+        """
+        self._workspace = workspace
+        self._ffmpeg_stage = ffmpeg_stage
+        self._duration = duration
+        if ffmpeg_stage:
+            self.update(ffmpeg_stage)
+
+    def render(self) -> str:
+        """Текст сообщения с текущим прогрессом"""
+        self._poll_workspace()
+        lines = [format_stage(stage, done, total) for stage, (done, total) in self._stages.items()]
+        return self.header + ('\n\n' + '\n'.join(lines) if lines else '')
+
+    def _poll_workspace(self):
+        if self._workspace is None:
+            return
+        if self._ffmpeg_stage:
+            state = read_ffmpeg_progress(self._workspace.file(FFMPEG_PROGRESS_FILE))
+            if state is not None:
+                seconds, finished = state
+                total = self._duration
+                if finished:
+                    seconds = total = total or seconds
+                self.update(self._ffmpeg_stage, seconds, total)
+        segments = read_segments_progress(self._workspace.file(SEGMENTS_PROGRESS_FILE))
+        if segments is not None:
+            self.update('recognize', *segments)
+
+    async def flush(self):
+        """Редактирует сообщение, если текст изменился и прошло достаточно времени"""
+        now = time.monotonic()
+        if now < self._next_edit:
+            return
+        text = self.render()
+        if text == self._last_text:
+            return
+
+        # Воркеры пула импортируют этот модуль ради write_segments_progress, telegram им не нужен
+        from telegram.error import BadRequest, RetryAfter
+        from rate_limiter import LOW_PRIORITY, RequestDropped
+
+        self._next_edit = now + self.interval
+        bot = self.message.get_bot()
+        # Прогресс - низкоприоритетный запрос: при нехватке лимита он пропускается
+        extra = {'rate_limit_args': LOW_PRIORITY} if getattr(bot, 'rate_limiter', None) else {}
+        try:
+            await bot.edit_message_text(
+                text, chat_id=self.message.chat_id, message_id=self.message.message_id, **extra
+            )
+            self._last_text = text
+        except RequestDropped:
+            # Попробуем на следующем такте, когда лимит освободится
+            pass
+        except RetryAfter as e:
+            self._next_edit = time.monotonic() + e.retry_after
+            logger.warning(f"⚠️ Прогресс: Telegram просит подождать {e.retry_after} сек")
+        except BadRequest as e:
+            if 'not modified' in str(e).lower():
+                self._last_text = text
+            else:
+                logger.warning(f"⚠️ Не удалось обновить прогресс: {e}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.warning(f"⚠️ Не удалось обновить прогресс: {e}")
+
+    async def __aenter__(self):
+        self._last_text = self.message.text
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        # Итоговый текст сообщения задает обработчик, промежуточный прогресс не нужен
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        return False
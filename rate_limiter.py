@@ -0,0 +1,166 @@
+"""
+Ограничение исходящих запросов к Bot API с учетом лимитов Telegram
+"""
+
+import time
+import asyncio
+import logging
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+import metrics
+from config import (
+    OUTBOUND_GLOBAL_RATE, OUTBOUND_CHAT_RATE, OUTBOUND_CHAT_BURST, OUTBOUND_GROUP_PER_MINUTE, OUTBOUND_MAX_RETRIES
+)
+
+logger = logging.getLogger(__name__)
+
+# rate_limit_args для запросов, которые можно потерять (например, прогресс)
+LOW_PRIORITY = {'priority': 'low'}
+
+# Сколько простаивающих чатов хранить, прежде чем чистить их счетчики
+MAX_TRACKED_CHATS = 10000
+
+
+class RequestDropped(Exception):
+    """Низкоприоритетный запрос не отправлен, чтобы не задерживать остальные"""
+
+
+class TokenBucket:
+    """Ведро токенов: rate запросов в секунду, не больше burst подряд"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        # Ожидающие запросы получают токены по очереди, иначе сообщения в чат перемешаются
+        self.queue = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Через сколько секунд можно отправить запрос (0 - сейчас)"""
+        self._refill(now)
+        wait = max(0.0, self.blocked_until - now)
+        if self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return wait
+
+    def take(self):
+        self.tokens -= 1
+
+    @property
+    def idle(self) -> bool:
+        return (self.tokens >= self.burst and self.blocked_until <= time.monotonic()
+                and not self.queue.locked())
+
+
+class FloodControlLimiter(BaseRateLimiter):
+    """
+    Единый ограничитель исходящих запросов бота (Application.builder().rate_limiter).
+
+    Запросы в чаты проходят через общее ведро (global_rate сообщений в
+    секунду на бота) и ведро чата (chat_rate для личных чатов,
+    group_rate для групп). Обычные запросы ждут токены, а если Telegram
+    ответил RetryAfter - ждут указанное время и повторяются до
+    max_retries раз. Запросы с rate_limit_args=LOW_PRIORITY (прогресс)
+    не ждут: если токенов нет, чат заблокирован RetryAfter или своей
+    очереди ждут обычные запросы, вызывается RequestDropped. Поэтому
+    под нагрузкой первыми теряются правки прогресса, а не результаты.
+    Запросы без chat_id (getFile, getMe и т.д.) не ограничиваются.
+    """
+
+    def __init__(self, global_rate: float = OUTBOUND_GLOBAL_RATE, chat_rate: float = OUTBOUND_CHAT_RATE,
+                 chat_burst: float = OUTBOUND_CHAT_BURST, group_rate: float = OUTBOUND_GROUP_PER_MINUTE / 60,
+                 max_retries: int = OUTBOUND_MAX_RETRIES):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self._chat_buckets = {}
+        self._waiting = {}
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= MAX_TRACKED_CHATS:
+                # Счетчики чатов без недавних запросов не нужны
+                for idle_chat in [chat for chat, b in self._chat_buckets.items() if b.idle]:
+                    del self._chat_buckets[idle_chat]
+            # Группы и каналы: отрицательный id или @username
+            is_group = str(chat_id).startswith(('-', '@'))
+            rate = self.group_rate if is_group else self.chat_rate
+            bucket = self._chat_buckets[chat_id] = TokenBucket(rate, max(1, min(self.chat_burst, rate * 60)))
+        return bucket
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get('chat_id')
+        low_priority = bool(rate_limit_args) and rate_limit_args.get('priority') == 'low'
+        if chat_id is None:
+            return await callback(*args, **kwargs)
+
+        chat_bucket = self._chat_bucket(chat_id)
+        for attempt in range(self.max_retries + 1):
+            if low_priority:
+                self._take_or_drop(chat_id, chat_bucket, endpoint)
+            else:
+                await self._wait_for_tokens(chat_id, chat_bucket)
+
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                # Telegram сам сказал, сколько ждать: до этого времени чат заблокирован
+                chat_bucket.blocked_until = time.monotonic() + e.retry_after
+                metrics.count_outbound('retry_after')
+                logger.warning(
+                    f"⚠️ Telegram ограничил отправку в чат {chat_id} ({endpoint}): "
+                    f"жду {e.retry_after} сек (попытка {attempt + 1})"
+                )
+                if low_priority or attempt == self.max_retries:
+                    raise
+
+    def _take_or_drop(self, chat_id, chat_bucket: TokenBucket, endpoint: str):
+        now = time.monotonic()
+        if (self._waiting.get(chat_id) or self._waiting.get(None)
+                or chat_bucket.delay(now) > 0 or self.global_bucket.delay(now) > 0):
+            metrics.count_outbound('dropped')
+            logger.debug(f"Пропущен низкоприоритетный запрос {endpoint} в чат {chat_id}")
+            raise RequestDropped(endpoint)
+        chat_bucket.take()
+        self.global_bucket.take()
+
+    async def _wait_for_tokens(self, chat_id, chat_bucket: TokenBucket):
+        # Пока обычные запросы ждут, низкоприоритетные в тот же чат (а если ждут
+        # общего лимита - в любой чат) не отправляются
+        self._waiting[chat_id] = self._waiting.get(chat_id, 0) + 1
+        waiting_global = False
+        try:
+            async with chat_bucket.queue:
+                while True:
+                    now = time.monotonic()
+                    chat_wait, global_wait = chat_bucket.delay(now), self.global_bucket.delay(now)
+                    if chat_wait <= 0 and global_wait <= 0:
+                        chat_bucket.take()
+                        self.global_bucket.take()
+                        return
+                    if global_wait > 0 and not waiting_global:
+                        waiting_global = True
+                        self._waiting[None] = self._waiting.get(None, 0) + 1
+                    await asyncio.sleep(max(chat_wait, global_wait))
+        finally:
+            for key in (chat_id, None) if waiting_global else (chat_id,):
+                self._waiting[key] -= 1
+                if not self._waiting[key]:
+                    del self._waiting[key]
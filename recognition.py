@@ -0,0 +1,181 @@
+"""
+Бэкенды распознавания речи
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class RecognitionError(Exception):
+    """Ошибка сервиса или движка распознавания (имеет смысл повторить)"""
+
+
+class RecognitionBackend:
+    """
+    Базовый класс бэкенда распознавания.
+
+    recognize() получает сырые PCM данные (моно) и возвращает текст или
+    пустую строку, если речь не найдена. Временные сбои сообщаются через
+    RecognitionError. cpu_bound = True означает, что распознавание грузит
+    процессор и его лучше выполнять в пуле процессов.
+    """
+
+    name = None
+    cpu_bound = False
+
+    @classmethod
+    def cache_key(cls, **options) -> str:
+        """
+        Движок распознавания для ключа кэша текста
+
+        Текст, распознанный другим бэкендом или моделью, из кэша не выдается.
+
+        Args:
+            **options: Параметры конструктора бэкенда (как в create_backend)
+        """
+        return cls.name
+
+    def warm_up(self):
+        """Загружает модели заранее, чтобы первый запрос не ждал"""
+
+    def recognize(self, pcm: bytes, sample_rate: int, sample_width: int, language: str) -> str:
+        raise NotImplementedError
+
+
+class GoogleBackend(RecognitionBackend):
+    """Google Web Speech API через speech_recognition"""
+
+    name = 'google'
+    cpu_bound = False
+
+    def __init__(self):
+        import speech_recognition as sr
+        self._sr = sr
+        self.recognizer = sr.Recognizer()
+
+    def recognize(self, pcm: bytes, sample_rate: int, sample_width: int, language: str) -> str:
+        audio_data = self._sr.AudioData(pcm, sample_rate, sample_width)
+        try:
+            return self.recognizer.recognize_google(audio_data, language=language)
+        except self._sr.UnknownValueError:
+            return ''
+        except self._sr.RequestError as e:
+            raise RecognitionError(str(e)) from e
+
+
+# Модели Vosk загружаются один раз на процесс и разделяются между потоками
+_vosk_models = {}
+_vosk_lock = threading.Lock()
+
+
+class VoskBackend(RecognitionBackend):
+    """
+    Локальное распознавание на CPU с помощью Vosk (Kaldi).
+
+    Модель задается путем к распакованному каталогу модели, например
+    vosk-model-small-ru-0.22. Язык определяется моделью.
+    """
+
+    name = 'vosk'
+    cpu_bound = True
+
+    def __init__(self, model_path: str = None):
+        try:
+            import vosk
+        except ImportError as e:
+            raise RuntimeError(
+                "Для локального распознавания установите vosk: pip install vosk"
+            ) from e
+
+        if not model_path:
+            raise ValueError("Не указан путь к модели Vosk (VOSK_MODEL_PATH)")
+
+        vosk.SetLogLevel(-1)
+        self._vosk = vosk
+        self.model_path = model_path
+
+    @classmethod
+    def cache_key(cls, model_path: str = None, **options) -> str:
+        # Язык и качество определяются моделью
+        return f"{cls.name}:{os.path.basename(os.path.normpath(model_path or ''))}"
+
+    def _model(self):
+        with _vosk_lock:
+            model = _vosk_models.get(self.model_path)
+            if model is None:
+                logger.info(f"Загружаю модель Vosk: {self.model_path}")
+                model = self._vosk.Model(self.model_path)
+                _vosk_models[self.model_path] = model
+            return model
+
+    def warm_up(self):
+        self._model()
+
+    def recognize(self, pcm: bytes, sample_rate: int, sample_width: int, language: str) -> str:
+        if sample_width != 2:
+            raise ValueError("Vosk принимает только 16-битный PCM")
+
+        recognizer = self._vosk.KaldiRecognizer(self._model(), sample_rate)
+        try:
+            recognizer.AcceptWaveform(pcm)
+            result = json.loads(recognizer.FinalResult())
+        except Exception as e:
+            raise RecognitionError(str(e)) from e
+        return result.get('text', '')
+
+
+class StubBackend(RecognitionBackend):
+    """
+    Заглушка без сети и моделей для бенчмарков и нагрузочных тестов.
+
+    Возвращает по одному слову на секунду аудио. delay_per_second
+    имитирует задержку настоящего сервиса распознавания.
+    """
+
+    name = 'stub'
+    cpu_bound = False
+
+    def __init__(self, delay_per_second: float = 0.0):
+        self.delay_per_second = delay_per_second
+
+    def recognize(self, pcm: bytes, sample_rate: int, sample_width: int, language: str) -> str:
+        seconds = len(pcm) / (sample_rate * sample_width)
+        if self.delay_per_second:
+            time.sleep(seconds * self.delay_per_second)
+        return ' '.join(['слово'] * max(1, int(seconds)))
+
+
+BACKENDS = {
+    GoogleBackend.name: GoogleBackend,
+    VoskBackend.name: VoskBackend,
+    StubBackend.name: StubBackend,
+}
+
+
+def get_backend_class(name: str):
+    """Возвращает класс бэкенда по имени"""
+    try:
+        return BACKENDS[name]
+    except KeyError:
+        raise ValueError(
+            f"Неизвестный бэкенд распознавания: {name}. Доступны: {', '.join(BACKENDS)}"
+        ) from None
+
+
+def create_backend(name: str, **options) -> RecognitionBackend:
+    """
+    Создает бэкенд распознавания
+
+    Args:
+        name: Имя бэкенда (google, vosk, stub)
+        **options: Параметры конструктора бэкенда
+
+    Returns:
+        RecognitionBackend: Экземпляр бэкенда
+    """
+    return get_backend_class(name)(**options)
@@ -5,6 +5,20 @@
 
 import os
 import sys
+import time
+import argparse
+import importlib.util
+from importlib import metadata
+
+# Пакет (для pip) -> модуль; проверяются без импорта
+DEPENDENCIES = {
+    'python-telegram-bot': 'telegram',
+    'pydub': 'pydub',
+    'SpeechRecognition': 'speech_recognition',
+}
+
+# Модули, которые должны загружаться при первой обработке, а не при запуске
+HEAVY_MODULES = ('pydub', 'speech_recognition', 'vosk', 'numpy', 'whisper', 'moviepy')
 
 def check_env_file():
     """Проверяем наличие файла .env"""
@@ -17,21 +31,46 @@ def check_env_file():
     return True
 
 def check_dependencies():
-    """Проверяем установленные зависимости"""
-    try:
-        import telegram
-        import moviepy
-        import pydub
-        import speech_recognition
-        print("✅ Все зависимости установлены")
-        return True
-    except ImportError as e:
-        print(f"❌ Не установлена зависимость: {e}")
+    """Проверяем установленные зависимости (по метаданным пакетов, без импорта)"""
+    missing = []
+    for package, module in DEPENDENCIES.items():
+        try:
+            metadata.version(package)
+        except metadata.PackageNotFoundError:
+            # Модуль может быть установлен без метаданных (например, рядом с ботом)
+            if importlib.util.find_spec(module) is None:
+                missing.append(package)
+    if missing:
+        print(f"❌ Не установлены зависимости: {', '.join(missing)}")
         print("📦 Установите зависимости: pip install -r requirements.txt")
         return False
+    print("✅ Все зависимости установлены")
+    return True
+
+def report_import_time(started: float, budget: float):
+    """Печатаем время импорта модулей и тяжелые модули, загруженные раньше времени"""
+    elapsed = time.perf_counter() - started
+    if elapsed > budget:
+        print(f"⚠️ Импорт модулей занял {elapsed:.2f} сек (бюджет {budget:.1f} сек)")
+    else:
+        print(f"⏱ Импорт модулей: {elapsed:.2f} сек (бюджет {budget:.1f} сек)")
+    eager = [name for name in HEAVY_MODULES if name in sys.modules]
+    if eager:
+        print(f"⚠️ При запуске загружены тяжелые модули: {', '.join(eager)}")
+
+def parse_args():
+    """Разбираем аргументы командной строки"""
+    parser = argparse.ArgumentParser(description="Запуск Telegram бота")
+    parser.add_argument(
+        '--mode', choices=['polling', 'webhook', 'worker'],
+        help="Режим получения обновлений (по умолчанию BOT_MODE из .env); "
+             "worker - запустить медиа-воркер для PROCESSING_MODE=broker"
+    )
+    return parser.parse_args()
 
 def main():
     """Основная функция"""
+    args = parse_args()
     print("🤖 Запуск Telegram бота...")
     
     # Проверяем файл .env
@@ -42,12 +81,26 @@ def main():
     if not check_dependencies():
         sys.exit(1)
     
+    # Запускаем медиа-воркер
+    if args.mode == 'worker':
+        started = time.perf_counter()
+        from media_worker import run_worker
+        from config import IMPORT_TIME_BUDGET
+        report_import_time(started, IMPORT_TIME_BUDGET)
+        print("🛠 Медиа-воркер запущен! Нажмите Ctrl+C для остановки")
+        run_worker()
+        print("\n👋 Медиа-воркер остановлен")
+        return
+    
     # Запускаем бота
     try:
+        started = time.perf_counter()
         from bot import TelegramBot
+        from config import IMPORT_TIME_BUDGET
+        report_import_time(started, IMPORT_TIME_BUDGET)
         bot = TelegramBot()
         print("🚀 Бот запущен! Нажмите Ctrl+C для остановки")
-        bot.run()
+        bot.run(mode=args.mode)
     except KeyboardInterrupt:
         print("\n👋 Бот остановлен")
     except Exception as e:
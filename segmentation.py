@@ -0,0 +1,125 @@
+"""
+Разбиение аудио на фрагменты ограниченной длины по паузам
+"""
+
+import logging
+from typing import TYPE_CHECKING, List, NamedTuple
+
+if TYPE_CHECKING:
+    # pydub загружается при первом разбиении, а не при импорте модуля
+    from pydub import AudioSegment
+
+logger = logging.getLogger(__name__)
+
+
+class AudioChunk(NamedTuple):
+    """Фрагмент аудио для распознавания"""
+    index: int
+    start_ms: int
+    audio: 'AudioSegment'
+
+    @property
+    def end_ms(self) -> int:
+        return self.start_ms + len(self.audio)
+
+
+class AudioSegmenter:
+    """
+    Нарезает аудио на фрагменты не длиннее max_chunk_ms.
+
+    Разрез делается в середине последней паузы после min_chunk_ms, а если
+    пауз нет - ровно по max_chunk_ms. Аудио можно подавать частями через
+    feed(), готовые фрагменты возвращаются сразу; остаток выдает flush().
+    """
+
+    def __init__(self, max_chunk_ms: int = 30000, min_chunk_ms: int = 5000,
+                 min_silence_ms: int = 400, silence_offset_db: float = 16,
+                 min_chunk_dbfs: float = -60):
+        self.max_chunk_ms = max_chunk_ms
+        self.min_chunk_ms = min(min_chunk_ms, max_chunk_ms)
+        self.min_silence_ms = min_silence_ms
+        self.silence_offset_db = silence_offset_db
+        self.min_chunk_dbfs = min_chunk_dbfs
+
+        self._buffer = None
+        self._buffer_start_ms = 0
+        self._next_index = 0
+
+    def feed(self, audio: 'AudioSegment') -> List[AudioChunk]:
+        """
+        Добавляет аудио и возвращает фрагменты, которые уже можно распознавать
+
+        Args:
+            audio: Очередная часть аудио
+
+        Returns:
+            List[AudioChunk]: Готовые фрагменты по порядку
+        """
+        self._buffer = audio if self._buffer is None else self._buffer + audio
+
+        chunks = []
+        while len(self._buffer) >= self.max_chunk_ms:
+            cut_ms = self._find_cut(self._buffer[:self.max_chunk_ms])
+            chunk = self._emit(self._buffer[:cut_ms])
+            if chunk is not None:
+                chunks.append(chunk)
+            self._buffer = self._buffer[cut_ms:]
+        return chunks
+
+    def flush(self) -> List[AudioChunk]:
+        """Возвращает последний неполный фрагмент"""
+        if self._buffer is None or len(self._buffer) == 0:
+            return []
+
+        chunk = self._emit(self._buffer)
+        self._buffer = None
+        return [chunk] if chunk is not None else []
+
+    def _find_cut(self, window: 'AudioSegment') -> int:
+        """Находит позицию разреза внутри окна длиной max_chunk_ms"""
+        from pydub.silence import detect_silence
+
+        if window.dBFS == float('-inf'):
+            # Окно целиком из тишины - режем где угодно
+            return len(window)
+
+        tail = window[self.min_chunk_ms:]
+        silences = detect_silence(
+            tail,
+            min_silence_len=self.min_silence_ms,
+            silence_thresh=window.dBFS - self.silence_offset_db,
+            seek_step=10
+        )
+        if not silences:
+            return len(window)
+
+        start, end = silences[-1]
+        return self.min_chunk_ms + (start + end) // 2
+
+    def _emit(self, audio: 'AudioSegment'):
+        """Оформляет фрагмент; фрагменты из одной тишины пропускаются"""
+        start_ms = self._buffer_start_ms
+        self._buffer_start_ms += len(audio)
+
+        if audio.dBFS < self.min_chunk_dbfs:
+            logger.debug(f"Пропускаю тихий фрагмент: {start_ms} мс, {len(audio)} мс")
+            return None
+
+        chunk = AudioChunk(self._next_index, start_ms, audio)
+        self._next_index += 1
+        return chunk
+
+
+def split_audio(audio: 'AudioSegment', **params) -> List[AudioChunk]:
+    """
+    Разбивает аудио целиком на фрагменты по паузам
+
+    Args:
+        audio: Декодированное аудио
+        **params: Параметры AudioSegmenter
+
+    Returns:
+        List[AudioChunk]: Фрагменты по порядку
+    """
+    segmenter = AudioSegmenter(**params)
+    return segmenter.feed(audio) + segmenter.flush()
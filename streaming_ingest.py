@@ -0,0 +1,296 @@
+"""
+Распознавание речи во время скачивания файла
+"""
+
+import asyncio
+import logging
+
+from downloads import RangedDownloader
+from metrics import stage_timer
+from ffmpeg_tools import FFMPEG_BINARY, PCM_SAMPLE_RATE, PCM_SAMPLE_WIDTH, PCM_CHANNELS
+from media_processor import NO_SPEECH_TEXT
+from segmentation import AudioSegmenter
+
+logger = logging.getLogger(__name__)
+
+# Сколько байт начала файла смотрим, чтобы понять, можно ли декодировать поток
+PREFIX_LIMIT = 256 * 1024
+# Читаем PCM от ffmpeg блоками по одной секунде
+PCM_BLOCK_SIZE = PCM_SAMPLE_RATE * PCM_SAMPLE_WIDTH * PCM_CHANNELS
+
+
+def is_streamable(prefix: bytes):
+    """
+    Определяет по началу файла, можно ли декодировать его из потока
+
+    MP4/MOV/M4A декодируются из pipe, только если атом moov идет до mdat
+    (faststart). Остальные форматы (OGG, MP3, MKV, WebM, WAV) потоковые.
+
+    Args:
+        prefix: Начало файла
+
+    Returns:
+        bool | None: None, если данных пока недостаточно для решения
+    """
+    if len(prefix) < 8:
+        return None
+    if prefix[4:8] != b'ftyp':
+        return True
+
+    offset = 0
+    while offset + 8 <= len(prefix):
+        size = int.from_bytes(prefix[offset:offset + 4], 'big')
+        kind = prefix[offset + 4:offset + 8]
+        if kind == b'moov':
+            return True
+        if kind == b'mdat':
+            return False
+        if size == 1:
+            # 64-битный размер атома
+            if offset + 16 > len(prefix):
+                return None
+            size = int.from_bytes(prefix[offset + 8:offset + 16], 'big')
+        if size < 8:
+            return False
+        offset += size
+    return None
+
+
+class StreamingTranscriber:
+    """
+    Скачивает файл и одновременно распознает речь.
+
+    Скачанные байты сохраняются в буфер (IngestBuffer) и параллельно подаются в ffmpeg,
+    который декодирует их в PCM. Готовые фрагменты (AudioSegmenter) сразу
+    отправляются на распознавание в пул воркеров. Если формат не подходит
+    для потокового декодирования или ffmpeg не справился, файл
+    обрабатывается обычным способом после скачивания (fallback).
+    """
+
+    def __init__(self, worker_pool, fanout: int = 4, max_chunk_seconds: int = 30, cpu_bound: bool = False,
+                 downloader: RangedDownloader = None):
+        self.worker_pool = worker_pool
+        self.downloader = downloader or RangedDownloader()
+        self.fanout = fanout
+        self.max_chunk_seconds = max_chunk_seconds
+        # Локальный движок распознавания выполняется в пуле процессов
+        self.run_recognition = worker_pool.run_cpu if cpu_bound else worker_pool.run_io
+
+    async def transcribe(self, url: str, out, language: str, fallback, media: str = 'audio',
+                         progress=None, total_bytes: int = None, transcript=None) -> dict:
+        """
+        Скачивает файл по url в out и распознает речь по мере загрузки
+
+        Args:
+            url: Ссылка на файл
+            out: Файл для записи (IngestBuffer); закрывается после скачивания
+            language: Язык для распознавания
+            fallback: Корутинная функция без аргументов для обработки уже
+                      скачанного файла, если потоковое декодирование невозможно
+            media: Тип медиа для метрик ('video' или 'audio')
+            progress: ProgressReporter задачи (скачанные байты и распознанные фрагменты)
+            total_bytes: Размер файла, если известен заранее
+            transcript: TranscriptWriter, которому передаются фрагменты текста по мере распознавания
+
+        Returns:
+            dict: Результат обработки в формате MediaProcessor
+        """
+        job = _StreamingJob(self, language, progress, transcript)
+        try:
+            try:
+                with stage_timer('download', media):
+                    await job.download(url, out, total_bytes)
+            finally:
+                out.close()
+            result = await job.finish()
+        finally:
+            await job.close()
+
+        if result is None:
+            logger.info(f"Потоковое распознавание недоступно, обрабатываю файл целиком: {out.path}")
+            return await fallback()
+        return result
+
+
+class _StreamingJob:
+    """Состояние одной потоковой задачи"""
+
+    def __init__(self, transcriber: StreamingTranscriber, language: str, progress=None, transcript=None):
+        self.transcriber = transcriber
+        self.language = language
+        self.progress = progress
+        self.transcript = transcript
+        self.chunks = []
+        self.recognized = 0
+        self.segmenter = AudioSegmenter(max_chunk_ms=transcriber.max_chunk_seconds * 1000)
+        self.semaphore = asyncio.Semaphore(transcriber.fanout)
+        self.process = None
+        self.reader = None
+        self.stderr_reader = None
+        self.recognition_tasks = []
+        self.pcm_bytes = 0
+        self.stream_failed = False
+
+    async def download(self, url: str, out, total_bytes: int = None):
+        """Скачивает файл, передавая байты в ffmpeg, пока это возможно"""
+        prefix = b''
+        streamable = None
+        downloaded = 0
+
+        async def on_data(data: bytes):
+            nonlocal prefix, streamable, downloaded
+            out.write(data)
+            downloaded += len(data)
+            if self.progress is not None:
+                self.progress.update('download', downloaded, total_bytes)
+
+            if streamable is None:
+                prefix += data
+                streamable = is_streamable(prefix)
+                if streamable is None and len(prefix) >= PREFIX_LIMIT:
+                    streamable = False
+                if streamable:
+                    await self._start_decoder()
+                    await self._write(prefix)
+                if streamable is not None:
+                    prefix = b''
+            elif streamable:
+                await self._write(data)
+
+        # Данные приходят по порядку, даже если файл скачивается несколькими запросами
+        await self.transcriber.downloader.fetch(url, on_data, total_bytes)
+
+    async def _start_decoder(self):
+        """Запускает ffmpeg, читающий файл из stdin"""
+        self.process = await asyncio.create_subprocess_exec(
+            FFMPEG_BINARY, '-hide_banner', '-loglevel', 'error',
+            '-i', 'pipe:0',
+            '-map', '0:a:0', '-vn', '-sn', '-dn',
+            '-ac', str(PCM_CHANNELS),
+            '-ar', str(PCM_SAMPLE_RATE),
+            '-acodec', 'pcm_s16le',
+            '-f', 's16le',
+            'pipe:1',
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        self.reader = asyncio.create_task(self._read_pcm())
+        self.stderr_reader = asyncio.create_task(self.process.stderr.read())
+        logger.info("▶️ Начато потоковое декодирование аудио")
+
+    async def _write(self, data: bytes):
+        """Передает байты в ffmpeg; если ffmpeg уже завершился, прекращает поток"""
+        if self.stream_failed:
+            return
+        try:
+            self.process.stdin.write(data)
+            await self.process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            logger.warning("⚠️ ffmpeg прервал потоковое декодирование")
+            self.stream_failed = True
+
+    async def _read_pcm(self):
+        """Читает PCM из ffmpeg и отправляет готовые фрагменты на распознавание"""
+        from pydub import AudioSegment
+
+        while True:
+            try:
+                pcm = await self.process.stdout.readexactly(PCM_BLOCK_SIZE)
+            except asyncio.IncompleteReadError as e:
+                pcm = e.partial
+            if not pcm:
+                break
+
+            self.pcm_bytes += len(pcm)
+            audio = AudioSegment(
+                data=pcm,
+                sample_width=PCM_SAMPLE_WIDTH,
+                frame_rate=PCM_SAMPLE_RATE,
+                channels=PCM_CHANNELS
+            )
+            for chunk in self.segmenter.feed(audio):
+                self._submit(chunk)
+
+            if len(pcm) < PCM_BLOCK_SIZE:
+                break
+
+        for chunk in self.segmenter.flush():
+            self._submit(chunk)
+
+    def _submit(self, chunk):
+        logger.debug(f"Фрагмент {chunk.index} готов: {chunk.start_ms}-{chunk.end_ms} мс")
+        self.chunks.append(chunk)
+        self.recognition_tasks.append(asyncio.create_task(self._recognize(chunk)))
+
+    async def _recognize(self, chunk) -> str:
+        async with self.semaphore:
+            text = await self.transcriber.run_recognition('recognize_segment', chunk, self.language)
+        self.recognized += 1
+        if self.progress is not None:
+            # Общее число фрагментов известно, когда ffmpeg декодировал файл целиком
+            total = len(self.recognition_tasks) if self.reader is not None and self.reader.done() else None
+            self.progress.update('recognize', self.recognized, total)
+        if self.transcript is not None:
+            self.transcript.add(chunk.index, chunk.start_ms, chunk.end_ms, text)
+        return text
+
+    async def finish(self):
+        """
+        Дожидается декодирования и распознавания всех фрагментов
+
+        Returns:
+            dict | None: Результат или None, если нужен fallback
+        """
+        if self.process is None:
+            return None
+
+        if not self.stream_failed:
+            try:
+                self.process.stdin.close()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+        await self.reader
+        if self.progress is not None:
+            self.progress.update('recognize', self.recognized, len(self.recognition_tasks))
+        stderr = await self.stderr_reader
+        returncode = await self.process.wait()
+
+        if self.stream_failed or returncode != 0:
+            logger.warning(
+                f"⚠️ Потоковое декодирование не удалось: "
+                f"{stderr.decode('utf-8', errors='replace').strip()[-500:]}"
+            )
+            return None
+
+        try:
+            texts = await asyncio.gather(*self.recognition_tasks)
+        except Exception as e:
+            logger.error(f"Ошибка сервиса распознавания речи: {str(e)}")
+            return {
+                'success': True,
+                'text': f"❌ Ошибка сервиса распознавания речи: {str(e)}",
+                'audio_size': self.pcm_bytes,
+                'streamed': True
+            }
+
+        text = ' '.join(t for t in texts if t)
+        logger.info(f"Текст распознан потоково: {len(self.recognition_tasks)} фрагментов, {len(text)} символов")
+        return {
+            'success': True,
+            'text': text or NO_SPEECH_TEXT,
+            'audio_size': self.pcm_bytes,
+            'segments': [[chunk.start_ms, chunk.end_ms, t] for chunk, t in zip(self.chunks, texts) if t],
+            'streamed': True
+        }
+
+    async def close(self):
+        """Освобождает ресурсы задачи"""
+        for task in self.recognition_tasks:
+            task.cancel()
+        for task in (self.reader, self.stderr_reader):
+            if task is not None and not task.done():
+                task.cancel()
+        if self.process is not None and self.process.returncode is None:
+            self.process.kill()
+            await self.process.wait()
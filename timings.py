@@ -0,0 +1,163 @@
+"""
+Замеры этапов обработки одной задачи: время, CPU и объем данных
+"""
+
+import io
+import os
+import json
+import time
+import random
+import logging
+import pstats
+import cProfile
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # Windows: CPU время ffmpeg не учитывается
+    resource = None
+
+import metrics
+from ffmpeg_tools import spawned_count
+
+logger = logging.getLogger(__name__)
+
+
+def _children_cpu() -> float:
+    """CPU время завершившихся дочерних процессов (ffmpeg) в секундах"""
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class Span:
+    """Один этап задачи"""
+
+    def __init__(self, name: str, bytes_in: int = None):
+        self.name = name
+        self.bytes_in = bytes_in
+        self.bytes_out = None
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.child_cpu = 0.0
+        self.subprocesses = 0
+
+    def as_dict(self) -> dict:
+        return {
+            'wall': round(self.wall, 4),
+            'cpu': round(self.cpu, 4),
+            'child_cpu': round(self.child_cpu, 4),
+            'subprocesses': self.subprocesses,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out
+        }
+
+
+class JobTimer:
+    """
+    Собирает замеры этапов одной задачи MediaProcessor.
+
+    Для каждого этапа записывается время (wall), CPU время потока (cpu),
+    CPU время дочерних процессов (child_cpu, например ffmpeg), число
+    запусков ffmpeg/ffprobe (subprocesses) и объем данных на входе и выходе. child_cpu считается по всему процессу,
+    поэтому при параллельных задачах в потоках он приблизительный.
+    Время этапа также попадает в метрику convert_bot_stage_seconds.
+
+    Если задача попала в выборку профилирования, вся задача выполняется
+    под cProfile (или pyinstrument), а отчет сохраняется в profile_dir.
+    """
+
+    def __init__(self, job: str, media: str, profile_sample_rate: float = 0.0,
+                 profile_dir: str = None, profiler: str = 'cprofile'):
+        self.job = job
+        self.media = media
+        self.spans = []
+        self.started = time.perf_counter()
+        # Запуски ffmpeg считаются по потоку, а задача выполняется в одном потоке пула
+        self.spawned_start = spawned_count()
+        self.profile_dir = profile_dir
+        self.profiler_name = profiler
+        self._profiler = None
+
+        if profile_sample_rate and profile_dir and random.random() < profile_sample_rate:
+            self._start_profiler()
+
+    @contextmanager
+    def span(self, name: str, bytes_in: int = None):
+        """
+        Замеряет этап задачи
+
+        Пример:
+            with timer.span('decode', bytes_in=size) as span:
+                pcm = MediaGraph(path).add_pcm().run()['pcm']
+                span.bytes_out = len(pcm)
+        """
+        span = Span(name, bytes_in)
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        child_start = _children_cpu()
+        spawned_start = spawned_count()
+        try:
+            yield span
+        finally:
+            span.wall = time.perf_counter() - wall_start
+            span.cpu = time.thread_time() - cpu_start
+            span.child_cpu = _children_cpu() - child_start
+            span.subprocesses = spawned_count() - spawned_start
+            self.spans.append(span)
+            metrics.observe_stage(name, self.media, span.wall)
+
+    def as_dict(self) -> dict:
+        """Замеры для результата задачи: {этап: {wall, cpu, child_cpu, subprocesses, bytes_in, bytes_out}}"""
+        timings = {span.name: span.as_dict() for span in self.spans}
+        timings['total'] = {
+            'wall': round(time.perf_counter() - self.started, 4),
+            'subprocesses': spawned_count() - self.spawned_start
+        }
+        return timings
+
+    def finish(self) -> dict:
+        """Завершает задачу: пишет структурированный лог и сохраняет профиль"""
+        timings = self.as_dict()
+        self._stop_profiler()
+        logger.info(
+            f"⏱ Этапы задачи {self.job} ({self.media}): {json.dumps(timings, ensure_ascii=False)}",
+            extra={'job': self.job, 'media': self.media, 'timings': timings}
+        )
+        return timings
+
+    def _start_profiler(self):
+        if self.profiler_name == 'pyinstrument':
+            try:
+                from pyinstrument import Profiler
+            except ImportError:
+                logger.warning("⚠️ pyinstrument не установлен, использую cProfile")
+            else:
+                self._profiler = Profiler()
+                self._profiler.start()
+                return
+        self._profiler = cProfile.Profile()
+        self._profiler.enable()
+
+    def _stop_profiler(self):
+        if self._profiler is None:
+            return
+        profiler, self._profiler = self._profiler, None
+        os.makedirs(self.profile_dir, exist_ok=True)
+        base = os.path.join(self.profile_dir, f"{self.job}_{int(time.time() * 1000)}_{os.getpid()}")
+
+        if isinstance(profiler, cProfile.Profile):
+            profiler.disable()
+            path = base + '.prof'
+            profiler.dump_stats(path)
+            stream = io.StringIO()
+            pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(15)
+            logger.debug(stream.getvalue())
+        else:
+            profiler.stop()
+            path = base + '.html'
+            with open(path, 'w', encoding='utf-8') as report:
+                report.write(profiler.output_html())
+        logger.info(f"🔬 Профиль задачи {self.job} сохранен: {path}")
@@ -0,0 +1,188 @@
+"""
+Постоянный кэш распознанного текста по file_unique_id Telegram
+"""
+
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class TranscriptCache:
+    """
+    Кэш результатов распознавания в SQLite с вытеснением по LRU.
+
+    Ключ - file_unique_id файла, язык распознавания и движок (engine:
+    бэкенд и модель, см. RecognitionBackend.cache_key), поэтому после смены
+    бэкенда или модели старый текст не выдается. Общий размер
+    сохраненного текста ограничен max_bytes: при превышении удаляются
+    записи, к которым дольше всего не обращались. Одновременные запросы
+    одного и того же файла ждут одну задачу (single-flight).
+
+    Методы get, contains и put блокирующие (запросы SQLite), поэтому из
+    event loop их вызывают через asyncio.to_thread; get_or_compute делает
+    это сам. Вызовы из разных потоков выполняются по очереди.
+    """
+
+    def __init__(self, db_path: str, max_bytes: int, engine: str = ''):
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        self.max_bytes = max_bytes
+        self.engine = engine
+        self._inflight = {}
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(transcripts)")]
+        if columns and 'engine' not in columns:
+            # Кэш без движка в ключе: неизвестно, каким движком распознаны записи
+            logger.info("🗑️ Кэш текста без движка распознавания в ключе, создаю заново")
+            self._conn.execute("DROP TABLE transcripts")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS transcripts (
+                file_unique_id TEXT NOT NULL,
+                language TEXT NOT NULL,
+                engine TEXT NOT NULL,
+                text TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (file_unique_id, language, engine)
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_transcripts_last_access ON transcripts (last_access)"
+        )
+        self._conn.commit()
+
+    def get(self, file_unique_id: str, language: str):
+        """
+        Возвращает сохраненный текст или None
+
+        Args:
+            file_unique_id: Уникальный идентификатор файла Telegram
+            language: Язык распознавания
+
+        Returns:
+            str | None: Распознанный текст
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT text FROM transcripts WHERE file_unique_id = ? AND language = ? AND engine = ?",
+                (file_unique_id, language, self.engine)
+            ).fetchone()
+            if row is None:
+                return None
+
+            self._conn.execute(
+                "UPDATE transcripts SET last_access = ? WHERE file_unique_id = ? AND language = ? AND engine = ?",
+                (time.time(), file_unique_id, language, self.engine)
+            )
+            self._conn.commit()
+            return row[0]
+
+    def contains(self, file_unique_id: str, language: str) -> bool:
+        """Проверяет, есть ли текст в кэше (не обновляет время обращения)"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM transcripts WHERE file_unique_id = ? AND language = ? AND engine = ?",
+                (file_unique_id, language, self.engine)
+            ).fetchone()
+            return row is not None
+
+    def put(self, file_unique_id: str, language: str, text: str):
+        """Сохраняет текст и вытесняет старые записи при превышении лимита"""
+        size = len(text.encode('utf-8'))
+        if size > self.max_bytes:
+            logger.debug(f"Текст слишком большой для кэша: {size} байт")
+            return
+
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO transcripts "
+                "(file_unique_id, language, engine, text, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (file_unique_id, language, self.engine, text, size, now, now)
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Удаляет давно не использованные записи, пока кэш больше лимита"""
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM transcripts").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        evicted = 0
+        rows = self._conn.execute(
+            "SELECT file_unique_id, language, engine, size FROM transcripts ORDER BY last_access"
+        ).fetchall()
+        for file_unique_id, language, engine, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._conn.execute(
+                "DELETE FROM transcripts WHERE file_unique_id = ? AND language = ? AND engine = ?",
+                (file_unique_id, language, engine)
+            )
+            total -= size
+            evicted += 1
+
+        logger.info(f"🗑️ Из кэша вытеснено записей: {evicted}")
+
+    async def get_or_compute(self, file_unique_id: str, language: str, compute) -> dict:
+        """
+        Возвращает результат из кэша или вычисляет его один раз
+
+        Args:
+            file_unique_id: Уникальный идентификатор файла Telegram
+            language: Язык распознавания
+            compute: Корутинная функция без аргументов, возвращающая результат
+                     MediaProcessor (dict с ключами success и text)
+
+        Returns:
+            dict: Результат обработки; для кэшированного результата cached=True
+        """
+        text = await asyncio.to_thread(self.get, file_unique_id, language)
+        if text is not None:
+            logger.info(f"✅ Текст найден в кэше: {file_unique_id}")
+            return {'success': True, 'text': text, 'cached': True}
+
+        key = (file_unique_id, language)
+        future = self._inflight.get(key)
+        if future is not None:
+            # Этот файл уже обрабатывается - ждем ту же задачу
+            logger.info(f"⏳ Ожидаю уже запущенную обработку: {file_unique_id}")
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await compute()
+            if result.get('success') and not result['text'].startswith('❌'):
+                await asyncio.to_thread(self.put, file_unique_id, language, result['text'])
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Исключение уже передано ожидающим, не логируем его повторно
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    def close(self):
+        """Закрывает соединение с базой"""
+        with self._lock:
+            self._conn.close()
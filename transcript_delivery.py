@@ -0,0 +1,301 @@
+"""
+Доставка распознанного текста пользователю
+
+Текст приходит фрагментами по мере распознавания и сразу появляется в
+чате: TranscriptWriter дописывает его в сообщение, а когда сообщение
+доходит до лимита Telegram (4096 символов), продолжает в следующем.
+Длинный текст (больше TRANSCRIPT_DOCUMENT_THRESHOLD символов) в конце
+отправляется файлами .txt и .srt (с таймкодами фрагментов).
+"""
+
+import io
+import asyncio
+import logging
+
+from config import PROGRESS_INTERVAL, TRANSCRIPT_DOCUMENT_THRESHOLD
+from progress import SEGMENTS_TEXT_FILE, read_segment_texts
+
+logger = logging.getLogger(__name__)
+
+# Лимиты Telegram на текст сообщения и подпись к медиа
+MESSAGE_LIMIT = 4096
+CAPTION_LIMIT = 1024
+
+TRANSCRIPT_HEADING = "📝 Текст извлечен:\n\n"
+# Метка последнего сообщения, пока распознавание продолжается
+STREAMING_MARK = "\n\n⏳ Распознаю дальше..."
+# Метка последнего сообщения, если распознавание завершилось ошибкой
+INTERRUPTED_MARK = "\n\n⚠️ Распознавание прервано, текст неполный"
+
+
+def split_text(text: str, limit: int = MESSAGE_LIMIT) -> list:
+    """
+    Делит текст на части не длиннее limit символов
+
+    Разрез ищется по абзацу, строке, концу предложения или пробелу во
+    второй половине части; слово длиннее части режется как есть.
+    """
+    parts = []
+    while len(text) > limit:
+        window = text[:limit]
+        cut = -1
+        for separator in ('\n\n', '\n', '. ', ' '):
+            position = window.rfind(separator, limit // 2)
+            if position != -1:
+                cut = position + len(separator)
+                break
+        if cut == -1:
+            cut = limit
+        parts.append(text[:cut].rstrip())
+        text = text[cut:].lstrip()
+    if text or not parts:
+        parts.append(text)
+    return parts
+
+
+def format_timestamp(ms: int) -> str:
+    """Время в формате SRT: 00:01:02,345"""
+    seconds, ms = divmod(int(ms), 1000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d},{ms:03d}"
+
+
+def format_srt(segments: list) -> str:
+    """Субтитры SRT из фрагментов [начало мс, конец мс, текст]"""
+    blocks = []
+    for number, (start_ms, end_ms, text) in enumerate(segments, 1):
+        blocks.append(f"{number}\n{format_timestamp(start_ms)} --> {format_timestamp(end_ms)}\n{text}\n")
+    return '\n'.join(blocks)
+
+
+async def send_transcript_files(bot, chat_id, text: str, segments: list = None,
+                                reply_to_message_id: int = None, name: str = 'transcript'):
+    """Отправляет текст файлом .txt и, если есть таймкоды, субтитрами .srt"""
+    from telegram import InputFile
+
+    await bot.send_document(
+        chat_id,
+        InputFile(io.BytesIO(text.encode('utf-8')), filename=f"{name}.txt"),
+        caption=f"📄 Полный текст: {len(text)} символов",
+        reply_to_message_id=reply_to_message_id
+    )
+    if segments:
+        await bot.send_document(
+            chat_id,
+            InputFile(io.BytesIO(format_srt(segments).encode('utf-8')), filename=f"{name}.srt"),
+            caption="🎬 Субтитры с таймкодами",
+            reply_to_message_id=reply_to_message_id
+        )
+
+
+class TranscriptWriter:
+    """
+    Отправляет текст в ответ на сообщение пользователя по мере распознавания.
+
+    Фрагменты (add или segments.jsonl рабочей директории, см. watch)
+    выстраиваются по порядку. Фоновая задача не чаще раза в interval
+    секунд обновляет сообщения с текстом: последнее дописывается, новые
+    отправляются, когда текст не помещается в MESSAGE_LIMIT. Промежуточные
+    правки - низкоприоритетные (их может пропустить FloodControlLimiter),
+    итоговые правки и новые сообщения - обычные. Если текст длиннее
+    document_threshold, новые сообщения больше не отправляются, а в
+    finish() весь текст уходит файлами. Если распознавание не удалось,
+    abort() (или выход из async with с исключением) помечает уже
+    отправленный текст как неполный.
+
+    Пример:
+        async with TranscriptWriter(update.message) as transcript:
+            result = await pipeline.transcribe(..., transcript=transcript)
+            await transcript.finish(result['text'], result.get('segments'))
+    """
+
+    def __init__(self, message, interval: float = PROGRESS_INTERVAL,
+                 document_threshold: int = TRANSCRIPT_DOCUMENT_THRESHOLD):
+        self.message = message
+        self.interval = interval
+        self.document_threshold = document_threshold
+        self.segments = []
+        self.text = ''
+        self.sent = []
+        self._pending = {}
+        self._next_index = 0
+        self._segments_path = None
+        self._offset = 0
+        self.finished = False
+        self._lock = asyncio.Lock()
+        self._task = None
+
+    @property
+    def started(self) -> bool:
+        """Пользователю уже отправлена часть текста"""
+        return bool(self.sent)
+
+    def add(self, index: int, start_ms: int, end_ms: int, text: str):
+        """Принимает распознанный фрагмент (фрагменты могут приходить не по порядку)"""
+        self._pending[index] = (start_ms, end_ms, text)
+        while self._next_index in self._pending:
+            start_ms, end_ms, text = self._pending.pop(self._next_index)
+            self._next_index += 1
+            if text:
+                self.segments.append([start_ms, end_ms, text])
+                self.text = f"{self.text} {text}" if self.text else text
+
+    def watch(self, workspace):
+        """
+        Начинает читать фрагменты, которые воркеры пула пишут в рабочую директорию
+
+        Фрагменты, принятые до этого (например, неудавшимся потоковым
+        распознаванием), отбрасываются: файл будет распознан заново.
+        """
+        self._segments_path = workspace.file(SEGMENTS_TEXT_FILE)
+        self._offset = 0
+        self._pending = {}
+        self._next_index = 0
+        self.segments = []
+        self.text = ''
+
+    def _poll(self):
+        if self._segments_path is None:
+            return
+        segments, self._offset = read_segment_texts(self._segments_path, self._offset)
+        for segment in segments:
+            self.add(segment['index'], segment['start_ms'], segment['end_ms'], segment['text'])
+
+    def _pages(self, text: str, final: bool) -> list:
+        if final:
+            return split_text(TRANSCRIPT_HEADING + text)
+        # Место под метку: "распознаю дальше" или, если распознавание прервется, "текст неполный"
+        pages = split_text(TRANSCRIPT_HEADING + text, MESSAGE_LIMIT - max(len(STREAMING_MARK), len(INTERRUPTED_MARK)))
+        pages[-1] += STREAMING_MARK
+        return pages
+
+    async def flush(self, final: bool = False):
+        """Приводит сообщения с текстом в соответствие с уже распознанным"""
+        async with self._lock:
+            if not final:
+                self._poll()
+                if not self.text:
+                    return
+                if len(self.text) > self.document_threshold:
+                    # Дальше текст уйдет файлом, промежуточные сообщения не нужны
+                    return
+            await self._sync(self._pages(self.text, final), final)
+
+    async def _sync(self, pages: list, final: bool):
+        from telegram.error import BadRequest
+        from rate_limiter import LOW_PRIORITY, RequestDropped
+
+        bot = self.message.get_bot()
+        low_priority = {'rate_limit_args': LOW_PRIORITY} if getattr(bot, 'rate_limiter', None) else {}
+        for number, page in enumerate(pages):
+            if number >= len(self.sent):
+                # Новое сообщение с продолжением текста
+                sent = await self.message.reply_text(page)
+                self.sent.append([sent, page])
+                continue
+            sent, sent_text = self.sent[number]
+            if page == sent_text:
+                continue
+            try:
+                await bot.edit_message_text(
+                    page, chat_id=sent.chat_id, message_id=sent.message_id,
+                    **({} if final else low_priority)
+                )
+                self.sent[number][1] = page
+            except RequestDropped:
+                # Допишем на следующем такте
+                return
+            except BadRequest as e:
+                if 'not modified' in str(e).lower():
+                    self.sent[number][1] = page
+                else:
+                    raise
+
+        if final:
+            # После повторного распознавания текст мог стать короче
+            for sent, _ in self.sent[len(pages):]:
+                await sent.delete()
+            del self.sent[len(pages):]
+
+    async def finish(self, text: str, segments: list = None, name: str = 'transcript'):
+        """
+        Доставляет итоговый текст
+
+        Уже отправленные сообщения дописываются до итогового текста, остаток
+        отправляется новыми сообщениями, а текст длиннее document_threshold -
+        файлами .txt и .srt.
+
+        Args:
+            text: Итоговый текст (из результата обработки или кэша)
+            segments: Фрагменты [начало мс, конец мс, текст] для .srt, если известны
+            name: Имя файлов без расширения
+        """
+        await self._stop()
+        self.finished = True
+        async with self._lock:
+            if segments:
+                self.segments = segments
+            if len(text) <= self.document_threshold:
+                self.text = text
+                await self._sync(self._pages(text, final=True), final=True)
+                return
+
+            # Убираем метку "распознаю дальше" из уже отправленных сообщений
+            if self.sent:
+                streamed = self.text if text.startswith(self.text) else ''
+                await self._sync(self._pages(streamed, final=True)[:len(self.sent)], final=True)
+            await send_transcript_files(
+                self.message.get_bot(), self.message.chat_id, text, self.segments, self.message.message_id, name
+            )
+            self.text = text
+
+    async def abort(self):
+        """
+        Отмечает, что распознавание прервано ошибкой
+
+        Фоновая отправка останавливается, а в последнем отправленном
+        сообщении метка "распознаю дальше" заменяется на пометку, что
+        текст неполный. Если текст еще не отправлялся, ничего не делает.
+        """
+        await self._stop()
+        if self.finished:
+            return
+        self.finished = True
+        async with self._lock:
+            if not self.sent:
+                return
+            sent, sent_text = self.sent[-1]
+            page = sent_text.removesuffix(STREAMING_MARK) + INTERRUPTED_MARK
+            try:
+                await self.message.get_bot().edit_message_text(
+                    page, chat_id=sent.chat_id, message_id=sent.message_id
+                )
+                self.sent[-1][1] = page
+            except Exception as e:
+                logger.warning(f"⚠️ Не удалось отметить текст как неполный: {e}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.warning(f"⚠️ Не удалось отправить часть текста: {e}")
+
+    async def _stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def __aenter__(self):
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is not None and not issubclass(exc_type, asyncio.CancelledError):
+            await self.abort()
+        else:
+            await self._stop()
+        return False
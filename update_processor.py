@@ -0,0 +1,75 @@
+"""
+Параллельная обработка обновлений с сохранением порядка внутри чата
+"""
+
+import collections
+import logging
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """
+    Обрабатывает до max_concurrent_updates обновлений одновременно.
+
+    Обновления разных чатов выполняются параллельно, а обновления одного
+    чата - строго по очереди, в порядке поступления: обработчики второго
+    сообщения не начнутся, пока не закончены обработчики первого.
+    Обновления без чата (например, inline-запросы) ограничены только общим
+    лимитом.
+
+    Обработчики только ставят задачи распознавания в JobScheduler; порядок
+    задач одного чата сохраняет он (см. JobScheduler.submit, параметр key).
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._chat_queues = {}
+
+    async def do_process_update(self, update: object, coroutine):
+        """
+        Выполняет обновление, соблюдая порядок внутри чата
+
+        Вызывается внутри общего слота (семафор BaseUpdateProcessor). Если в
+        чате уже выполняется обновление, новое добавляется в очередь чата,
+        и слот сразу освобождается: очередь по порядку выполняет обновление,
+        которое пришло первым. Поэтому пачка сообщений из одного чата
+        занимает один слот, а не все сразу, и не задерживает остальные чаты.
+        """
+        chat_id = None
+        if isinstance(update, Update) and update.effective_chat is not None:
+            chat_id = update.effective_chat.id
+
+        if chat_id is None:
+            await coroutine
+            return
+
+        queue = self._chat_queues.get(chat_id)
+        if queue is not None:
+            queue.append(coroutine)
+            return
+
+        queue = self._chat_queues[chat_id] = collections.deque([coroutine])
+        try:
+            while queue:
+                try:
+                    await queue[0]
+                except Exception as e:
+                    # Ошибки обработчиков Application передает error handler'ам сам
+                    logger.error(f"Ошибка при обработке обновления чата {chat_id}: {e}")
+                queue.popleft()
+        finally:
+            # Последнее обновление чата убирает его очередь
+            del self._chat_queues[chat_id]
+            for pending in queue:
+                # Обработка остановлена (отмена) - оставшиеся обновления не выполнятся
+                pending.close()
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
@@ -0,0 +1,121 @@
+"""
+Отправка медиа пользователю с диска
+"""
+
+import os
+import logging
+import mimetypes
+from contextlib import contextmanager
+from pathlib import Path
+
+from telegram import Bot, InputFile, Message
+
+from metrics import stage_timer
+
+logger = logging.getLogger(__name__)
+
+# Метод Message для каждого типа медиа
+REPLY_METHODS = {
+    'video': 'reply_video',
+    'audio': 'reply_audio',
+    'document': 'reply_document',
+    'voice': 'reply_voice',
+    'photo': 'reply_photo',
+}
+
+# Метод Bot для каждого типа медиа
+SEND_METHODS = {
+    'video': 'send_video',
+    'audio': 'send_audio',
+    'document': 'send_document',
+    'voice': 'send_voice',
+    'photo': 'send_photo',
+}
+
+
+class DiskInputFile(InputFile):
+    """
+    InputFile, который не читает файл в память
+
+    InputFile из python-telegram-bot 20.7 читает содержимое файла целиком
+    в конструкторе. Здесь в multipart запрос передается открытый файл:
+    httpx (HTTPXRequest) сам читает его кусками по 64KB во время отправки,
+    поэтому память на отправку не зависит от размера файла.
+    """
+
+    __slots__ = ('handle',)
+
+    def __init__(self, handle, filename: str):
+        # Конструктор InputFile не вызываем - он прочитал бы файл
+        self.handle = handle
+        self.input_file_content = b''
+        self.attach_name = None
+        self.mimetype = mimetypes.guess_type(filename, strict=False)[0] or 'application/octet-stream'
+        self.filename = filename
+
+    @property
+    def field_tuple(self):
+        return self.filename, self.handle, self.mimetype
+
+
+@contextmanager
+def open_media(kind: str, media, filename: str = None, local_mode: bool = False):
+    """
+    Готовит медиа к отправке
+
+    С локальным Bot API сервером (local_mode) передается Path: python-telegram-bot
+    превращает его в ссылку file://, и сервер читает файл с диска сам, без
+    копирования через бота. Иначе файл открывается только на время отправки
+    и передается кусками (DiskInputFile). file_id и ссылки передаются как есть.
+    """
+    if not (isinstance(media, str) and os.path.isfile(media)):
+        yield media
+        return
+
+    size = os.path.getsize(media)
+    if local_mode:
+        logger.info(f"📤 Отправляю {kind} ссылкой на файл: {media} ({size / (1024*1024):.1f}MB)")
+        yield Path(media)
+        return
+
+    logger.info(f"📤 Отправляю {kind} с диска: {media} ({size / (1024*1024):.1f}MB)")
+    with open(media, 'rb') as handle:
+        yield DiskInputFile(handle, filename=filename or os.path.basename(media))
+
+
+async def reply_media(message: Message, kind: str, media, filename: str = None, **kwargs):
+    """
+    Отправляет медиа в ответ на сообщение
+
+    Args:
+        message: Сообщение, на которое отвечаем
+        kind: Тип медиа (video, audio, document, voice, photo)
+        media: Путь к локальному файлу, file_id или ссылка
+        filename: Имя файла для Telegram (по умолчанию имя локального файла)
+        **kwargs: Остальные параметры метода reply_* (caption, parse_mode и т.д.)
+
+    Returns:
+        Message: Отправленное сообщение
+    """
+    local_mode = message.get_bot().local_mode
+    with open_media(kind, media, filename, local_mode) as payload, stage_timer('upload', kind):
+        return await getattr(message, REPLY_METHODS[kind])(payload, **kwargs)
+
+
+async def send_media(bot: Bot, chat_id: int, kind: str, media, filename: str = None, **kwargs):
+    """
+    Отправляет медиа в чат (когда объекта сообщения нет, например в медиа-воркере)
+
+    Args:
+        bot: Бот, от имени которого отправляем
+        chat_id: Идентификатор чата
+        kind: Тип медиа (video, audio, document, voice, photo)
+        media: Путь к локальному файлу, file_id или ссылка
+        filename: Имя файла для Telegram (по умолчанию имя локального файла)
+        **kwargs: Остальные параметры метода send_* (caption, reply_to_message_id и т.д.)
+
+    Returns:
+        Message: Отправленное сообщение
+    """
+    with open_media(kind, media, filename, bot.local_mode) as payload, stage_timer('upload', kind):
+        return await getattr(bot, SEND_METHODS[kind])(chat_id, payload, **kwargs)
@@ -0,0 +1,192 @@
+"""
+Пул воркеров для тяжелой обработки медиа вне event loop
+"""
+
+import asyncio
+import functools
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Параметры MediaProcessor для текущего процесса (задаются инициализатором пула)
+_processor_kwargs = {}
+_local = threading.local()
+
+
+def _init_worker(processor_kwargs: dict, warm_up: bool = True):
+    """
+    Инициализирует воркер: запоминает параметры MediaProcessor и прогревает модели
+
+    Args:
+        processor_kwargs: Параметры MediaProcessor
+        warm_up: Создать MediaProcessor и загрузить модели сразу. Пул потоков
+                 работает в процессе бота, а локальные (cpu_bound) модели
+                 распознавания там не используются - для него False.
+    """
+    global _processor_kwargs
+    _processor_kwargs = processor_kwargs
+    metrics.enable_sample_buffer()
+    if not warm_up:
+        return
+    try:
+        _get_processor().warm_up()
+    except Exception as e:
+        # Ошибка будет показана при обработке задачи
+        logger.error(f"Не удалось подготовить воркер: {e}")
+
+
+def _get_processor():
+    """Возвращает MediaProcessor текущего потока (создается один раз)"""
+    processor = getattr(_local, 'processor', None)
+    if processor is None:
+        from media_processor import MediaProcessor
+        processor = MediaProcessor(**_processor_kwargs)
+        _local.processor = processor
+    return processor
+
+
+def _ping() -> int:
+    """Пустая задача для прогрева: воркер запускается и выполняет _init_worker"""
+    return os.getpid()
+
+
+def _call_processor(method_name: str, args: tuple, kwargs: dict):
+    """Вызывает метод MediaProcessor внутри воркера и возвращает результат с замерами метрик"""
+    processor = _get_processor()
+    try:
+        result = getattr(processor, method_name)(*args, **kwargs)
+    except Exception as e:
+        # Замеры прикрепляются к исключению, чтобы не потерять их
+        e.metric_samples = metrics.drain_samples()
+        raise
+    return result, metrics.drain_samples()
+
+
+class WorkerPool:
+    """
+    Ограниченный пул для вызова методов MediaProcessor из async обработчиков.
+
+    Кодирование/декодирование видео выполняется в пуле процессов, работа,
+    упирающаяся в сеть (распознавание речи), - в пуле потоков. Общее число
+    одновременно выполняемых задач ограничено max_concurrent_jobs.
+    Если процесс пула погибает (OOM, SIGKILL), пул процессов пересоздается:
+    ошибкой завершаются только задачи, выполнявшиеся в сломанном пуле.
+    Каждый воркер создает MediaProcessor один раз и держит модели
+    распознавания загруженными все время работы. Модели прогреваются только
+    в пуле процессов: потоки работают в процессе бота, и загруженная там
+    модель Vosk заняла бы память впустую.
+    """
+
+    def __init__(self, cpu_workers: int, io_workers: int, max_concurrent_jobs: int,
+                 processor_kwargs: dict = None):
+        self.processor_kwargs = processor_kwargs or {}
+        self.cpu_workers = cpu_workers
+        self.max_concurrent_jobs = max_concurrent_jobs
+        self._semaphore = asyncio.Semaphore(max_concurrent_jobs)
+        self._active = 0
+        self._waiting = 0
+
+        self._cpu_lock = threading.Lock()
+        self._cpu_executor = self._create_cpu_executor()
+        self._io_executor = ThreadPoolExecutor(
+            max_workers=io_workers,
+            thread_name_prefix='media-io',
+            initializer=_init_worker,
+            initargs=(self.processor_kwargs, False)
+        )
+
+    def _create_cpu_executor(self) -> ProcessPoolExecutor:
+        # spawn: дочерние процессы не наследуют event loop и сокеты бота
+        return ProcessPoolExecutor(
+            max_workers=self.cpu_workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(self.processor_kwargs,)
+        )
+
+    def _restart_cpu_executor(self, broken: ProcessPoolExecutor):
+        """Заменяет сломанный пул процессов новым (один раз на поломку)"""
+        with self._cpu_lock:
+            if self._cpu_executor is not broken:
+                # Пул уже пересоздан задачей, упавшей раньше
+                return
+            logger.error("💥 Процесс пула воркеров завершился аварийно, пересоздаю пул процессов")
+            self._cpu_executor = self._create_cpu_executor()
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    async def warm_up(self):
+        """
+        Запускает процессы пула заранее
+
+        Без прогрева процессы создаются при первой задаче, и она ждет
+        запуска интерпретатора, импорта медиа-библиотек и загрузки моделей.
+        """
+        loop = asyncio.get_running_loop()
+        pings = [loop.run_in_executor(self._cpu_executor, _ping) for _ in range(self.cpu_workers)]
+        await asyncio.gather(*pings)
+
+    async def run_cpu(self, method_name: str, *args, **kwargs):
+        """Выполняет метод MediaProcessor в пуле процессов"""
+        return await self._run(None, method_name, args, kwargs)
+
+    async def run_io(self, method_name: str, *args, **kwargs):
+        """Выполняет метод MediaProcessor в пуле потоков"""
+        return await self._run(self._io_executor, method_name, args, kwargs)
+
+    async def _run(self, executor, method_name: str, args: tuple, kwargs: dict):
+        """Выполняет метод в executor (None - в текущем пуле процессов)"""
+        self._waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+
+        self._active += 1
+        logger.debug(f"Запуск {method_name}: {self.stats()}")
+        # Пул процессов берется в момент запуска: он мог быть пересоздан
+        executor = executor or self._cpu_executor
+        try:
+            loop = asyncio.get_running_loop()
+            try:
+                result, samples = await loop.run_in_executor(
+                    executor,
+                    functools.partial(_call_processor, method_name, args, kwargs)
+                )
+            except BrokenProcessPool:
+                self._restart_cpu_executor(executor)
+                raise
+            except Exception as e:
+                metrics.replay_samples(getattr(e, 'metric_samples', []))
+                raise
+            metrics.replay_samples(samples)
+            return result
+        finally:
+            self._active -= 1
+            self._semaphore.release()
+
+    def stats(self) -> dict:
+        """
+        Возвращает состояние загрузки пула
+
+        Returns:
+            dict: active - выполняется задач, waiting - ожидают слота,
+                  saturation - доля занятых слотов (0.0 - 1.0)
+        """
+        return {
+            'active': self._active,
+            'waiting': self._waiting,
+            'max_concurrent_jobs': self.max_concurrent_jobs,
+            'saturation': self._active / self.max_concurrent_jobs if self.max_concurrent_jobs else 1.0
+        }
+
+    def shutdown(self, wait: bool = True):
+        """Останавливает пулы"""
+        self._cpu_executor.shutdown(wait=wait, cancel_futures=True)
+        self._io_executor.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,109 @@
+"""
+Изолированная рабочая директория для одной задачи обработки
+"""
+
+import os
+import re
+import shutil
+import logging
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+# Имя рабочей директории по умолчанию: job_<pid процесса>_<случайная часть>
+_OWNER_PATTERN = re.compile(r'^job_(\d+)_')
+
+
+def owner_pid(name: str):
+    """PID процесса, создавшего рабочую директорию (или файл с ее именем в начале), либо None"""
+    match = _OWNER_PATTERN.match(name)
+    return int(match.group(1)) if match else None
+
+
+class WorkspaceBudgetExceeded(Exception):
+    """Задача превысила выделенный ей лимит диска"""
+
+
+class JobWorkspace:
+    """
+    Уникальная временная директория задачи с лимитом на занимаемое место.
+
+    Все промежуточные файлы задачи создаются внутри директории, поэтому
+    параллельные задачи не пересекаются, а после cleanup() на диске
+    ничего не остается. Объект можно передавать в дочерние процессы.
+    В имени директории по умолчанию есть PID процесса, поэтому очистка
+    (cleanup.TempJanitor) отличает задачи работающих процессов от
+    оставшихся после падения.
+    """
+
+    def __init__(self, root_dir: str = None, budget_bytes: int = None, prefix: str = None):
+        root_dir = root_dir or tempfile.gettempdir()
+        prefix = prefix or f"job_{os.getpid()}_"
+        os.makedirs(root_dir, exist_ok=True)
+        self.path = tempfile.mkdtemp(prefix=prefix, dir=root_dir)
+        self.budget_bytes = budget_bytes
+
+    def file(self, name: str) -> str:
+        """Возвращает путь к файлу внутри рабочей директории"""
+        return os.path.join(self.path, name)
+
+    def usage(self) -> int:
+        """Возвращает суммарный размер файлов задачи в байтах"""
+        total = 0
+        for root, _dirs, files in os.walk(self.path):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    # Файл мог быть удален между обходом и stat
+                    pass
+        return total
+
+    def check_budget(self) -> int:
+        """
+        Проверяет, что задача укладывается в лимит диска
+
+        Returns:
+            int: Текущий размер файлов задачи в байтах
+
+        Raises:
+            WorkspaceBudgetExceeded: Если лимит превышен
+        """
+        used = self.usage()
+        if self.budget_bytes is not None and used > self.budget_bytes:
+            raise self.budget_error(used)
+        return used
+
+    def remaining(self):
+        """
+        Сколько байт задача еще может записать
+
+        Передается туда, где файл пишется (ffmpeg -fs, буфер скачивания),
+        чтобы запись остановилась на лимите, а не после заполнения диска.
+
+        Returns:
+            int | None: Остаток лимита в байтах (None - лимита нет)
+        """
+        if self.budget_bytes is None:
+            return None
+        return max(0, self.budget_bytes - self.usage())
+
+    def budget_error(self, used: int) -> WorkspaceBudgetExceeded:
+        """Исключение о превышении лимита при размере файлов задачи used байт"""
+        return WorkspaceBudgetExceeded(
+            f"Превышен лимит диска для задачи: {used / (1024*1024):.1f}MB "
+            f"из {self.budget_bytes / (1024*1024):.0f}MB"
+        )
+
+    def cleanup(self):
+        """Удаляет рабочую директорию со всем содержимым"""
+        if os.path.exists(self.path):
+            shutil.rmtree(self.path, ignore_errors=True)
+            logger.info(f"✅ Рабочая директория удалена: {self.path}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.cleanup()
+        return False